@@ -1,17 +1,25 @@
+import json
+from urllib.parse import urlsplit
+
 import streamlit as st
+import auth
 import database as db
 import utils
+import media_server
 from views import admin, employee, client
 
 # Config page
 st.set_page_config(page_title="Cores & Fragrâncias", layout="wide", page_icon="🛍️")
 
-# Init DB
+# Init DB (migrations run once per process; reruns return immediately)
 try:
     db.init_db()
 except Exception as e:
     st.error(f"Erro crítico no banco de dados: {e}")
 
+# Servidor de mídia (imagens com URL fixa e cache no navegador), se configurado; uma vez por processo
+media_server.start_media_server()
+
 # Ensure directories
 try:
     utils.ensure_directories()
@@ -24,9 +32,40 @@ try:
 except Exception:
     pass
 
-# Session State for Auth
+# Token de sessão num cookie do próprio app (SameSite=Strict), nunca na URL:
+# links compartilhados, histórico e logs não levam a sessão junto
+SESSION_COOKIE = "store_session"
+
+def queue_session_cookie(token, max_age):
+    """Agenda a gravação do cookie (max_age=0 apaga); vai para o navegador na próxima execução."""
+    st.session_state['session_cookie'] = (token, max_age)
+
+def write_session_cookie():
+    # O Streamlit só lê cookies (st.context.cookies); gravar exige um script na página
+    pending = st.session_state.pop('session_cookie', None)
+    if pending is None:
+        return
+    token, max_age = pending
+    secure = "; Secure" if urlsplit(st.context.url or "").scheme == "https" else ""
+    cookie = f"{SESSION_COOKIE}={token}; Path=/; Max-Age={max_age}; SameSite=Strict{secure}"
+    st.html(f"<script>document.cookie = {json.dumps(cookie)};</script>", unsafe_allow_javascript=True)
+
+# Session State for Auth: só id/papel/nome (SessionIdentity); o resto vem de db.get_session_user
 if 'user' not in st.session_state:
     st.session_state['user'] = None
+    st.session_state['session_token'] = None
+    # Sessão nova do navegador (refresh): retoma pelo cookie, sem passar pelo bcrypt
+    token = st.context.cookies.get(SESSION_COOKIE)
+    resumed = db.resume_session(token) if token else None
+    if resumed:
+        st.session_state['user'] = db.session_identity(resumed)
+        st.session_state['session_token'] = token
+
+# Links antigos ainda com o token na URL (?s=): tira da barra de endereço
+if "s" in st.query_params:
+    del st.query_params["s"]
+
+write_session_cookie()
 
 def show_logo():
     try:
@@ -52,21 +91,44 @@ def login():
             submitted = st.form_submit_button("Entrar")
             
             if submitted:
-                user = db.check_login(username, password)
+                user, error = db.authenticate(username, password, st.context.ip_address)
                 if user:
-                    st.session_state['user'] = user
+                    st.session_state['user'] = db.session_identity(user)
+                    token = db.create_session(user.id)
+                    if token:
+                        st.session_state['session_token'] = token
+                        queue_session_cookie(token, auth.SESSION_TTL_SECONDS)
                     st.rerun()
                 else:
-                    st.error("Usuário ou senha incorretos.")
+                    st.error(error)
         
         st.info("Admin padrão: admin / admin123")
 
+def logout():
+    token = st.session_state.get('session_token')
+    if token:
+        db.end_session(token)
+        queue_session_cookie("", 0)
+    st.session_state['user'] = None
+    st.session_state['session_token'] = None
+    st.rerun()
+
 def main():
     if not st.session_state['user']:
         login()
     else:
-        user = st.session_state['user']
-        role = user[3]
+        try:
+            user = db.fetch_session_user(st.session_state['user'].id)
+        except Exception as e:
+            # Banco ocupado/indisponível: mantém a sessão, o próximo rerun tenta de novo
+            print(f"Erro ao carregar usuário da sessão: {e}")
+            st.error("Não foi possível carregar seus dados agora. Tente recarregar a página.")
+            return
+        if user is None:
+            # Usuário removido: encerra a sessão e volta para o login
+            logout()
+            return
+        role = user.role
         
         # Sidebar for Logout
         with st.sidebar:
@@ -80,20 +142,16 @@ def main():
                 st.markdown("## Menu")
             
             # Profile Image Display
-            # Check if user tuple has the image column (index 9, since we added 5 cols to original 5)
-            # Original: id, user, pass, role, name (5)
-            # Added: birth, email, phone, cpf (4) -> total 9
-            # Added: profile_image (1) -> total 10. Index 9.
-            # Safety check on length
-            profile_img = None
-            if len(user) > 9 and user[9] is not None:
-                profile_img = user[9]
+            # A sessão guarda só o hash da foto; a miniatura vem do cache
+            avatar = None
+            if user.avatar_hash:
+                avatar = utils.get_image_url(user.avatar_hash) or utils.get_avatar_thumb(user.avatar_hash)
             
-            if profile_img:
-                st.image(profile_img, width=150, caption=user[4])
+            if avatar:
+                st.image(avatar, width=150, caption=user.name)
             else:
                 # Placeholder or just text
-                st.write(f"Usuário: **{user[4]}**")
+                st.write(f"Usuário: **{user.name}**")
             
             st.write(f"Função: **{role.capitalize()}**")
             
@@ -102,9 +160,8 @@ def main():
                 if new_profile_pic:
                     if st.button("Salvar Foto"):
                         img_bytes = new_profile_pic.read()
-                        updated_user = db.update_user_image(user[0], img_bytes)
-                        if updated_user:
-                            st.session_state['user'] = updated_user
+                        # O cache de get_session_user é invalidado pela escrita
+                        if db.update_user_image(user.id, img_bytes):
                             st.success("Foto atualizada!")
                             st.rerun()
                         else:
@@ -112,8 +169,7 @@ def main():
 
             st.divider()
             if st.button("Sair"):
-                st.session_state['user'] = None
-                st.rerun()
+                logout()
         
         if role == 'admin':
             admin.show_admin_view(user)
@@ -0,0 +1,93 @@
+"""
+Índice dos arquivos de imagem legados em assets/.
+
+Versões antigas guardavam fotos como assets/<id>_<nome original>. Em vez de
+listar a pasta a cada rerun e procurar o prefixo card a card, o índice
+(id -> caminho) é montado com um único os.scandir e só é refeito quando o
+mtime da pasta muda (arquivo criado, removido ou renomeado) ou quando
+invalidate() é chamado.
+"""
+import os
+import re
+import threading
+
+ASSETS_DIR = "assets"
+
+_ID_PREFIX = re.compile(r"^(\d+)_")
+
+
+def scan_assets(directory=ASSETS_DIR):
+    """Todos os arquivos <id>_* da pasta, como lista de (id, caminho) em ordem de nome."""
+    found = []
+    try:
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                match = _ID_PREFIX.match(entry.name)
+                if match and entry.is_file():
+                    found.append((int(match.group(1)), entry.path))
+    except FileNotFoundError:
+        return []
+    found.sort(key=lambda item: os.path.basename(item[1]))
+    return found
+
+
+class AssetIndex:
+    """Mapa id -> caminho do arquivo (o primeiro em ordem de nome, se houver vários)."""
+
+    def __init__(self, directory=ASSETS_DIR):
+        self.directory = directory
+        self._lock = threading.Lock()
+        self._built = False
+        self._mtime = None
+        self._paths = {}
+        self.stats = {"rebuilds": 0, "lookups": 0}
+
+    def _dir_mtime(self):
+        try:
+            return os.stat(self.directory).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def refresh(self):
+        mtime = self._dir_mtime()
+        if self._built and mtime == self._mtime:
+            return
+        with self._lock:
+            if self._built and mtime == self._mtime:
+                return
+            paths = {}
+            for product_id, path in scan_assets(self.directory):
+                paths.setdefault(product_id, path)
+            self._paths, self._mtime, self._built = paths, mtime, True
+            self.stats["rebuilds"] += 1
+
+    def invalidate(self):
+        """Força a releitura na próxima consulta (ex.: depois de gravar um arquivo)."""
+        with self._lock:
+            self._built = False
+
+    def get(self, product_id):
+        self.refresh()
+        self.stats["lookups"] += 1
+        return self._paths.get(int(product_id))
+
+    def __len__(self):
+        self.refresh()
+        return len(self._paths)
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def get_asset_index(directory=ASSETS_DIR):
+    """Índice compartilhado pelo processo (um por pasta)."""
+    index = _indexes.get(directory)
+    if index is None:
+        with _indexes_lock:
+            index = _indexes.setdefault(directory, AssetIndex(directory))
+    return index
+
+
+def find_product_asset(product_id, directory=ASSETS_DIR):
+    return get_asset_index(directory).get(product_id)
@@ -0,0 +1,282 @@
+"""
+Hash e verificação de senhas fora da thread do script.
+
+bcrypt é caro de propósito (~0,25 s por verificação no custo 12). Rodando
+direto na thread do Streamlit, uma rajada de logins ocupa todos os núcleos e
+trava os reruns das outras sessões. Aqui:
+
+- hash/verificação rodam num pool limitado (STORE_AUTH_WORKERS threads, com
+  no máximo STORE_AUTH_QUEUE pedidos esperando; além disso AuthBusy);
+- RateLimiter limita senhas erradas por usuário e por IP (janela deslizante);
+- FailedAttemptCache lembra por alguns segundos de combinações
+  usuário/senha/hash que já falharam, então repetir a mesma senha errada não
+  custa outro bcrypt;
+- o custo vem de STORE_BCRYPT_ROUNDS, e hashes com outro custo são refeitos
+  no próximo login bem-sucedido (needs_rehash).
+
+Depois do login, a sessão é retomada por um token assinado (HMAC) com
+validade, sem bcrypt: ver new_session_token/parse_session_token.
+"""
+import hashlib
+import hmac
+import math
+import os
+import re
+import secrets
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import bcrypt
+
+from counters import Counters
+
+BCRYPT_ROUNDS = int(os.environ.get("STORE_BCRYPT_ROUNDS", "12"))
+AUTH_WORKERS = int(os.environ.get("STORE_AUTH_WORKERS", str(max(1, (os.cpu_count() or 2) // 2))))
+AUTH_QUEUE_MAX = int(os.environ.get("STORE_AUTH_QUEUE", "32"))
+AUTH_TIMEOUT = float(os.environ.get("STORE_AUTH_TIMEOUT", "10"))
+
+# Limites de tentativa: falhas por usuário e por IP
+USER_MAX_FAILURES, USER_WINDOW_SECONDS = 5, 300
+IP_MAX_FAILURES, IP_WINDOW_SECONDS = 30, 60
+FAILED_CACHE_TTL_SECONDS = 60
+
+SESSION_TTL_SECONDS = int(float(os.environ.get("STORE_SESSION_TTL_HOURS", "12")) * 3600)
+
+_COST = re.compile(r"^\$2[abxy]?\$(\d{2})\$")
+
+
+class AuthBusy(Exception):
+    """Fila de hashing cheia ou sem resposta no prazo: o login deve ser tentado de novo."""
+
+
+stats = Counters(verifications=0, hashes=0, rehashed=0, cache_hits=0, rate_limited=0, busy=0)
+
+
+def get_auth_stats():
+    return stats.snapshot()
+
+
+# -------------------------------------------------------------------
+# Pool de hashing
+# -------------------------------------------------------------------
+
+_executor = None
+_executor_lock = threading.Lock()
+_slots = None
+
+
+def _get_executor():
+    global _executor, _slots
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=AUTH_WORKERS, thread_name_prefix="bcrypt")
+            _slots = threading.BoundedSemaphore(AUTH_WORKERS + AUTH_QUEUE_MAX)
+        return _executor, _slots
+
+
+def shutdown_pool():
+    global _executor, _slots
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=True)
+        _executor, _slots = None, None
+
+
+def _run_in_pool(fn, *args):
+    """Executa fn no pool e espera o resultado; AuthBusy se a fila estiver cheia ou estourar o prazo."""
+    executor, slots = _get_executor()
+    if not slots.acquire(blocking=False):
+        stats.add(busy=1)
+        raise AuthBusy("Fila de autenticação cheia")
+    try:
+        future = executor.submit(fn, *args)
+    except Exception:
+        slots.release()
+        raise
+    future.add_done_callback(lambda _: slots.release())
+    try:
+        return future.result(timeout=AUTH_TIMEOUT)
+    except TimeoutError:
+        stats.add(busy=1)
+        raise AuthBusy("Autenticação demorou demais")
+
+
+def hash_password(password, rounds=None):
+    """Hash bcrypt (str) com o custo configurado."""
+    stats.add(hashes=1)
+    salt = bcrypt.gensalt(rounds=rounds or BCRYPT_ROUNDS)
+    return _run_in_pool(bcrypt.hashpw, password.encode("utf-8"), salt).decode("utf-8")
+
+
+# Hash de referência para usuários inexistentes: o tempo de resposta não
+# revela se o nome existe
+_dummy_hash = None
+
+
+def _get_dummy_hash():
+    # Gerado no pool, como qualquer hash (AuthBusy se a fila estiver cheia)
+    global _dummy_hash
+    if _dummy_hash is None or cost_of(_dummy_hash) != BCRYPT_ROUNDS:
+        salt = bcrypt.gensalt(rounds=BCRYPT_ROUNDS)
+        _dummy_hash = _run_in_pool(bcrypt.hashpw, secrets.token_bytes(16), salt).decode("utf-8")
+    return _dummy_hash
+
+
+def verify_password(password, hashed):
+    """Confere a senha no pool. hashed=None (usuário inexistente) gasta o mesmo tempo e retorna False."""
+    stats.add(verifications=1)
+    target = hashed or _get_dummy_hash()
+    try:
+        ok = _run_in_pool(bcrypt.checkpw, password.encode("utf-8"), target.encode("utf-8"))
+    except ValueError:
+        # Hash corrompido no banco
+        return False
+    return ok and hashed is not None
+
+
+def cost_of(hashed):
+    match = _COST.match(hashed or "")
+    return int(match.group(1)) if match else None
+
+
+def needs_rehash(hashed):
+    return cost_of(hashed) != BCRYPT_ROUNDS
+
+
+# -------------------------------------------------------------------
+# Limites de tentativa
+# -------------------------------------------------------------------
+
+class RateLimiter:
+    """Janela deslizante: no máximo `limit` eventos por chave a cada `window` segundos."""
+
+    # Acima disso, chaves sem eventos recentes são descartadas
+    MAX_KEYS = 10_000
+
+    def __init__(self, limit, window, clock=time.monotonic):
+        self.limit = limit
+        self.window = window
+        self._clock = clock
+        self._events = {}
+        self._lock = threading.Lock()
+
+    def _recent(self, key, now):
+        events = self._events.get(key)
+        if events is None:
+            return None
+        while events and events[0] <= now - self.window:
+            events.popleft()
+        return events
+
+    def retry_after(self, key):
+        """Segundos até a próxima tentativa ser aceita (0 se já pode)."""
+        with self._lock:
+            now = self._clock()
+            events = self._recent(key, now)
+            if not events or len(events) < self.limit:
+                return 0
+            return math.ceil(events[0] + self.window - now)
+
+    def add(self, key):
+        with self._lock:
+            now = self._clock()
+            if len(self._events) >= self.MAX_KEYS:
+                for stale in [k for k in self._events if not self._recent(k, now)]:
+                    del self._events[stale]
+            events = self._recent(key, now)
+            if events is None:
+                events = self._events[key] = deque()
+            events.append(now)
+
+    def reset(self, key):
+        with self._lock:
+            self._events.pop(key, None)
+
+
+class FailedAttemptCache:
+    """
+    Combinações (usuário, senha, hash guardado) que falharam há pouco.
+    As chaves são HMAC com segredo do processo: nenhuma senha fica em memória.
+    Como o hash guardado entra na chave, trocar a senha invalida a entrada.
+    """
+
+    MAX_ENTRIES = 10_000
+
+    def __init__(self, ttl, clock=time.monotonic):
+        self.ttl = ttl
+        self._clock = clock
+        self._secret = secrets.token_bytes(32)
+        self._expires = {}
+        self._lock = threading.Lock()
+
+    def _key(self, username, password, hashed):
+        message = "\0".join((username, password, hashed or "")).encode("utf-8")
+        return hmac.new(self._secret, message, hashlib.sha256).digest()
+
+    def __contains__(self, attempt):
+        key = self._key(*attempt)
+        with self._lock:
+            expires = self._expires.get(key)
+            if expires is None:
+                return False
+            if expires <= self._clock():
+                del self._expires[key]
+                return False
+            return True
+
+    def add(self, username, password, hashed):
+        key = self._key(username, password, hashed)
+        with self._lock:
+            now = self._clock()
+            if len(self._expires) >= self.MAX_ENTRIES:
+                self._expires = {k: t for k, t in self._expires.items() if t > now}
+            self._expires[key] = now + self.ttl
+
+    def clear(self):
+        with self._lock:
+            self._expires.clear()
+
+
+user_limiter = RateLimiter(USER_MAX_FAILURES, USER_WINDOW_SECONDS)
+ip_limiter = RateLimiter(IP_MAX_FAILURES, IP_WINDOW_SECONDS)
+failed_attempts = FailedAttemptCache(FAILED_CACHE_TTL_SECONDS)
+
+
+# -------------------------------------------------------------------
+# Tokens de sessão
+# -------------------------------------------------------------------
+# Formato: <id aleatório>.<expira em (epoch)>.<HMAC-SHA256 dos dois>. A
+# assinatura e a validade são conferidas sem ir ao banco; o banco guarda só o
+# sha256 do id, para a sessão poder ser encerrada (logout) antes de expirar.
+
+def _sign(secret, payload):
+    return hmac.new(secret, payload.encode("ascii"), hashlib.sha256).hexdigest()
+
+
+def session_id_hash(session_id):
+    return hashlib.sha256(session_id.encode("ascii")).hexdigest()
+
+
+def new_session_token(secret, ttl=None, now=None):
+    """Novo token: retorna (token, id da sessão, expira em)."""
+    session_id = secrets.token_urlsafe(24)
+    expires_at = int((now if now is not None else time.time()) + (ttl or SESSION_TTL_SECONDS))
+    payload = f"{session_id}.{expires_at}"
+    return f"{payload}.{_sign(secret, payload)}", session_id, expires_at
+
+
+def parse_session_token(token, secret, now=None):
+    """(id da sessão, expira em) se a assinatura confere e o token não venceu; senão None."""
+    try:
+        session_id, expires, signature = token.split(".")
+        expires_at = int(expires)
+        expected = _sign(secret, f"{session_id}.{expires}")
+    except (AttributeError, ValueError, UnicodeEncodeError):
+        return None
+    if not hmac.compare_digest(signature, expected):
+        return None
+    if expires_at <= (now if now is not None else time.time()):
+        return None
+    return session_id, expires_at
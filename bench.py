@@ -0,0 +1,321 @@
+"""
+Micro-benchmarks do banco de dados da loja.
+
+Uso:
+    python bench.py pool [--sessions 8] [--queries 500]
+    python bench.py init
+    python bench.py search [--products 50000]
+    python bench.py writes [--sessions 16] [--sales 200]
+    python bench.py pdf [--products 10000]
+    python bench.py login [--sessions 16] [--logins 4]
+
+Cada benchmark cria um banco temporário, então pode ser executado sem
+afetar o store.db de produção.
+"""
+import argparse
+import os
+import random
+import sqlite3
+import tempfile
+import threading
+import time
+
+import auth
+import database as db
+import exports
+
+
+def use_temp_db():
+    """Aponta o módulo database para um arquivo temporário e inicializa o schema."""
+    tmp_dir = tempfile.mkdtemp(prefix="bench_store_")
+    db.close_pool()
+    db.DB_NAME = os.path.join(tmp_dir, "store.db")
+    db.init_db()
+    return db.DB_NAME
+
+
+WORDS = ["Óleo", "Tônico", "Hidratante", "Perfume", "Sabonete", "Shampoo", "Condicionador",
+         "Creme", "Loção", "Sérum", "Máscara", "Colônia", "Batom", "Esfoliante", "Desodorante"]
+QUALIFIERS = ["Corporal", "Facial", "Floral", "Amadeirado", "Cítrico", "Noturno", "Intenso",
+              "Suave", "Vegano", "Infantil", "Masculino", "Feminino", "Argan", "Lavanda"]
+
+
+def seed_products(n):
+    rows = [
+        (f"{random.choice(WORDS)} {random.choice(QUALIFIERS)} {i}", random.choice(["Natura", "Avon", "Eudora"]),
+         "Perfumaria", "Colônias", round(random.uniform(5, 300), 2), random.randint(0, 50), "2030-01-01")
+        for i in range(n)
+    ]
+    conn = db.get_connection()
+    conn.executemany(
+        "INSERT INTO products (name, brand, style, type, price, quantity, expiration_date) VALUES (?, ?, ?, ?, ?, ?, ?)",
+        rows,
+    )
+    conn.commit()
+    conn.close()
+
+
+def run_sessions(n_sessions, n_queries, query_fn):
+    """Dispara n_sessions threads (simulando sessões do Streamlit) e retorna queries/s."""
+    barrier = threading.Barrier(n_sessions + 1)
+
+    def session():
+        barrier.wait()
+        for _ in range(n_queries):
+            query_fn()
+
+    threads = [threading.Thread(target=session) for _ in range(n_sessions)]
+    for t in threads:
+        t.start()
+    barrier.wait()
+    start = time.perf_counter()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+    return (n_sessions * n_queries) / elapsed
+
+
+def bench_pool(args):
+    use_temp_db()
+    seed_products(args.products)
+    query = "SELECT quantity, price FROM products WHERE id = ?"
+
+    def legacy_query():
+        # Comportamento antigo: uma conexão nova por query
+        conn = sqlite3.connect(db.DB_NAME, timeout=30)
+        try:
+            conn.execute(query, (random.randint(1, args.products),)).fetchone()
+        finally:
+            conn.close()
+
+    def pooled_query():
+        db.execute_read_query(query, (random.randint(1, args.products),), fetch_one=True)
+
+    legacy_qps = run_sessions(args.sessions, args.queries, legacy_query)
+    pooled_qps = run_sessions(args.sessions, args.queries, pooled_query)
+    print(f"Sessões concorrentes: {args.sessions} | queries por sessão: {args.queries}")
+    print(f"  conexão por query : {legacy_qps:10.0f} queries/s")
+    print(f"  pool de conexões  : {pooled_qps:10.0f} queries/s  ({pooled_qps / legacy_qps:.1f}x)")
+    print(f"  estatísticas do pool: {db.get_pool_stats()}")
+
+
+def bench_init(args):
+    tmp_dir = tempfile.mkdtemp(prefix="bench_store_")
+    db.close_pool()
+    db.DB_NAME = os.path.join(tmp_dir, "store.db")
+
+    start = time.perf_counter()
+    db.init_db()
+    cold = time.perf_counter() - start
+
+    # Novo processo sobre um banco já migrado: só a leitura do user_version
+    db._schema_ready_for = None
+    db.close_pool()
+    start = time.perf_counter()
+    db.init_db()
+    warm = time.perf_counter() - start
+
+    # Rerun do Streamlit no mesmo processo
+    start = time.perf_counter()
+    for _ in range(args.reruns):
+        db.init_db()
+    rerun = (time.perf_counter() - start) / args.reruns
+
+    print(f"Schema versão {db.get_schema_version()}")
+    print(f"  banco novo (cold container) : {cold * 1000:8.2f} ms")
+    print(f"  banco existente, novo processo: {warm * 1000:8.2f} ms")
+    print(f"  rerun no mesmo processo     : {rerun * 1e6:8.2f} µs")
+
+
+def bench_search(args):
+    use_temp_db()
+    seed_products(args.products)
+    terms = ["oleo", "tonico corp", "perf", "ARGAN", "hidratante suave", "123"]
+
+    # Busca antiga: oito str.contains sobre o DataFrame completo a cada tecla
+    products = db.get_products()
+
+    def pandas_search(term):
+        return products[
+            products['name'].str.contains(term, case=False, na=False) |
+            products['brand'].str.contains(term, case=False, na=False) |
+            products['style'].str.contains(term, case=False, na=False) |
+            products['type'].str.contains(term, case=False, na=False) |
+            products['id'].astype(str).str.contains(term, case=False, na=False) |
+            products['price'].astype(str).str.contains(term, case=False, na=False) |
+            products['quantity'].astype(str).str.contains(term, case=False, na=False) |
+            products['expiration_date'].astype(str).str.contains(term, case=False, na=False)
+        ].head(24)
+
+    def timed(fn):
+        start = time.perf_counter()
+        for _ in range(args.repeat):
+            for term in terms:
+                fn(term)
+        return (time.perf_counter() - start) / (args.repeat * len(terms))
+
+    # Leitura real do banco (antes do cache, a cada rerun) e o acerto no cache de hoje
+    db.clear_cache()
+    load = time.perf_counter()
+    db.get_products()
+    load = time.perf_counter() - load
+    cached = time.perf_counter()
+    db.get_products()
+    cached = time.perf_counter() - cached
+    old = timed(pandas_search)
+    new = timed(lambda term: db.search_products(term, 24, 0))
+    print(f"Catálogo sintético: {args.products} produtos")
+    print(f"  carregar catálogo p/ pandas : {load * 1000:8.2f} ms (sem cache: era o custo de cada rerun)")
+    print(f"  catálogo em cache           : {cached * 1000:8.2f} ms")
+    print(f"  pandas str.contains (x8)    : {old * 1000:8.2f} ms por busca")
+    print(f"  FTS5 search_products        : {new * 1000:8.2f} ms por busca (página de 24, ranqueada)")
+
+
+def bench_writes(args):
+    def run(write_queue):
+        db.WRITE_QUEUE_ENABLED = write_queue
+        use_temp_db()
+        db.reset_lock_stats()
+        db.add_product("Perfume", "Natura", "Perfumaria", "Colônias", 50.0, args.sessions * args.sales, "2030-01-01", None)
+        rate = run_sessions(args.sessions, args.sales, lambda: db.register_sale(1, 1, 1))
+        stats = db.get_lock_stats()
+        db.close_write_queue()
+        return rate, stats
+
+    direct, direct_stats = run(False)
+    queued, _ = run(True)
+    print(f"Caixas simultâneos: {args.sessions} | vendas por caixa: {args.sales}")
+    print(f"  escrita direta (BEGIN IMMEDIATE) : {direct:8.0f} vendas/s  "
+          f"(esperas por lock: {direct_stats['lock_waits']}, retries: {direct_stats['retries']})")
+    print(f"  fila de escrita (group commit)   : {queued:8.0f} vendas/s  ({queued / direct:.1f}x)")
+
+
+def bench_pdf(args):
+    from fpdf import FPDF
+
+    use_temp_db()
+    seed_products(args.products)
+    products = db.get_catalog()
+
+    def legacy_pdf(products_df):
+        # Gerador antigo: iterrows + duas cells por produto, Arial latin-1
+        pdf = FPDF()
+        pdf.add_page()
+        pdf.set_font("Helvetica", size=12)
+        pdf.cell(200, 10, text="Relatório de Produtos", new_x="LMARGIN", new_y="NEXT", align="C")
+        for _, row in products_df.iterrows():
+            clean = lambda text: str(text).encode("latin-1", "replace").decode("latin-1")
+            pdf.cell(0, 8, text=f"ID: {row['id']} | Nome: {clean(str(row['name'])[:30])} | Marca: {clean(str(row['brand'])[:15])}",
+                     new_x="LMARGIN", new_y="NEXT")
+            pdf.cell(0, 8, text=f"   Qtd: {row['quantity']} | Preço: R$ {row['price']} | Val: {row['expiration_date']}",
+                     new_x="LMARGIN", new_y="NEXT")
+            pdf.ln(2)
+        return bytes(pdf.output())
+
+    def timed(fn):
+        start = time.perf_counter()
+        result = fn()
+        return time.perf_counter() - start, len(result)
+
+    old, old_size = timed(lambda: legacy_pdf(products))
+    new, new_size = timed(lambda: exports.catalog_pdf())
+    cached, _ = timed(lambda: exports.catalog_pdf())
+    print(f"Catálogo sintético: {args.products} produtos")
+    print(f"  gerador antigo (iterrows/cell)  : {old:7.2f} s  ({old_size / 1e6:.1f} MB), a cada rerun da aba")
+    print(f"  exports.catalog_pdf, 1º clique  : {new:7.2f} s  ({new_size / 1e6:.1f} MB, fonte Unicode embutida)")
+    print(f"  exports.catalog_pdf, em cache   : {cached * 1000:7.2f} ms")
+
+
+def bench_login(args):
+    import bcrypt
+
+    use_temp_db()
+    seed_products(args.products)
+    users = [f"cliente{i}" for i in range(args.sessions)]
+    for username in users:
+        db.create_user(username, "senha-forte", "cliente", username)
+    stored = dict(db.execute_read_query("SELECT username, password FROM users"))
+
+    def legacy_login(username):
+        # Caminho antigo: bcrypt direto na thread da sessão, sem limite de concorrência
+        row = db.execute_read_query("SELECT id, password FROM users WHERE username = ?", (username,), fetch_one=True)
+        bcrypt.checkpw(b"senha-forte", row[1].encode("utf-8"))
+
+    def catalog_latency_during(login_fn):
+        """Latências de página do catálogo enquanto todas as sessões fazem login."""
+        latencies, done = [], threading.Event()
+
+        def browse():
+            while not done.is_set():
+                start = time.perf_counter()
+                db.get_products_page(24, random.randrange(0, args.products - 24))
+                latencies.append(time.perf_counter() - start)
+                time.sleep(0.005)
+
+        browser = threading.Thread(target=browse)
+        browser.start()
+        start = time.perf_counter()
+        threads = [threading.Thread(target=lambda u=u: [login_fn(u) for _ in range(args.logins)]) for u in users]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        elapsed = time.perf_counter() - start
+        done.set()
+        browser.join()
+        latencies.sort()
+        p = lambda q: latencies[min(len(latencies) - 1, int(len(latencies) * q))] * 1000
+        return len(users) * args.logins / elapsed, p(0.5), p(0.99)
+
+    # Referência: sessões só esperando, sem CPU
+    idle = catalog_latency_during(lambda u: time.sleep(0.1))
+    legacy = catalog_latency_during(legacy_login)
+    pooled = catalog_latency_during(lambda u: db.check_login(u, "senha-forte"))
+    print(f"Logins simultâneos: {args.sessions} sessões x {args.logins} | custo bcrypt {auth.BCRYPT_ROUNDS} | "
+          f"pool de {auth.AUTH_WORKERS} thread(s)")
+    print(f"  sem logins            : catálogo p50 {idle[1]:7.2f} ms  p99 {idle[2]:7.2f} ms")
+    for label, (rate, p50, p99) in [("bcrypt na sessão", legacy), ("pool de autenticação", pooled)]:
+        print(f"  {label:<22}: {rate:6.1f} logins/s  catálogo p50 {p50:7.2f} ms  p99 {p99:7.2f} ms")
+    print(f"  estatísticas: {auth.get_auth_stats()}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("pool", help="conexão por query vs. pool de conexões")
+    p.add_argument("--sessions", type=int, default=8)
+    p.add_argument("--queries", type=int, default=500)
+    p.add_argument("--products", type=int, default=1000)
+    p.set_defaults(func=bench_pool)
+
+    p = sub.add_parser("init", help="custo do init_db em cold start e em reruns")
+    p.add_argument("--reruns", type=int, default=1000)
+    p.set_defaults(func=bench_init)
+
+    p = sub.add_parser("search", help="busca com str.contains vs. índice FTS5")
+    p.add_argument("--products", type=int, default=50000)
+    p.add_argument("--repeat", type=int, default=5)
+    p.set_defaults(func=bench_search)
+
+    p = sub.add_parser("writes", help="escrita direta vs. fila de escrita com group commit")
+    p.add_argument("--sessions", type=int, default=16)
+    p.add_argument("--sales", type=int, default=200)
+    p.set_defaults(func=bench_writes)
+
+    p = sub.add_parser("pdf", help="gerador de PDF antigo vs. exports.catalog_pdf")
+    p.add_argument("--products", type=int, default=10000)
+    p.set_defaults(func=bench_pdf)
+
+    p = sub.add_parser("login", help="vazão de login e latência do catálogo com bcrypt na sessão vs. pool")
+    p.add_argument("--sessions", type=int, default=16)
+    p.add_argument("--logins", type=int, default=4)
+    p.add_argument("--products", type=int, default=5000)
+    p.set_defaults(func=bench_login)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
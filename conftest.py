@@ -0,0 +1,35 @@
+import io
+
+import pytest
+from PIL import Image
+
+import database as db
+
+
+def image_bytes(size=(900, 600), color="teal", fmt="JPEG", orientation=None):
+    """Imagem de cor sólida codificada em fmt; orientation grava a tag EXIF de rotação."""
+    buf = io.BytesIO()
+    options = {}
+    if orientation:
+        exif = Image.Exif()
+        exif[0x0112] = orientation
+        options["exif"] = exif
+    Image.new("RGB", size, color).save(buf, fmt, **options)
+    return buf.getvalue()
+
+
+def reset_database_state():
+    db.close_write_queue()
+    db.close_pool()
+    db.clear_cache()
+    db.reset_lock_stats()
+
+
+@pytest.fixture
+def temp_db(tmp_path, monkeypatch):
+    """Banco novo e migrado em tmp_path; pool, fila de escrita e cache zerados antes e depois."""
+    reset_database_state()
+    monkeypatch.setattr(db, "DB_NAME", str(tmp_path / "store.db"))
+    db.init_db()
+    yield db.DB_NAME
+    reset_database_state()
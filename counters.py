@@ -0,0 +1,29 @@
+"""
+Contadores de diagnóstico compartilhados entre threads.
+
+Pool do banco, servidor de mídia e autenticação somam eventos de várias
+threads ao mesmo tempo; o painel do admin e os benchmarks leem uma cópia.
+"""
+import threading
+
+
+class Counters:
+    """Dicionário de contadores com incremento atômico; os valores iniciais definem as chaves."""
+
+    def __init__(self, **initial):
+        self._initial = dict(initial)
+        self._values = dict(initial)
+        self._lock = threading.Lock()
+
+    def add(self, **increments):
+        with self._lock:
+            for key, value in increments.items():
+                self._values[key] += value
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self._values)
+
+    def reset(self):
+        with self._lock:
+            self._values = dict(self._initial)
@@ -2,247 +2,1585 @@ import sqlite3
 import pandas as pd
 import bcrypt
 import datetime
+import calendar
 import time
+import os
+import csv
+import random
+import queue
+import re
+import secrets
+import threading
+from concurrent.futures import Future
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Optional
+
+import auth
+import images
+from counters import Counters
 
 DB_NAME = "store.db"
 
-def init_db():
-    max_retries = 5
-    for attempt in range(max_retries):
-        conn = None
+# -------------------------------------------------------------------
+# Pool de Conexões
+# -------------------------------------------------------------------
+
+# Quantidade máxima de conexões abertas simultaneamente por processo
+POOL_SIZE = int(os.environ.get("STORE_DB_POOL_SIZE", "8"))
+# Tempo máximo (s) esperando uma conexão livre no pool
+POOL_TIMEOUT = 30
+# Conexões paradas há mais tempo que isso passam por um health check antes de reutilizar
+POOL_HEALTH_CHECK_AFTER = 30
+
+# PRAGMAs aplicados uma única vez, quando a conexão é criada
+CONNECTION_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA cache_size=-16000",     # ~16 MB de page cache por conexão
+    "PRAGMA mmap_size=134217728",   # 128 MB de I/O mapeado em memória
+    "PRAGMA temp_store=MEMORY",
+)
+
+
+class ConnectionPool:
+    """
+    Pool limitado de conexões SQLite de longa duração.
+    As conexões são compartilhadas entre as threads das sessões do Streamlit
+    (uma thread por vez), mantendo o page cache entre reruns.
+    """
+
+    def __init__(self, db_name, max_size=POOL_SIZE):
+        self.db_name = db_name
+        self.max_size = max_size
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(max_size)
+        self._lock = threading.Lock()
+        self._closed = False
+        self.stats = {"created": 0, "reused": 0, "discarded": 0}
+
+    def _open(self):
+        conn = sqlite3.connect(self.db_name, timeout=BUSY_TIMEOUT_MS / 1000, check_same_thread=False)
+        for pragma in CONNECTION_PRAGMAS:
+            conn.execute(pragma)
+        with self._lock:
+            self.stats["created"] += 1
+        return conn
+
+    def _discard(self, conn):
+        with self._lock:
+            self.stats["discarded"] += 1
+        try: conn.close()
+        except Exception: pass
+
+    def _is_healthy(self, conn):
+        try:
+            conn.execute("SELECT 1").fetchone()
+            return True
+        except sqlite3.Error:
+            return False
+
+    def acquire(self, timeout=POOL_TIMEOUT):
+        if not self._slots.acquire(timeout=timeout):
+            raise sqlite3.OperationalError("Pool de conexões esgotado (database is locked)")
         try:
-            conn = sqlite3.connect(DB_NAME)
-            # Habilitar WAL mode para melhor concorrência online
-            conn.execute("PRAGMA journal_mode=WAL;")
-            c = conn.cursor()
-            
-            # Tabela de Usuários
-            c.execute('''CREATE TABLE IF NOT EXISTS users (
-                            id INTEGER PRIMARY KEY AUTOINCREMENT,
-                            username TEXT UNIQUE NOT NULL,
-                            password TEXT NOT NULL,
-                            role TEXT NOT NULL,
-                            name TEXT
-                        )''')
-            
-            # Migração: Adicionar colunas novas se não existirem
-            cols_to_add = [
-                ("birth_date", "TEXT"),
-                ("email", "TEXT"),
-                ("phone", "TEXT"),
-                ("cpf", "TEXT"),
-                ("profile_image", "BLOB"),
-                ("preferred_type", "TEXT"),
-                ("preferred_brand", "TEXT"),
-                ("preferred_style", "TEXT")
-            ]
-            
-            for col_name, col_type in cols_to_add:
+            while True:
                 try:
-                    c.execute(f"ALTER TABLE users ADD COLUMN {col_name} {col_type}")
-                except sqlite3.OperationalError:
-                    pass # Coluna já existe
-            
-            # Tabela de Produtos
-            c.execute('''CREATE TABLE IF NOT EXISTS products (
-                            id INTEGER PRIMARY KEY AUTOINCREMENT,
-                            name TEXT NOT NULL,
-                            brand TEXT,
-                            style TEXT,
-                            type TEXT,
-                            price REAL,
-                            quantity INTEGER,
-                            expiration_date TEXT,
-                            image BLOB
-                        )''')
-            
-            # Tabela de Vendas
-            c.execute('''CREATE TABLE IF NOT EXISTS sales (
-                            id INTEGER PRIMARY KEY AUTOINCREMENT,
-                            product_id INTEGER,
-                            quantity INTEGER,
-                            total_value REAL,
-                            sale_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                            user_id INTEGER,
-                            FOREIGN KEY(product_id) REFERENCES products(id),
-                            FOREIGN KEY(user_id) REFERENCES users(id)
-                        )''')
-            
-            # Criar admin padrão se não existir
-            c.execute("SELECT * FROM users WHERE username = 'admin'")
-            if not c.fetchone():
-                hashed = bcrypt.hashpw('admin123'.encode('utf-8'), bcrypt.gensalt())
-                c.execute("INSERT INTO users (username, password, role, name) VALUES (?, ?, ?, ?)",
-                          ('admin', hashed.decode('utf-8'), 'admin', 'Administrador'))
-            
-            conn.commit()
-            return # Sucesso
+                    conn, last_used = self._idle.get_nowait()
+                except queue.Empty:
+                    return self._open()
+                if time.monotonic() - last_used < POOL_HEALTH_CHECK_AFTER or self._is_healthy(conn):
+                    with self._lock:
+                        self.stats["reused"] += 1
+                    return conn
+                self._discard(conn)
+        except Exception:
+            self._slots.release()
+            raise
+
+    def release(self, conn):
+        try:
+            # Nunca devolver ao pool uma conexão com transação pendente
+            if conn.in_transaction:
+                conn.rollback()
+            if self._closed:
+                conn.close()
+            else:
+                self._idle.put((conn, time.monotonic()))
+        except sqlite3.Error:
+            self._discard(conn)
+        finally:
+            self._slots.release()
+
+    @contextmanager
+    def connection(self):
+        conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    def close(self):
+        self._closed = True
+        while True:
+            try:
+                conn, _ = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            try: conn.close()
+            except Exception: pass
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_pool():
+    """Retorna o pool do processo, recriando-o se DB_NAME mudar (ex.: testes)."""
+    global _pool
+    pool = _pool
+    if pool is None or pool.db_name != DB_NAME:
+        with _pool_lock:
+            if _pool is None or _pool.db_name != DB_NAME:
+                if _pool is not None:
+                    _pool.close()
+                _pool = ConnectionPool(DB_NAME)
+            pool = _pool
+    return pool
+
+def close_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close()
+            _pool = None
+
+def get_pool_stats():
+    pool = get_pool()
+    return dict(pool.stats, idle=pool._idle.qsize(), max_size=pool.max_size)
+
+
+# -------------------------------------------------------------------
+# Política de Retry para "database is locked"
+# -------------------------------------------------------------------
+# O próprio SQLite espera até BUSY_TIMEOUT_MS por um lock. Se ainda assim o
+# banco estiver ocupado, a operação inteira é repetida com backoff exponencial
+# com jitter até RETRY_DEADLINE segundos desde a primeira tentativa.
+
+BUSY_TIMEOUT_MS = int(os.environ.get("STORE_DB_BUSY_TIMEOUT_MS", "2000"))
+RETRY_DEADLINE = float(os.environ.get("STORE_DB_RETRY_DEADLINE", "10"))
+RETRY_BASE_DELAY = 0.01
+RETRY_MAX_DELAY = 0.5
+# BEGIN IMMEDIATE que demora mais que isso conta como espera por lock
+LOCK_WAIT_THRESHOLD = 0.005
+
+_lock_stats = Counters(lock_waits=0, lock_wait_seconds=0.0, lock_errors=0,
+                       retries=0, retry_sleep_seconds=0.0, gave_up=0)
+
+def get_lock_stats():
+    """Contadores de contenção: esperas por lock, erros de lock, retries e desistências."""
+    return _lock_stats.snapshot()
+
+def reset_lock_stats():
+    _lock_stats.reset()
+
+def _is_lock_error(e):
+    msg = str(e).lower()
+    return "locked" in msg or "busy" in msg
+
+def retry_on_lock(call, deadline=RETRY_DEADLINE):
+    """
+    Executa call(). Em "database is locked" repete com backoff exponencial +
+    jitter até o deadline; depois disso (ou em qualquer outro erro) a exceção
+    sobe para quem chamou.
+    """
+    start = time.monotonic()
+    attempt = 0
+    while True:
+        try:
+            return call()
         except sqlite3.OperationalError as e:
-            if "locked" in str(e).lower():
-                if attempt < max_retries - 1:
-                    time.sleep(1)
-                    if conn: 
-                        try: conn.close()
-                        except: pass
-                    continue
-            print(f"Erro ao inicializar DB (tentativa {attempt+1}): {e}")
-            if conn:
-                try: conn.close()
-                except: pass
-        except Exception as e:
-            print(f"Erro fatal ao inicializar DB: {e}")
-            if conn:
-                try: conn.close()
-                except: pass
-            break
+            if not _is_lock_error(e):
+                raise
+            # Full jitter: espalha as sessões que colidiram no mesmo lock
+            delay = random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * (2 ** attempt)))
+            if time.monotonic() - start + delay > deadline:
+                _lock_stats.add(lock_errors=1, gave_up=1)
+                raise
+            _lock_stats.add(lock_errors=1, retries=1, retry_sleep_seconds=delay)
+            time.sleep(delay)
+            attempt += 1
 
+def run_with_retry(fn, deadline=RETRY_DEADLINE):
+    """Executa fn(conn) com uma conexão do pool, sob a política de retry."""
+    def attempt():
+        with get_pool().connection() as conn:
+            return fn(conn)
+    return retry_on_lock(attempt, deadline)
 
-def get_connection():
-    # Helper para criar conexão com timeout maior para evitar locks
-    return sqlite3.connect(DB_NAME, timeout=30)
+def begin_immediate(conn):
+    """Abre transação de escrita já com o lock reservado (sem upgrade leitura->escrita)."""
+    start = time.monotonic()
+    conn.execute("BEGIN IMMEDIATE")
+    waited = time.monotonic() - start
+    if waited > LOCK_WAIT_THRESHOLD:
+        _lock_stats.add(lock_waits=1, lock_wait_seconds=waited)
 
-def execute_write_query(query, params=()):
+def run_write(fn, deadline=RETRY_DEADLINE):
     """
-    Executa uma query de escrita (INSERT, UPDATE, DELETE) com lógica de retry robusta.
-    Retorna True se sucesso, False caso contrário.
+    Executa fn(conn) numa transação BEGIN IMMEDIATE ... COMMIT, com a política
+    de retry. Qualquer exceção de fn desfaz a transação inteira.
+    Com a fila de escrita ativa (WRITE_QUEUE_ENABLED), fn é executada pela
+    thread escritora e o resultado (ou a exceção) volta por um Future.
     """
-    max_retries = 5
-    conn = None
-    for attempt in range(max_retries):
+    if WRITE_QUEUE_ENABLED:
+        return get_write_queue().submit(fn).result()
+
+    def transaction(conn):
+        begin_immediate(conn)
         try:
-            conn = get_connection()
-            c = conn.cursor()
-            c.execute(query, params)
+            result = fn(conn)
             conn.commit()
-            return True
-        except sqlite3.OperationalError as e:
-            if "locked" in str(e).lower():
-                if attempt < max_retries - 1:
-                    time.sleep(1) # Espera 1s antes de tentar novamente
-                    if conn: conn.close()
-                    continue
-            print(f"Erro operacional no DB (tentativa {attempt+1}): {e}")
-            return False
-        except Exception as e:
-            print(f"Erro geral no DB: {e}")
-            return False
+            return result
+        except BaseException:
+            conn.rollback()
+            raise
+    return run_with_retry(transaction, deadline)
+
+
+# -------------------------------------------------------------------
+# Fila de Escrita (escritor único, opcional)
+# -------------------------------------------------------------------
+# O SQLite aceita um escritor por vez. Com STORE_DB_WRITE_QUEUE=1 todas as
+# escritas feitas via run_write entram numa fila consumida por uma única
+# thread, que agrupa as operações pendentes numa só transação (group commit).
+# Cada operação roda dentro de um SAVEPOINT próprio: a falha de uma (ex.:
+# CheckoutError) desfaz só o que ela fez, sem afetar as demais do lote.
+
+WRITE_QUEUE_ENABLED = os.environ.get("STORE_DB_WRITE_QUEUE", "0") == "1"
+# Máximo de operações por transação
+WRITE_BATCH_MAX = 64
+
+
+class WriteQueue:
+    """
+    Thread escritora dedicada, com conexão própria. As funções submetidas
+    recebem a conexão já dentro da transação: não devem chamar commit()
+    nem run_write().
+    """
+
+    def __init__(self, db_name, batch_max=WRITE_BATCH_MAX):
+        self.db_name = db_name
+        self.batch_max = batch_max
+        self._ops = queue.Queue()
+        self._lock = threading.Lock()
+        self._closed = False
+        self.stats = {"ops": 0, "failed_ops": 0, "batches": 0, "max_batch": 0}
+        # Aberta aqui para que um erro de conexão apareça para quem criou a fila
+        self._conn = self._open()
+        self._thread = threading.Thread(target=self._run, name="store-db-writer", daemon=True)
+        self._thread.start()
+
+    def submit(self, fn):
+        future = Future()
+        with self._lock:
+            if self._closed:
+                raise sqlite3.OperationalError("Fila de escrita encerrada")
+            self._ops.put((fn, future))
+        return future
+
+    def close(self, timeout=None):
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._ops.put(None)
+        self._thread.join(timeout)
+
+    def _open(self):
+        conn = sqlite3.connect(self.db_name, timeout=BUSY_TIMEOUT_MS / 1000, check_same_thread=False)
+        for pragma in CONNECTION_PRAGMAS:
+            conn.execute(pragma)
+        return conn
+
+    def _next_batch(self):
+        # Bloqueia pela primeira operação; as que chegaram enquanto o lote
+        # anterior era gravado entram juntas na próxima transação
+        first = self._ops.get()
+        if first is None:
+            return None
+        batch = [first]
+        while len(batch) < self.batch_max:
+            try:
+                op = self._ops.get_nowait()
+            except queue.Empty:
+                break
+            if op is None:
+                self._ops.put(None)
+                break
+            batch.append(op)
+        return batch
+
+    def _run(self):
+        conn = self._conn
+        try:
+            while True:
+                batch = self._next_batch()
+                if batch is None:
+                    return
+                batch = [(fn, future) for fn, future in batch if future.set_running_or_notify_cancel()]
+                if batch:
+                    self._write_batch(conn, batch)
         finally:
-            if conn: 
-                try: conn.close()
-                except: pass
-    return False
+            conn.close()
+
+    def _write_batch(self, conn, batch):
+        try:
+            # Lock de outro processo: a política de retry repete o lote inteiro
+            outcomes = retry_on_lock(lambda: self._apply_batch(conn, batch))
+        except BaseException as e:
+            for _, future in batch:
+                future.set_exception(e)
+            return
+        failed = 0
+        for (_, future), (result, error) in zip(batch, outcomes):
+            if error is None:
+                future.set_result(result)
+            else:
+                failed += 1
+                future.set_exception(error)
+        with self._lock:
+            self.stats["ops"] += len(batch)
+            self.stats["failed_ops"] += failed
+            self.stats["batches"] += 1
+            self.stats["max_batch"] = max(self.stats["max_batch"], len(batch))
+
+    def _apply_batch(self, conn, batch):
+        begin_immediate(conn)
+        try:
+            outcomes = []
+            for fn, _ in batch:
+                conn.execute("SAVEPOINT write_op")
+                try:
+                    result = fn(conn)
+                except Exception as e:
+                    conn.execute("ROLLBACK TO write_op")
+                    conn.execute("RELEASE write_op")
+                    outcomes.append((None, e))
+                else:
+                    conn.execute("RELEASE write_op")
+                    outcomes.append((result, None))
+            conn.commit()
+            return outcomes
+        except BaseException:
+            conn.rollback()
+            raise
+
+
+_write_queue = None
+_write_queue_lock = threading.Lock()
+
+def get_write_queue():
+    """Retorna a fila de escrita do processo, recriando-a se DB_NAME mudar."""
+    global _write_queue
+    wq = _write_queue
+    if wq is None or wq.db_name != DB_NAME:
+        with _write_queue_lock:
+            if _write_queue is None or _write_queue.db_name != DB_NAME:
+                if _write_queue is not None:
+                    _write_queue.close()
+                _write_queue = WriteQueue(DB_NAME)
+            wq = _write_queue
+    return wq
+
+def close_write_queue():
+    global _write_queue
+    with _write_queue_lock:
+        if _write_queue is not None:
+            _write_queue.close()
+            _write_queue = None
+
+def get_write_queue_stats():
+    wq = _write_queue
+    if not WRITE_QUEUE_ENABLED or wq is None:
+        return {"enabled": WRITE_QUEUE_ENABLED}
+    with wq._lock:
+        return dict(wq.stats, enabled=True, pending=wq._ops.qsize())
+
+
+# -------------------------------------------------------------------
+# Schema e Migrações
+# -------------------------------------------------------------------
+# A versão do schema fica em PRAGMA user_version. Cada migração é aplicada
+# uma única vez, em ordem; para evoluir o schema basta acrescentar uma nova
+# função ao final de MIGRATIONS (nunca alterar as já publicadas).
+
+def _table_columns(c, table):
+    return {row[1] for row in c.execute(f"PRAGMA table_info({table})")}
+
+def _add_missing_columns(c, table, columns):
+    existing = _table_columns(c, table)
+    for col_name, col_type in columns:
+        if col_name not in existing:
+            c.execute(f"ALTER TABLE {table} ADD COLUMN {col_name} {col_type}")
+
+def _migration_base_schema(c):
+    # Idempotente: bancos criados antes do controle de versão já têm estas tabelas
+    c.execute('''CREATE TABLE IF NOT EXISTS users (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    username TEXT UNIQUE NOT NULL,
+                    password TEXT NOT NULL,
+                    role TEXT NOT NULL,
+                    name TEXT
+                )''')
+
+    _add_missing_columns(c, "users", [
+        ("birth_date", "TEXT"),
+        ("email", "TEXT"),
+        ("phone", "TEXT"),
+        ("cpf", "TEXT"),
+        ("profile_image", "BLOB"),
+        ("preferred_type", "TEXT"),
+        ("preferred_brand", "TEXT"),
+        ("preferred_style", "TEXT")
+    ])
+
+    c.execute('''CREATE TABLE IF NOT EXISTS products (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    name TEXT NOT NULL,
+                    brand TEXT,
+                    style TEXT,
+                    type TEXT,
+                    price REAL,
+                    quantity INTEGER,
+                    expiration_date TEXT,
+                    image BLOB
+                )''')
+
+    c.execute('''CREATE TABLE IF NOT EXISTS sales (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    product_id INTEGER,
+                    quantity INTEGER,
+                    total_value REAL,
+                    sale_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    user_id INTEGER,
+                    FOREIGN KEY(product_id) REFERENCES products(id),
+                    FOREIGN KEY(user_id) REFERENCES users(id)
+                )''')
+
+    # Criar admin padrão se não existir
+    c.execute("SELECT id FROM users WHERE username = 'admin'")
+    if not c.fetchone():
+        hashed = bcrypt.hashpw('admin123'.encode('utf-8'), bcrypt.gensalt())
+        c.execute("INSERT INTO users (username, password, role, name) VALUES (?, ?, ?, ?)",
+                  ('admin', hashed.decode('utf-8'), 'admin', 'Administrador'))
+
+def _migration_image_version(c):
+    # Versão da imagem do produto: permite saber se há imagem (e se mudou)
+    # sem ler o BLOB
+    _add_missing_columns(c, "products", [("image_version", "INTEGER NOT NULL DEFAULT 0")])
+    c.execute("UPDATE products SET image_version = 1 WHERE image IS NOT NULL AND image_version = 0")
+
+def _image_record(image_bytes):
+    """Linha da tabela images para um upload (derivados gerados pelo pipeline)."""
+    try:
+        processed = images.process_upload(image_bytes)
+    except Exception as e:
+        # Arquivo que o Pillow não entende: guarda como veio, sem derivados
+        print(f"Imagem não processada, armazenando original: {e}")
+        processed = {"hash": images.content_hash(image_bytes), "mime": "application/octet-stream",
+                     "width": None, "height": None, "original": image_bytes, "preview": None, "thumb": None}
+    return (processed["hash"], processed["mime"], processed["width"], processed["height"],
+            processed["original"], processed["preview"], processed["thumb"])
+
+INSERT_IMAGE_QUERY = '''INSERT OR IGNORE INTO images (hash, mime, width, height, original, preview, thumb)
+                         VALUES (?, ?, ?, ?, ?, ?, ?)'''
+
+def _migration_image_store(c):
+    # Imagens endereçadas por conteúdo (hash), com miniatura e preview
+    c.execute('''CREATE TABLE IF NOT EXISTS images (
+                    hash TEXT PRIMARY KEY,
+                    mime TEXT NOT NULL,
+                    width INTEGER,
+                    height INTEGER,
+                    original BLOB NOT NULL,
+                    preview BLOB,
+                    thumb BLOB,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )''')
+    _add_missing_columns(c, "products", [("image_hash", "TEXT")])
+
+    # Move os BLOBs legados de products.image para o store (um por vez, para não
+    # carregar todas as imagens na memória)
+    ids = [row[0] for row in c.execute(
+        "SELECT id FROM products WHERE image IS NOT NULL AND image_hash IS NULL").fetchall()]
+    for product_id in ids:
+        image_bytes = c.execute("SELECT image FROM products WHERE id=?", (product_id,)).fetchone()[0]
+        if not image_bytes:
+            c.execute("UPDATE products SET image = NULL WHERE id=?", (product_id,))
+            continue
+        record = _image_record(image_bytes)
+        c.execute(INSERT_IMAGE_QUERY, record)
+        c.execute("UPDATE products SET image_hash = ?, image = NULL WHERE id=?", (record[0], product_id))
+
+# Colunas de products indexadas na busca textual (o id entra como texto para
+# permitir buscar pelo código do produto)
+FTS_COLUMNS = ("id", "name", "brand", "style", "type", "expiration_date")
+# Pesos do bm25 na mesma ordem de FTS_COLUMNS: nome pesa mais que marca, etc.
+FTS_WEIGHTS = (1.0, 10.0, 4.0, 2.0, 2.0, 0.5)
+
+def _migration_products_fts(c):
+    # Índice FTS5 de conteúdo externo (não duplica os dados de products).
+    # remove_diacritics faz "oleo" encontrar "Óleo"; prefix acelera buscas por prefixo.
+    cols = ", ".join(FTS_COLUMNS)
+    new_vals = ", ".join(f"new.{col}" for col in FTS_COLUMNS)
+    old_vals = ", ".join(f"old.{col}" for col in FTS_COLUMNS)
+    c.execute(f'''CREATE VIRTUAL TABLE IF NOT EXISTS products_fts USING fts5(
+                    {cols},
+                    content='products', content_rowid='id',
+                    tokenize='unicode61 remove_diacritics 2',
+                    prefix='2 3'
+                )''')
+    # Triggers mantêm o índice sincronizado com products
+    c.execute(f'''CREATE TRIGGER IF NOT EXISTS products_fts_ai AFTER INSERT ON products BEGIN
+                    INSERT INTO products_fts(rowid, {cols}) VALUES (new.id, {new_vals});
+                END''')
+    c.execute(f'''CREATE TRIGGER IF NOT EXISTS products_fts_ad AFTER DELETE ON products BEGIN
+                    INSERT INTO products_fts(products_fts, rowid, {cols}) VALUES ('delete', old.id, {old_vals});
+                END''')
+    # Só colunas indexadas: baixas de estoque (UPDATE de quantity) não tocam no índice
+    c.execute(f'''CREATE TRIGGER IF NOT EXISTS products_fts_au
+                AFTER UPDATE OF {cols} ON products BEGIN
+                    INSERT INTO products_fts(products_fts, rowid, {cols}) VALUES ('delete', old.id, {old_vals});
+                    INSERT INTO products_fts(rowid, {cols}) VALUES (new.id, {new_vals});
+                END''')
+    c.execute("INSERT INTO products_fts(products_fts) VALUES ('rebuild')")
+
+# Chave mês-dia ("MM-DD") de birth_date, que é gravado como "YYYY-MM-DD"
+BIRTHDAY_KEY_SQL = "substr(birth_date, 6, 5)"
+
+def _migration_birthday_index(c):
+    # Índice de expressão parcial: aniversariantes do dia viram uma busca no índice
+    c.execute(f"CREATE INDEX IF NOT EXISTS idx_users_birthday ON users({BIRTHDAY_KEY_SQL}) WHERE role = 'cliente'")
+
+def _migration_sales_date_index(c):
+    # "Últimas vendas" lê o fim do índice em vez de ordenar todo o histórico
+    c.execute("CREATE INDEX IF NOT EXISTS idx_sales_sale_date ON sales(sale_date)")
+
+SALES_DAILY_BACKFILL_QUERY = '''
+    INSERT INTO sales_daily (day, product_id, seller_id, units, revenue, sale_count)
+    SELECT date(sale_date), COALESCE(product_id, 0), COALESCE(user_id, 0),
+           SUM(quantity), SUM(total_value), COUNT(*)
+    FROM sales GROUP BY 1, 2, 3
+'''
+
+def _migration_sales_daily(c):
+    # Rollup diário (dia x produto x vendedor) mantido por triggers na mesma
+    # transação da venda; relatórios leem poucas linhas em vez do histórico todo.
+    # seller_id/product_id 0 = venda sem usuário/produto associado.
+    c.execute('''CREATE TABLE IF NOT EXISTS sales_daily (
+                    day TEXT NOT NULL,
+                    product_id INTEGER NOT NULL,
+                    seller_id INTEGER NOT NULL,
+                    units INTEGER NOT NULL DEFAULT 0,
+                    revenue REAL NOT NULL DEFAULT 0,
+                    sale_count INTEGER NOT NULL DEFAULT 0,
+                    PRIMARY KEY (day, product_id, seller_id)
+                ) WITHOUT ROWID''')
+    c.execute('''CREATE TRIGGER IF NOT EXISTS sales_daily_ai AFTER INSERT ON sales BEGIN
+                    INSERT INTO sales_daily (day, product_id, seller_id, units, revenue, sale_count)
+                    VALUES (date(new.sale_date), COALESCE(new.product_id, 0), COALESCE(new.user_id, 0),
+                            new.quantity, new.total_value, 1)
+                    ON CONFLICT(day, product_id, seller_id) DO UPDATE SET
+                        units = units + excluded.units,
+                        revenue = revenue + excluded.revenue,
+                        sale_count = sale_count + 1;
+                END''')
+    c.execute('''CREATE TRIGGER IF NOT EXISTS sales_daily_ad AFTER DELETE ON sales BEGIN
+                    UPDATE sales_daily SET
+                        units = units - old.quantity,
+                        revenue = revenue - old.total_value,
+                        sale_count = sale_count - 1
+                    WHERE day = date(old.sale_date) AND product_id = COALESCE(old.product_id, 0)
+                      AND seller_id = COALESCE(old.user_id, 0);
+                END''')
+    c.execute("DELETE FROM sales_daily")
+    c.execute(SALES_DAILY_BACKFILL_QUERY)
+
+def _migration_orders(c):
+    # Pedido com vários itens; cada item também gera uma linha em sales
+    # (ligada pelo order_id), mantendo relatórios e rollup como estão
+    c.execute('''CREATE TABLE IF NOT EXISTS orders (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    user_id INTEGER,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    total_value REAL NOT NULL,
+                    item_count INTEGER NOT NULL,
+                    FOREIGN KEY(user_id) REFERENCES users(id)
+                )''')
+    c.execute('''CREATE TABLE IF NOT EXISTS order_items (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    order_id INTEGER NOT NULL,
+                    product_id INTEGER NOT NULL,
+                    quantity INTEGER NOT NULL,
+                    unit_price REAL NOT NULL,
+                    line_total REAL NOT NULL,
+                    FOREIGN KEY(order_id) REFERENCES orders(id),
+                    FOREIGN KEY(product_id) REFERENCES products(id)
+                )''')
+    c.execute("CREATE INDEX IF NOT EXISTS idx_order_items_order ON order_items(order_id)")
+    _add_missing_columns(c, "sales", [("order_id", "INTEGER")])
+
+# Domínios de dados acompanhados pelo cache de leitura (ver get_cache_stats)
+CHANGE_LOG_DOMAINS = ("products", "sales", "users")
+
+def _migration_change_log(c):
+    # Um contador por domínio, incrementado por trigger a cada escrita. Outros
+    # processos comparam a seq para saber o que mudou sem reler as tabelas.
+    c.execute('''CREATE TABLE IF NOT EXISTS change_log (
+                    domain TEXT PRIMARY KEY,
+                    seq INTEGER NOT NULL DEFAULT 0
+                ) WITHOUT ROWID''')
+    for domain in CHANGE_LOG_DOMAINS:
+        c.execute("INSERT OR IGNORE INTO change_log (domain, seq) VALUES (?, 0)", (domain,))
+        for suffix, event in (("ai", "INSERT"), ("au", "UPDATE"), ("ad", "DELETE")):
+            c.execute(f'''CREATE TRIGGER IF NOT EXISTS change_log_{domain}_{suffix} AFTER {event} ON {domain} BEGIN
+                UPDATE change_log SET seq = seq + 1 WHERE domain = '{domain}';
+            END''')
+
+def _migration_user_avatars(c):
+    # Foto de perfil fora da linha do usuário: a linha de users volta a ser
+    # pequena e a imagem (com miniatura) fica no store endereçado por conteúdo
+    c.execute('''CREATE TABLE IF NOT EXISTS user_avatars (
+                    user_id INTEGER PRIMARY KEY,
+                    image_hash TEXT NOT NULL,
+                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    FOREIGN KEY(user_id) REFERENCES users(id)
+                )''')
+    ids = [row[0] for row in c.execute("SELECT id FROM users WHERE profile_image IS NOT NULL").fetchall()]
+    for user_id in ids:
+        image_bytes = c.execute("SELECT profile_image FROM users WHERE id=?", (user_id,)).fetchone()[0]
+        if image_bytes:
+            record = _image_record(image_bytes)
+            c.execute(INSERT_IMAGE_QUERY, record)
+            c.execute("INSERT OR REPLACE INTO user_avatars (user_id, image_hash) VALUES (?, ?)", (user_id, record[0]))
+        c.execute("UPDATE users SET profile_image = NULL WHERE id=?", (user_id,))
+
+def _migration_sessions(c):
+    # Sessões de login retomáveis por token (ver auth.new_session_token). Só o
+    # sha256 do id fica no banco: vazar a tabela não entrega sessões válidas.
+    c.execute('''CREATE TABLE IF NOT EXISTS sessions (
+                    id_hash TEXT PRIMARY KEY,
+                    user_id INTEGER NOT NULL,
+                    expires_at INTEGER NOT NULL,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    FOREIGN KEY(user_id) REFERENCES users(id)
+                ) WITHOUT ROWID''')
+    c.execute("CREATE INDEX IF NOT EXISTS idx_sessions_user ON sessions(user_id)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_sessions_expires ON sessions(expires_at)")
+    # Segredo de assinatura dos tokens, gerado uma vez por banco (STORE_SESSION_SECRET sobrepõe)
+    c.execute('''CREATE TABLE IF NOT EXISTS app_settings (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL
+                ) WITHOUT ROWID''')
+    c.execute("INSERT OR IGNORE INTO app_settings (key, value) VALUES ('session_secret', ?)", (secrets.token_hex(32),))
+    # Foto de perfil faz parte do usuário em cache: avisa os outros processos também
+    for suffix, event in (("ai", "INSERT"), ("au", "UPDATE"), ("ad", "DELETE")):
+        c.execute(f'''CREATE TRIGGER IF NOT EXISTS change_log_user_avatars_{suffix} AFTER {event} ON user_avatars BEGIN
+            UPDATE change_log SET seq = seq + 1 WHERE domain = 'users';
+        END''')
+
+MIGRATIONS = [
+    _migration_base_schema,   # 1
+    _migration_image_version, # 2
+    _migration_image_store,   # 3
+    _migration_products_fts,  # 4
+    _migration_birthday_index, # 5
+    _migration_sales_date_index, # 6
+    _migration_sales_daily,   # 7
+    _migration_orders,        # 8
+    _migration_change_log,    # 9
+    _migration_user_avatars,  # 10
+    _migration_sessions,      # 11
+]
+SCHEMA_VERSION = len(MIGRATIONS)
+
+# Banco já verificado neste processo: reruns do Streamlit não tocam no schema
+_schema_ready_for = None
+# Duração (s) da última verificação/migração efetiva, para diagnóstico de cold start
+last_init_seconds = None
+
+def get_schema_version():
+    return execute_read_query("PRAGMA user_version", fetch_one=True)[0]
+
+def _apply_migrations(conn):
+    """
+    Aplica as migrações pendentes; retorna (versão encontrada, versão final).
+    A versão encontrada é None quando o banco estava vazio (criado agora).
+    """
+    c = conn.cursor()
+    current = c.execute("PRAGMA user_version").fetchone()[0]
+    if current >= SCHEMA_VERSION:
+        return current, current
+    # Trava de escrita antes de reler a versão: outro processo pode ter migrado
+    begin_immediate(conn)
+    current = c.execute("PRAGMA user_version").fetchone()[0]
+    found = current if current or c.execute("SELECT 1 FROM sqlite_master").fetchone() else None
+    for version in range(current + 1, SCHEMA_VERSION + 1):
+        MIGRATIONS[version - 1](c)
+        c.execute(f"PRAGMA user_version = {version}")
+    conn.commit()
+    return found, SCHEMA_VERSION
+
+def init_db():
+    """
+    Garante que o schema está na versão atual. Executa de fato apenas uma vez
+    por processo (e por arquivo de banco); as chamadas seguintes retornam na hora.
+    """
+    global _schema_ready_for, last_init_seconds
+    if _schema_ready_for == DB_NAME:
+        return
+
+    start = time.perf_counter()
+    try:
+        # WAL e demais PRAGMAs já são aplicados pelo pool ao criar a conexão
+        found, version = run_with_retry(_apply_migrations)
+    except Exception as e:
+        print(f"Erro ao inicializar DB: {e}")
+        return
+    _schema_ready_for = DB_NAME
+    last_init_seconds = time.perf_counter() - start
+    # Só avisa quando um banco existente foi atualizado (banco novo e verificação sem mudança ficam quietos)
+    if found is not None and version != found:
+        print(f"Schema migrado da versão {found} para {version} em {last_init_seconds * 1000:.1f} ms")
+
+
+def get_connection():
+    # Helper para criar uma conexão avulsa (fora do pool) já configurada.
+    # Prefira execute_read_query/execute_write_query, que reutilizam conexões do pool.
+    conn = sqlite3.connect(DB_NAME, timeout=BUSY_TIMEOUT_MS / 1000)
+    for pragma in CONNECTION_PRAGMAS:
+        conn.execute(pragma)
+    return conn
+
+def execute_write_query(query, params=()):
+    """
+    Executa uma query de escrita (INSERT, UPDATE, DELETE) com a política de retry.
+    Retorna True se sucesso, False caso contrário.
+    """
+    try:
+        run_write(lambda conn: conn.execute(query, params))
+        return True
+    except sqlite3.OperationalError as e:
+        print(f"Erro operacional no DB: {e}")
+        return False
+    except Exception as e:
+        print(f"Erro geral no DB: {e}")
+        return False
 
 def execute_read_query(query, params=(), fetch_one=False, use_pandas=False):
     """
-    Executa uma query de leitura (SELECT) com lógica de retry.
+    Executa uma query de leitura (SELECT) com a política de retry.
     Retorna resultado, DataFrame ou None/Empty dependendo dos parâmetros.
     """
-    max_retries = 5
-    conn = None
-    for attempt in range(max_retries):
+    def read(conn):
+        if use_pandas:
+            return pd.read_sql_query(query, conn, params=params)
+        c = conn.cursor()
+        c.execute(query, params)
+        if fetch_one:
+            return c.fetchone()
+        return c.fetchall()
+
+    try:
+        return run_with_retry(read)
+    except sqlite3.OperationalError as e:
+        print(f"Erro de leitura no DB: {e}")
+        return pd.DataFrame() if use_pandas else None
+    except Exception as e:
+        print(f"Erro geral de leitura: {e}")
+        return pd.DataFrame() if use_pandas else None
+
+# -------------------------------------------------------------------
+# Cache de Leitura
+# -------------------------------------------------------------------
+# Resultados compartilhados por todas as sessões do processo, cada um ligado
+# aos domínios de dados que lê (products, sales, users). Uma entrada só é
+# recalculada quando um desses domínios muda:
+#   - escritas deste processo chamam bump_version(domínio) na hora;
+#   - escritas de outros processos são detectadas por PRAGMA data_version numa
+#     conexão dedicada (custo de microssegundos) e, quando ele muda, pela
+#     tabela change_log, que diz quais domínios foram alterados.
+
+_cache_lock = threading.Lock()
+_local_versions = dict.fromkeys(CHANGE_LOG_DOMAINS, 0)
+_shared_versions = dict.fromkeys(CHANGE_LOG_DOMAINS, 0)
+_cache_entries = {}  # nome -> (db_name, versões dos domínios, valor)
+_cache_stats = {}    # nome -> {"hits": n, "misses": n}
+_watch_stats = {"checks": 0, "changes_seen": 0}
+_watcher = None      # (db_name, conexão, último data_version)
+_watcher_lock = threading.Lock()
+
+def bump_version(*domains):
+    """Invalida as entradas que dependem dos domínios. Chamar após escrever neles."""
+    with _cache_lock:
+        for domain in domains:
+            _local_versions[domain] += 1
+
+def _check_external_changes():
+    global _watcher
+    with _watcher_lock:
         try:
-            conn = get_connection()
-            if use_pandas:
-                return pd.read_sql_query(query, conn, params=params)
-            else:
-                c = conn.cursor()
-                c.execute(query, params)
-                if fetch_one:
-                    return c.fetchone()
-                else:
-                    return c.fetchall()
-        except sqlite3.OperationalError as e:
-            if "locked" in str(e).lower():
-                if attempt < max_retries - 1:
-                    time.sleep(1)
-                    if conn: conn.close()
-                    continue
-            print(f"Erro de leitura no DB (tentativa {attempt+1}): {e}")
-            return pd.DataFrame() if use_pandas else None
-        except Exception as e:
-            print(f"Erro geral de leitura: {e}")
-            return pd.DataFrame() if use_pandas else None
-        finally:
-            if conn: 
-                try: conn.close()
-                except: pass
-    return pd.DataFrame() if use_pandas else None
+            if _watcher is None or _watcher[0] != DB_NAME:
+                if _watcher is not None:
+                    _watcher[1].close()
+                conn = sqlite3.connect(DB_NAME, timeout=BUSY_TIMEOUT_MS / 1000, check_same_thread=False)
+                _watcher = (DB_NAME, conn, None)
+            db_name, conn, last_seen = _watcher
+            # data_version muda sempre que outra conexão (deste ou de outro
+            # processo) faz commit; só então vale a pena ler change_log
+            data_version = conn.execute("PRAGMA data_version").fetchone()[0]
+            if data_version == last_seen:
+                return
+            seqs = dict(conn.execute("SELECT domain, seq FROM change_log").fetchall())
+            _watcher = (db_name, conn, data_version)
+        except sqlite3.Error as e:
+            # Sem como saber o que mudou: invalida tudo
+            print(f"Erro ao verificar alterações no DB: {e}")
+            _watcher = None
+            bump_version(*CHANGE_LOG_DOMAINS)
+            return
+    with _cache_lock:
+        _watch_stats["checks"] += 1
+        for domain, seq in seqs.items():
+            if domain in _shared_versions and _shared_versions[domain] != seq:
+                _shared_versions[domain] = seq
+                _watch_stats["changes_seen"] += 1
+
+def cached_read(name, domains, loader):
+    """
+    Retorna o valor em cache de `name` ou chama loader() se algum dos domínios
+    mudou desde a última carga. Exceções de loader não entram no cache.
+    """
+    _check_external_changes()
+    with _cache_lock:
+        # Versões lidas antes da carga: uma escrita concorrente invalida o resultado
+        versions = tuple((_local_versions[d], _shared_versions[d]) for d in domains)
+        stats = _cache_stats.setdefault(name, {"hits": 0, "misses": 0})
+        entry = _cache_entries.get(name)
+        if entry is not None and entry[0] == DB_NAME and entry[1] == versions:
+            stats["hits"] += 1
+            return entry[2]
+    value = loader()
+    with _cache_lock:
+        stats["misses"] += 1
+        _cache_entries[name] = (DB_NAME, versions, value)
+    return value
+
+def clear_cache():
+    """Descarta todas as entradas e contadores (e a conexão de vigia). Usado ao trocar de banco."""
+    global _watcher
+    with _watcher_lock:
+        if _watcher is not None:
+            _watcher[1].close()
+        _watcher = None
+    with _cache_lock:
+        _cache_entries.clear()
+        _cache_stats.clear()
+        _watch_stats.update(checks=0, changes_seen=0)
+
+def get_cache_stats():
+    with _cache_lock:
+        return {
+            "entries": {name: dict(stats) for name, stats in _cache_stats.items()},
+            "versions": {d: _shared_versions[d] for d in CHANGE_LOG_DOMAINS},
+            **_watch_stats,
+        }
+
+# -------------------------------------------------------------------
+# Modelos de Linha
+# -------------------------------------------------------------------
+# Linhas tipadas (dataclasses com __slots__, imutáveis) montadas direto pelo
+# row_factory do cursor, sem tuplas posicionais nem Series do pandas. Cada
+# consulta seleciona exatamente os campos do modelo, na mesma ordem.
+
+@dataclass(slots=True, frozen=True)
+class SessionIdentity:
+    """O que fica em st.session_state['user']: só o necessário para rotear a página."""
+    id: int
+    role: str
+    name: str
+
+@dataclass(slots=True, frozen=True)
+class SessionUser:
+    """Usuário logado com os dados da tela (sem senha nem imagem); ver get_session_user."""
+    id: int
+    username: str
+    role: str
+    name: str
+    avatar_hash: Optional[str] = None
+
+@dataclass(slots=True, frozen=True)
+class Product:
+    """Produto do catálogo sem BLOBs (campos na ordem de CATALOG_COLUMNS)."""
+    id: int
+    name: str
+    brand: str
+    style: str
+    type: str
+    price: float
+    quantity: int
+    expiration_date: str
+    has_image: int  # 0/1
+    image_version: int
+    image_hash: Optional[str]
+
+@dataclass(slots=True, frozen=True)
+class ProductOption:
+    """Projeção mínima para listas de seleção (PDV)."""
+    id: int
+    name: str
+    price: float
+    quantity: int
+
+def fetch_models(conn, model, query, params=(), one=False):
+    """Executa o SELECT em conn montando cada linha como `model`."""
+    c = conn.cursor()
+    c.row_factory = lambda cursor, row: model(*row)
+    c.execute(query, params)
+    return c.fetchone() if one else c.fetchall()
+
+def query_rows(model, query, params=()):
+    """Lista de `model` com a política de retry (lista vazia em caso de erro)."""
+    try:
+        return run_with_retry(lambda conn: fetch_models(conn, model, query, params))
+    except Exception as e:
+        print(f"Erro de leitura no DB: {e}")
+        return []
+
+def query_row(model, query, params=()):
+    """Como query_rows, mas retorna só a primeira linha (ou None)."""
+    try:
+        return run_with_retry(lambda conn: fetch_models(conn, model, query, params, one=True))
+    except Exception as e:
+        print(f"Erro de leitura no DB: {e}")
+        return None
 
 # -------------------------------------------------------------------
 # Funções de Negócio Refatoradas
 # -------------------------------------------------------------------
 
-def check_login(username, password):
-    row = execute_read_query("SELECT * FROM users WHERE username = ?", (username,), fetch_one=True)
-    if row and bcrypt.checkpw(password.encode('utf-8'), row[2].encode('utf-8')):
-        return row
-    return None
+SESSION_USER_QUERY = '''
+    SELECT u.id, u.username, u.role, u.name, a.image_hash
+    FROM users u LEFT JOIN user_avatars a ON a.user_id = u.id
+    WHERE u.id = ?
+'''
+
+def fetch_session_user(user_id):
+    """
+    Dados do usuário logado, em cache até a próxima escrita em users (ou na
+    foto de perfil) feita por qualquer processo. None só se o usuário não
+    existir; erros de leitura levantam exceção (não encerre a sessão por eles).
+    """
+    def load():
+        return run_with_retry(lambda conn: fetch_models(conn, SessionUser, SESSION_USER_QUERY, (user_id,), one=True))
+    return cached_read(f"session_user:{user_id}", ("users",), load)
+
+def get_session_user(user_id):
+    """Como fetch_session_user, mas retorna None também em erro de leitura."""
+    try:
+        return fetch_session_user(user_id)
+    except Exception as e:
+        print(f"Erro de leitura no DB: {e}")
+        return None
+
+def session_identity(user):
+    return SessionIdentity(user.id, user.role, user.name)
+
+_session_secret_for = None
+
+def _session_secret():
+    """Chave de assinatura dos tokens: STORE_SESSION_SECRET ou a gerada na migração."""
+    global _session_secret_for
+    if os.environ.get("STORE_SESSION_SECRET"):
+        return os.environ["STORE_SESSION_SECRET"].encode("utf-8")
+    if _session_secret_for is None or _session_secret_for[0] != DB_NAME:
+        row = execute_read_query("SELECT value FROM app_settings WHERE key = 'session_secret'", fetch_one=True)
+        if not row:
+            raise RuntimeError("Segredo de sessão ausente (execute as migrações)")
+        _session_secret_for = (DB_NAME, row[0].encode("utf-8"))
+    return _session_secret_for[1]
+
+def create_session(user_id):
+    """Abre uma sessão e retorna o token (vai num cookie para sobreviver a um refresh); None em erro."""
+    token, session_id, expires_at = auth.new_session_token(_session_secret())
+
+    def write(conn):
+        # Aproveita para limpar as vencidas (índice em expires_at)
+        conn.execute("DELETE FROM sessions WHERE expires_at <= ?", (int(time.time()),))
+        conn.execute("INSERT INTO sessions (id_hash, user_id, expires_at) VALUES (?, ?, ?)",
+                     (auth.session_id_hash(session_id), user_id, expires_at))
+
+    try:
+        run_write(write)
+    except Exception as e:
+        print(f"Erro ao criar sessão: {e}")
+        return None
+    return token
+
+def resume_session(token):
+    """
+    SessionUser dono de um token válido (assinado, no prazo e não encerrado),
+    ou None. Não usa bcrypt: é o caminho de um refresh do navegador.
+    """
+    parsed = auth.parse_session_token(token, _session_secret())
+    if parsed is None:
+        return None
+    row = execute_read_query(
+        "SELECT user_id FROM sessions WHERE id_hash = ? AND expires_at > ?",
+        (auth.session_id_hash(parsed[0]), int(time.time())), fetch_one=True
+    )
+    return get_session_user(row[0]) if row else None
+
+def end_session(token):
+    """Logout: o token deixa de valer mesmo antes de vencer."""
+    parsed = auth.parse_session_token(token, _session_secret())
+    if parsed is None:
+        return False
+    return execute_write_query("DELETE FROM sessions WHERE id_hash = ?", (auth.session_id_hash(parsed[0]),))
+
+LOGIN_FAILED_MESSAGE = "Usuário ou senha incorretos."
+
+def authenticate(username, password, client_ip=None):
+    """
+    Login com limites de tentativa. Retorna (SessionUser, None) ou (None, mensagem).
+    O bcrypt roda no pool do módulo auth; a mesma senha errada repetida logo
+    em seguida é recusada sem recalcular o hash.
+    """
+    user_key = (username or "").strip().lower()
+    wait = max(auth.user_limiter.retry_after(user_key),
+               auth.ip_limiter.retry_after(client_ip) if client_ip else 0)
+    if wait:
+        auth.stats.add(rate_limited=1)
+        return None, f"Muitas tentativas. Tente novamente em {wait} s."
+
+    row = execute_read_query("SELECT id, password FROM users WHERE username = ?", (username,), fetch_one=True)
+    user_id, stored_hash = row if row else (None, None)
+    attempt = (user_key, password, stored_hash)
+    if attempt in auth.failed_attempts:
+        auth.stats.add(cache_hits=1)
+        _count_login_failure(user_key, client_ip)
+        return None, LOGIN_FAILED_MESSAGE
+
+    try:
+        ok = auth.verify_password(password, stored_hash)
+    except auth.AuthBusy:
+        return None, "Servidor ocupado. Tente novamente em instantes."
+    if not ok:
+        auth.failed_attempts.add(*attempt)
+        _count_login_failure(user_key, client_ip)
+        return None, LOGIN_FAILED_MESSAGE
+
+    auth.user_limiter.reset(user_key)
+    if auth.needs_rehash(stored_hash):
+        _rehash_password(user_id, password, stored_hash)
+    return get_session_user(user_id), None
+
+def _count_login_failure(user_key, client_ip):
+    # Só falhas contam: logins certos de muitos usuários atrás do mesmo IP
+    # (NAT, proxy) não podem esgotar o limite da loja inteira
+    auth.user_limiter.add(user_key)
+    if client_ip:
+        auth.ip_limiter.add(client_ip)
+
+def _rehash_password(user_id, password, old_hash):
+    """Refaz o hash com o custo atual; só grava se a senha não mudou nesse meio tempo."""
+    try:
+        new_hash = auth.hash_password(password)
+    except auth.AuthBusy:
+        return
+    if execute_write_query("UPDATE users SET password = ? WHERE id = ? AND password = ?", (new_hash, user_id, old_hash)):
+        auth.stats.add(rehashed=1)
+
+def check_login(username, password, client_ip=None):
+    return authenticate(username, password, client_ip)[0]
 
 def create_user(username, password, role, name, birth_date=None, email=None, phone=None, cpf=None, preferred_type=None, preferred_brand=None, preferred_style=None):
-    hashed = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt())
-    return execute_write_query(
+    try:
+        hashed = auth.hash_password(password)
+    except auth.AuthBusy as e:
+        print(f"Erro ao criar usuário: {e}")
+        return False
+    success = execute_write_query(
         "INSERT INTO users (username, password, role, name, birth_date, email, phone, cpf, preferred_type, preferred_brand, preferred_style) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
-        (username, hashed.decode('utf-8'), role, name, birth_date, email, phone, cpf, preferred_type, preferred_brand, preferred_style)
+        (username, hashed, role, name, birth_date, email, phone, cpf, preferred_type, preferred_brand, preferred_style)
     )
+    if success:
+        bump_version("users")
+    return success
 
 def update_user_image(user_id, image_bytes):
-    success = execute_write_query("UPDATE users SET profile_image = ? WHERE id = ?", (image_bytes, user_id))
-    if success:
-        return execute_read_query("SELECT * FROM users WHERE id = ?", (user_id,), fetch_one=True)
-    return None
+    """
+    Grava a foto de perfil no store de imagens (com miniatura) e retorna o
+    registro de sessão atualizado, ou None em caso de erro.
+    """
+    record = _prepare_image(image_bytes)
+
+    def write(conn):
+        # Foto nova, referência e limpeza da foto anterior numa só transação
+        image_hash = _write_image(conn, image_bytes, record)
+        conn.execute("INSERT OR REPLACE INTO user_avatars (user_id, image_hash) VALUES (?, ?)", (user_id, image_hash))
+        conn.execute(DELETE_ORPHAN_IMAGES_QUERY)
+
+    try:
+        run_write(write)
+    except Exception as e:
+        print(f"Erro ao atualizar foto de perfil: {e}")
+        return None
+    bump_version("users")
+    return get_session_user(user_id)
+
+def _birthday_keys(date):
+    """Chaves MM-DD que fazem aniversário na data (29/02 comemora em 28/02 fora de ano bissexto)."""
+    keys = [date.strftime("%m-%d")]
+    if (date.month, date.day) == (2, 28) and not calendar.isleap(date.year):
+        keys.append("02-29")
+    return keys
+
+BIRTHDAY_COLUMNS = ["name", "phone", "email", "birth_date"]
+
+def _query_birthdays(keys):
+    """Levanta exceção em erro de leitura (para o erro não ficar no cache)."""
+    placeholders = ", ".join("?" for _ in keys)
+    # A expressão e o filtro de role precisam ser iguais aos do índice parcial
+    query = f"""SELECT {", ".join(BIRTHDAY_COLUMNS)}, {BIRTHDAY_KEY_SQL} AS birthday_key FROM users
+                WHERE role = 'cliente' AND {BIRTHDAY_KEY_SQL} IN ({placeholders})
+                ORDER BY name"""
+    return run_with_retry(lambda conn: pd.read_sql_query(query, conn, params=tuple(keys)))
 
-def get_birthday_clients():
-    return execute_read_query(
-        "SELECT * FROM users WHERE role='cliente' AND birth_date IS NOT NULL AND birth_date != ''", 
-        use_pandas=True
+def get_birthdays_on(month, day, year=None):
+    """
+    Clientes que fazem aniversário no dia (apenas nome, telefone, email e nascimento).
+    Em cache até a próxima alteração em users; trate o DataFrame como somente leitura.
+    Em erro de leitura, retorna um DataFrame vazio com as mesmas colunas.
+    """
+    date = datetime.date(year or datetime.date.today().year, month, day)
+    try:
+        return cached_read(f"birthdays:{date.isoformat()}", ("users",),
+                           lambda: _query_birthdays(_birthday_keys(date)).drop(columns=["birthday_key"]))
+    except Exception as e:
+        print(f"Erro de leitura no DB: {e}")
+        return pd.DataFrame(columns=BIRTHDAY_COLUMNS)
+
+def get_upcoming_birthdays(days=7, today=None):
+    """
+    Aniversariantes de hoje (ou de `today`) até days-1 dias à frente, com a
+    coluna days_until. Em erro de leitura, retorna um DataFrame vazio com as
+    mesmas colunas.
+    """
+    today = today or datetime.date.today()
+    days_until = {}
+    for offset in range(days):
+        for key in _birthday_keys(today + datetime.timedelta(days=offset)):
+            days_until.setdefault(key, offset)
+    try:
+        df = _query_birthdays(list(days_until))
+    except Exception as e:
+        print(f"Erro de leitura no DB: {e}")
+        return pd.DataFrame(columns=BIRTHDAY_COLUMNS + ["days_until"])
+    df["days_until"] = df["birthday_key"].map(days_until)
+    return df.drop(columns=["birthday_key"]).sort_values(["days_until", "name"], ignore_index=True)
+
+def _prepare_image(image_bytes):
+    """
+    _image_record calculado fora da transação (o Pillow não segura o lock de
+    escrita), ou None se o store já tem a imagem (sem reprocessar).
+    """
+    digest = images.content_hash(image_bytes)
+    if execute_read_query("SELECT 1 FROM images WHERE hash=?", (digest,), fetch_one=True):
+        return None
+    return _image_record(image_bytes)
+
+def _write_image(conn, image_bytes, record=None):
+    """
+    Garante a imagem no store dentro da transação de quem vai referenciá-la e
+    retorna o hash. Gravar a imagem e a referência juntas impede que uma
+    limpeza de órfãs concorrente apague a imagem entre uma escrita e outra.
+    """
+    digest = record[0] if record else images.content_hash(image_bytes)
+    if not conn.execute("SELECT 1 FROM images WHERE hash=?", (digest,)).fetchone():
+        # Sumiu desde _prepare_image (limpeza de órfãs): processa aqui mesmo
+        conn.execute(INSERT_IMAGE_QUERY, record or _image_record(image_bytes))
+    return digest
+
+def store_image(image_bytes):
+    """
+    Grava uma imagem no store endereçado por conteúdo e retorna seu hash.
+    Uploads idênticos reaproveitam a mesma linha (sem reprocessar).
+    Sem referência, a imagem é candidata à próxima limpeza de órfãs: para
+    ligá-la a um produto ou usuário, use _write_image na mesma transação.
+    """
+    record = _prepare_image(image_bytes)
+    try:
+        return run_write(lambda conn: _write_image(conn, image_bytes, record))
+    except Exception as e:
+        print(f"Erro ao gravar imagem: {e}")
+        return None
+
+def get_image(image_hash, variant="original"):
+    """Bytes de uma variante (thumb, preview, original); cai para o original se faltar o derivado."""
+    if variant not in images.VARIANTS:
+        raise ValueError(f"Variante de imagem inválida: {variant}")
+    row = execute_read_query(
+        f"SELECT COALESCE({variant}, original) FROM images WHERE hash=?", (image_hash,), fetch_one=True
     )
+    return row[0] if row else None
+
+def get_image_media(image_hash, variant="original"):
+    """(mime, bytes) de uma variante, para servir por HTTP; None se o hash não existir."""
+    if variant not in images.VARIANTS:
+        raise ValueError(f"Variante de imagem inválida: {variant}")
+    row = execute_read_query(
+        f"SELECT mime, COALESCE({variant}, original) FROM images WHERE hash=?", (image_hash,), fetch_one=True
+    )
+    return tuple(row) if row else None
+
+def get_images(image_hashes, variant="thumb"):
+    """Várias imagens de uma vez: {hash: bytes}. Hashes inexistentes ficam de fora."""
+    if variant not in images.VARIANTS:
+        raise ValueError(f"Variante de imagem inválida: {variant}")
+    hashes = list(dict.fromkeys(h for h in image_hashes if h))
+    found = {}
+    # Lotes de 500, abaixo do limite de parâmetros do SQLite
+    for start in range(0, len(hashes), 500):
+        batch = hashes[start:start + 500]
+        placeholders = ", ".join("?" for _ in batch)
+        rows = execute_read_query(
+            f"SELECT hash, COALESCE({variant}, original) FROM images WHERE hash IN ({placeholders})", tuple(batch)
+        )
+        found.update(rows or [])
+    return found
+
+DELETE_ORPHAN_IMAGES_QUERY = '''
+    DELETE FROM images
+    WHERE hash NOT IN (SELECT image_hash FROM products WHERE image_hash IS NOT NULL)
+      AND hash NOT IN (SELECT image_hash FROM user_avatars)
+'''
+
+def delete_orphan_images():
+    """Remove imagens que nenhum produto nem foto de perfil referencia."""
+    return execute_write_query(DELETE_ORPHAN_IMAGES_QUERY)
 
 def add_product(nome, marca, estilo, tipo, preco, quantidade, data_validade, image_bytes, id=None):
     if id is not None:
         # Check exists
         exists = execute_read_query("SELECT id FROM products WHERE id=?", (id,), fetch_one=True)
         if exists:
-            if image_bytes:
-                return execute_write_query(
-                    '''UPDATE products SET name=?, brand=?, style=?, type=?, price=?, quantity=?, expiration_date=?, image=? WHERE id=?''',
-                    (nome, marca, estilo, tipo, preco, quantidade, data_validade, image_bytes, id)
-                )
-            else:
-                return execute_write_query(
-                    '''UPDATE products SET name=?, brand=?, style=?, type=?, price=?, quantity=?, expiration_date=? WHERE id=?''',
-                    (nome, marca, estilo, tipo, preco, quantidade, data_validade, id)
-                )
-        else:
-            return execute_write_query(
-                '''INSERT INTO products (id, name, brand, style, type, price, quantity, expiration_date, image) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)''',
-                (id, nome, marca, estilo, tipo, preco, quantidade, data_validade, image_bytes)
-            )
-    else:
-        return execute_write_query(
-            '''INSERT INTO products (name, brand, style, type, price, quantity, expiration_date, image) VALUES (?, ?, ?, ?, ?, ?, ?, ?)''',
-            (nome, marca, estilo, tipo, preco, quantidade, data_validade, image_bytes)
+            return update_product(id, nome, marca, estilo, tipo, preco, quantidade, data_validade, image_bytes)
+
+    record = _prepare_image(image_bytes) if image_bytes else None
+
+    def write(conn):
+        # Imagem e produto na mesma transação
+        image_hash = _write_image(conn, image_bytes, record) if image_bytes else None
+        conn.execute(
+            '''INSERT INTO products (id, name, brand, style, type, price, quantity, expiration_date, image_hash, image_version) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''',
+            (id, nome, marca, estilo, tipo, preco, quantidade, data_validade, image_hash, 1 if image_hash else 0)
         )
 
+    try:
+        run_write(write)
+    except Exception as e:
+        print(f"Erro ao adicionar produto: {e}")
+        return False
+    bump_version("products")
+    return True
+
+# Colunas escalares do catálogo. Nenhum BLOB entra aqui: has_image, image_version
+# e image_hash bastam para a tela decidir se (e qual) imagem buscar.
+CATALOG_COLUMNS = """id, name, brand, style, type, price, quantity, expiration_date,
+                     image_hash IS NOT NULL AS has_image, image_version, image_hash"""
+
+def get_catalog():
+    """
+    Catálogo de produtos sem imagens, em cache (ver cached_read).
+    O DataFrame retornado é compartilhado entre sessões: trate como somente
+    leitura (use .copy() antes de alterar).
+    """
+    try:
+        return cached_read("catalog", ("products",), lambda: run_with_retry(
+            lambda conn: pd.read_sql_query(f"SELECT {CATALOG_COLUMNS} FROM products", conn)
+        ))
+    except Exception as e:
+        print(f"Erro de leitura no DB: {e}")
+        return pd.DataFrame()
+
 def get_products():
-    return execute_read_query("SELECT * FROM products", use_pandas=True)
+    return get_catalog()
+
+def build_fts_query(text):
+    """
+    Converte o texto digitado em uma consulta FTS5 segura: cada palavra vira um
+    termo entre aspas com busca por prefixo, e todas precisam aparecer.
+    """
+    terms = re.findall(r"\w+", text or "")
+    return " ".join(f'"{term}"*' for term in terms)
+
+def search_products(query, limit=24, offset=0):
+    """
+    Busca textual no catálogo (sem imagens), ordenada por relevância.
+    Ignora acentos e maiúsculas e casa prefixos ("ton" encontra "Tônico").
+    Retorna (lista de Product da página, total de resultados).
+    """
+    match = build_fts_query(query)
+    if not match:
+        return get_products_page(limit, offset)
+
+    total = execute_read_query(
+        "SELECT COUNT(*) FROM products_fts WHERE products_fts MATCH ?", (match,), fetch_one=True
+    )
+    total = total[0] if total else 0
+    weights = ", ".join(str(w) for w in FTS_WEIGHTS)
+    page = query_rows(
+        Product,
+        f"""SELECT {CATALOG_COLUMNS} FROM products
+            JOIN (SELECT rowid AS hit_id, bm25(products_fts, {weights}) AS score
+                  FROM products_fts WHERE products_fts MATCH ?
+                  ORDER BY score LIMIT ? OFFSET ?) hits ON products.id = hits.hit_id
+            ORDER BY hits.score""",
+        (match, limit, offset)
+    )
+    return page, total
+
+def get_products_page(limit, offset=0, search=None):
+    """
+    Uma página do catálogo (sem imagens).
+    Com search, delega para search_products (ordem por relevância); sem, ordena por id.
+    Retorna (lista de Product da página, total de produtos que atendem à busca).
+    """
+    if search and build_fts_query(search):
+        return search_products(search, limit, offset)
+    total = execute_read_query("SELECT COUNT(*) FROM products", fetch_one=True)
+    total = total[0] if total else 0
+    page = query_rows(Product, f"SELECT {CATALOG_COLUMNS} FROM products ORDER BY id LIMIT ? OFFSET ?", (limit, offset))
+    return page, total
+
+def get_product_options():
+    """Produtos com estoque para o seletor do PDV, em cache até a próxima alteração em products."""
+    query = "SELECT id, name, price, quantity FROM products WHERE quantity > 0 ORDER BY id"
+    try:
+        return cached_read("product_options", ("products",),
+                           lambda: tuple(run_with_retry(lambda conn: fetch_models(conn, ProductOption, query))))
+    except Exception as e:
+        print(f"Erro de leitura no DB: {e}")
+        return ()
 
 def update_product(id, nome, marca, estilo, tipo, preco, quantidade, data_validade, image_bytes=None):
     if image_bytes:
-        return execute_write_query(
-            '''UPDATE products SET name=?, brand=?, style=?, type=?, price=?, quantity=?, expiration_date=?, image=? WHERE id=?''',
-            (nome, marca, estilo, tipo, preco, quantidade, data_validade, image_bytes, id)
-        )
+        record = _prepare_image(image_bytes)
+
+        def write(conn):
+            # Nova imagem, referência e limpeza da imagem antiga numa só transação
+            image_hash = _write_image(conn, image_bytes, record)
+            conn.execute(
+                '''UPDATE products SET name=?, brand=?, style=?, type=?, price=?, quantity=?, expiration_date=?, image_hash=?, image_version=image_version+1 WHERE id=?''',
+                (nome, marca, estilo, tipo, preco, quantidade, data_validade, image_hash, id)
+            )
+            conn.execute(DELETE_ORPHAN_IMAGES_QUERY)
+
+        try:
+            run_write(write)
+        except Exception as e:
+            print(f"Erro ao atualizar produto: {e}")
+            return False
+        bump_version("products")
+        return True
     else:
-        return execute_write_query(
+        success = execute_write_query(
             '''UPDATE products SET name=?, brand=?, style=?, type=?, price=?, quantity=?, expiration_date=? WHERE id=?''',
             (nome, marca, estilo, tipo, preco, quantidade, data_validade, id)
         )
+        if success:
+            bump_version("products")
+        return success
 
 def delete_product(id):
-    return execute_write_query("DELETE FROM products WHERE id=?", (id,))
+    success = execute_write_query("DELETE FROM products WHERE id=?", (id,))
+    if success:
+        bump_version("products")
+        delete_orphan_images()
+    return success
 
 def get_product_by_id(id):
-    return execute_read_query("SELECT * FROM products WHERE id=?", (id,), fetch_one=True)
+    return query_row(Product, f"SELECT {CATALOG_COLUMNS} FROM products WHERE id=?", (id,))
+
+# -------------------------------------------------------------------
+# Importação em Massa
+# -------------------------------------------------------------------
+
+# Linhas por executemany dentro da transação de importação
+IMPORT_BATCH_SIZE = 500
+
+UPSERT_PRODUCT_QUERY = '''
+    INSERT INTO products (id, name, brand, style, type, price, quantity, expiration_date)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT(id) DO UPDATE SET
+        name=excluded.name, brand=excluded.brand, style=excluded.style, type=excluded.type,
+        price=excluded.price, quantity=excluded.quantity, expiration_date=excluded.expiration_date
+'''
+
+def _text_column(df, col, default=""):
+    if col not in df.columns:
+        return pd.Series(default, index=df.index, dtype=object)
+    return df[col].astype("string").str.strip().fillna(default).astype(object)
+
+def _number_column(df, col):
+    if col not in df.columns:
+        return pd.Series(float("nan"), index=df.index)
+    values = df[col]
+    if not pd.api.types.is_numeric_dtype(values):
+        # Aceita vírgula decimal ("10,50"), comum em planilhas brasileiras
+        values = values.astype("string").str.strip().str.replace(",", ".", regex=False)
+    return pd.to_numeric(values, errors="coerce")
+
+def normalize_import_frame(df):
+    """
+    Valida e normaliza, de forma vetorizada, um DataFrame no formato do CSV
+    exportado (nome, marca, estilo, tipo, preco, quantidade, data_validade, id).
+    Retorna (tuplas prontas para UPSERT_PRODUCT_QUERY, número da linha no arquivo
+    de cada tupla, lista de erros).
+    """
+    import utils  # importado aqui: utils depende deste módulo
+
+    names = _text_column(df, "nome")
+    brands = _text_column(df, "marca", "Outra")
+    styles = _text_column(df, "estilo", "Outro")
+    types = _text_column(df, "tipo", "Outro")
+    # Valores fora das listas do sistema viram 'Outra'/'Outro'
+    brands = brands.where(brands.isin(utils.MARCAS), "Outra")
+    styles = styles.where(styles.isin(utils.ESTILOS), "Outro")
+    types = types.where(types.isin(utils.TIPOS), "Outro")
+
+    prices = _number_column(df, "preco")
+    prices = prices.where(prices >= 0, 0.0)
+    quantities = _number_column(df, "quantidade")
+    quantities = quantities.where(quantities >= 0, 0).astype("int64")
+    exp_dates = _text_column(df, "data_validade")
+
+    ids = _number_column(df, "id")
+    ids = ids.where(ids.notna() & (ids > 0) & (ids == ids.round()))
+
+    valid = names != ""
+    errors = [f"Linha {index + 2}: Desconhecido - Nome do produto vazio" for index in df.index[~valid]]
+
+    line_numbers = [index + 2 for index in df.index[valid]]
+    rows = list(zip(
+        [None if pd.isna(v) else int(v) for v in ids[valid]],
+        names[valid], brands[valid], styles[valid], types[valid],
+        prices[valid].astype(float), quantities[valid].astype(int), exp_dates[valid],
+    ))
+    return rows, line_numbers, errors
+
+def _upsert_products_batch(c, batch, line_numbers, errors):
+    """Grava um lote; se o lote falhar, refaz linha a linha para apontar qual linha quebrou."""
+    c.execute("SAVEPOINT import_batch")
+    try:
+        c.executemany(UPSERT_PRODUCT_QUERY, batch)
+        c.execute("RELEASE import_batch")
+        return len(batch)
+    except sqlite3.OperationalError:
+        raise
+    except sqlite3.DatabaseError:
+        c.execute("ROLLBACK TO import_batch")
+
+    imported = 0
+    for row, line in zip(batch, line_numbers):
+        try:
+            c.execute(UPSERT_PRODUCT_QUERY, row)
+            imported += 1
+        except sqlite3.OperationalError:
+            raise
+        except sqlite3.DatabaseError as e:
+            errors.append(f"Linha {line}: {row[1]} - {e}")
+    c.execute("RELEASE import_batch")
+    return imported
+
+def import_products(df):
+    """
+    Importa/atualiza produtos em massa numa única transação (upsert por id).
+    Retorna {"imported": n, "failed": n, "errors": [mensagens por linha]}.
+    """
+    rows, line_numbers, errors = normalize_import_frame(df)
+
+    def upsert_all(conn):
+        c = conn.cursor()
+        db_errors = []
+        imported = 0
+        for start in range(0, len(rows), IMPORT_BATCH_SIZE):
+            imported += _upsert_products_batch(
+                c, rows[start:start + IMPORT_BATCH_SIZE],
+                line_numbers[start:start + IMPORT_BATCH_SIZE], db_errors
+            )
+        return imported, db_errors
+
+    try:
+        imported, db_errors = run_write(upsert_all)
+    except Exception as e:
+        print(f"Erro na importação: {e}")
+        return {"imported": 0, "failed": len(rows) + len(errors),
+                "errors": errors + [f"Erro de banco de dados: {e}"]}
+    if imported:
+        bump_version("products")
+    errors = errors + db_errors
+    return {"imported": imported, "failed": len(errors), "errors": errors}
+
+# Tamanho padrão dos blocos lidos do CSV (cada bloco é uma transação)
+IMPORT_CHUNK_SIZE = 20000
+# Bytes do início do arquivo usados para detectar o separador
+CSV_SNIFF_BYTES = 64 * 1024
+# Limite de mensagens de erro guardadas no relatório (a contagem continua exata)
+MAX_IMPORT_ERRORS = 1000
+
+def sniff_csv_dialect(file):
+    """Detecta o dialeto pelos primeiros KB do arquivo e volta o cursor ao início."""
+    sample = file.read(CSV_SNIFF_BYTES)
+    file.seek(0)
+    if isinstance(sample, bytes):
+        sample = sample.decode("utf-8-sig", errors="ignore")
+    try:
+        return csv.Sniffer().sniff(sample, delimiters=",;\t|")
+    except csv.Error:
+        return csv.excel  # vírgula
+
+def import_products_csv(file, chunksize=IMPORT_CHUNK_SIZE, progress=None):
+    """
+    Importação em streaming: lê o CSV em blocos com o parser C do pandas e grava
+    cada bloco em sua própria transação, com memória limitada ao tamanho do bloco.
+    progress(fração, relatório_parcial) é chamado uma vez por bloco.
+    Levanta ValueError se faltar a coluna 'nome'.
+    """
+    dialect = sniff_csv_dialect(file)
+    file.seek(0, os.SEEK_END)
+    total_bytes = file.tell() or 1
+    file.seek(0)
+
+    report = {"imported": 0, "failed": 0, "errors": []}
+    reader = pd.read_csv(
+        file, sep=dialect.delimiter, quotechar=dialect.quotechar or '"', engine="c",
+        dtype=str, keep_default_na=False, na_values=[""], encoding="utf-8-sig", chunksize=chunksize,
+    )
+    with reader:
+        for chunk in reader:
+            if "nome" not in chunk.columns:
+                raise ValueError("O arquivo CSV deve conter pelo menos a coluna 'nome'.")
+            chunk_report = import_products(chunk)
+            report["imported"] += chunk_report["imported"]
+            report["failed"] += chunk_report["failed"]
+            room = MAX_IMPORT_ERRORS - len(report["errors"])
+            if room > 0:
+                report["errors"].extend(chunk_report["errors"][:room])
+            if progress:
+                progress(min(file.tell() / total_bytes, 1.0), report)
+    return report
 
 def get_sales_report():
     query = '''
@@ -253,67 +1591,279 @@ def get_sales_report():
     '''
     return execute_read_query(query, use_pandas=True)
 
-def register_sale(product_id, quantity, user_id=None):
+def rebuild_sales_daily():
+    """Recalcula o rollup sales_daily a partir do histórico completo de vendas (backfill)."""
+    def rebuild(conn):
+        conn.execute("DELETE FROM sales_daily")
+        conn.execute(SALES_DAILY_BACKFILL_QUERY)
+        # sales_daily não tem trigger de change_log: avisa os outros processos aqui
+        conn.execute("UPDATE change_log SET seq = seq + 1 WHERE domain = 'sales'")
+        return conn.execute("SELECT COUNT(*) FROM sales_daily").fetchone()[0]
+
+    try:
+        rows = run_write(rebuild)
+        bump_version("sales")
+        return rows
+    except Exception as e:
+        print(f"Erro ao recalcular sales_daily: {e}")
+        return None
+
+def get_sales_by_day(days=30):
+    """Unidades, receita e número de vendas por dia nos últimos `days` dias (do rollup)."""
+    where, params = _rollup_period(days)
+    return execute_read_query(f'''
+        SELECT d.day, SUM(d.units) AS units, SUM(d.revenue) AS revenue, SUM(d.sale_count) AS sale_count
+        FROM sales_daily d
+        {where}
+        GROUP BY d.day ORDER BY d.day
+    ''', params, use_pandas=True)
+
+def _rollup_period(days):
+    """Filtro WHERE de sales_daily para os últimos `days` dias (None = todo o período)."""
+    if not days:
+        return "", ()
+    return "WHERE d.day >= date('now', ?)", (f"-{int(days) - 1} days",)
+
+def get_sales_by_product(days=None, limit=10):
+    """Produtos mais vendidos (por receita), opcionalmente só nos últimos `days` dias."""
+    where, params = _rollup_period(days)
+    return execute_read_query(f'''
+        SELECT d.product_id, p.name AS product_name, SUM(d.units) AS units, SUM(d.revenue) AS revenue
+        FROM sales_daily d LEFT JOIN products p ON p.id = d.product_id
+        {where}
+        GROUP BY d.product_id ORDER BY revenue DESC LIMIT ?
+    ''', params + (limit,), use_pandas=True)
+
+def get_sales_by_seller(days=None):
+    """Vendas por funcionário/usuário, opcionalmente só nos últimos `days` dias."""
+    where, params = _rollup_period(days)
+    return execute_read_query(f'''
+        SELECT d.seller_id, u.name AS user_name, SUM(d.units) AS units, SUM(d.revenue) AS revenue,
+               SUM(d.sale_count) AS sale_count
+        FROM sales_daily d LEFT JOIN users u ON u.id = d.seller_id
+        {where}
+        GROUP BY d.seller_id ORDER BY revenue DESC
+    ''', params, use_pandas=True)
+
+def get_dashboard_metrics():
     """
-    Transação complexa: Verifica estoque, atualiza e insere venda.
-    Precisa de controle manual de transação para garantir integridade.
+    Totais do painel administrativo calculados no SQLite, numa única ida ao banco.
+    Os totais de vendas vêm do rollup sales_daily, não do histórico bruto.
+    Em cache até a próxima alteração em products ou sales.
     """
-    max_retries = 5
-    conn = None
-    
-    for attempt in range(max_retries):
-        try:
-            conn = get_connection()
-            c = conn.cursor()
-            
-            # Verificar estoque e preço (dentro da mesma conexão para consistência)
-            c.execute("SELECT price, quantity FROM products WHERE id=?", (product_id,))
+    query = '''
+        SELECT
+            (SELECT COUNT(*) FROM products),
+            (SELECT COALESCE(SUM(quantity), 0) FROM products),
+            (SELECT COALESCE(SUM(price * quantity), 0) FROM products),
+            (SELECT COALESCE(SUM(units), 0) FROM sales_daily),
+            (SELECT COALESCE(SUM(revenue), 0) FROM sales_daily),
+            (SELECT COALESCE(SUM(sale_count), 0) FROM sales_daily)
+    '''
+    keys = ("product_count", "total_stock", "total_stock_value", "total_sold", "total_revenue", "sale_count")
+    try:
+        row = cached_read("dashboard_metrics", ("products", "sales"),
+                          lambda: run_with_retry(lambda conn: conn.execute(query).fetchone()))
+    except Exception as e:
+        print(f"Erro de leitura no DB: {e}")
+        row = None
+    if not row:
+        return dict.fromkeys(keys, 0)
+    return dict(zip(keys, row))
+
+def get_recent_sales(limit=10):
+    """Últimas vendas (mais recentes primeiro), usando o índice em sales.sale_date."""
+    query = '''
+        SELECT s.id, p.name as product_name, s.quantity, s.total_value, s.sale_date, u.name as user_name
+        FROM sales s
+        LEFT JOIN products p ON s.product_id = p.id
+        LEFT JOIN users u ON s.user_id = u.id
+        ORDER BY s.sale_date DESC
+        LIMIT ?
+    '''
+    return execute_read_query(query, (limit,), use_pandas=True)
+
+class CheckoutError(Exception):
+    """Linhas do carrinho que impediram o pedido (desfaz a transação)."""
+
+    def __init__(self, failures):
+        super().__init__("; ".join(f["message"] for f in failures))
+        self.failures = failures
+
+def _merge_cart(cart):
+    """
+    Soma linhas repetidas do mesmo produto, preservando a ordem do carrinho.
+    Retorna [(product_id, quantidade, preços exibidos ao operador)].
+    """
+    merged = {}
+    for item in cart:
+        product_id = int(item["product_id"])
+        quantity, shown_prices = merged.get(product_id, (0, set()))
+        if item.get("unit_price") is not None:
+            shown_prices.add(float(item["unit_price"]))
+        merged[product_id] = (quantity + int(item["quantity"]), shown_prices)
+    return [(product_id, quantity, prices) for product_id, (quantity, prices) in merged.items()]
+
+def checkout(cart, user_id=None):
+    """
+    Finaliza um pedido com vários itens numa única transação (BEGIN IMMEDIATE).
+    cart: lista de dicts com product_id, quantity e, opcionalmente, unit_price
+    (o preço mostrado ao operador).
+    Tudo ou nada: se qualquer linha falhar (produto inexistente, estoque
+    insuficiente, preço diferente do mostrado), nada é gravado.
+    Retorna (sucesso, mensagem, falhas por linha [{product_id, message}]);
+    falhas de preço trazem também current_price, para o carrinho ser atualizado.
+    """
+    lines = _merge_cart(cart)
+    if not lines:
+        return False, "Carrinho vazio", []
+    invalid = [{"product_id": pid, "message": "Quantidade inválida"} for pid, qty, _ in lines if qty <= 0]
+    if invalid:
+        return False, "Há itens com quantidade inválida", invalid
+
+    def place_order(conn):
+        c = conn.cursor()
+        failures = []
+        priced_lines = []
+        for product_id, quantity, shown_prices in lines:
+            c.execute("SELECT name, price, quantity FROM products WHERE id=?", (product_id,))
             res = c.fetchone()
-            
             if not res:
-                return False, "Produto não encontrado"
-            
-            price, current_qty = res
-            if current_qty < quantity:
-                return False, "Estoque insuficiente"
-            
-            total_value = price * quantity
-            
-            # Atualizar estoque
-            c.execute("UPDATE products SET quantity = quantity - ? WHERE id=?", (quantity, product_id))
-            
-            # Registrar venda
-            c.execute("INSERT INTO sales (product_id, quantity, total_value, user_id) VALUES (?, ?, ?, ?)",
-                      (product_id, quantity, total_value, user_id))
-            
-            conn.commit()
-            return True, "Venda realizada com sucesso"
-            
-        except sqlite3.OperationalError as e:
-            if "locked" in str(e).lower():
-                if attempt < max_retries - 1:
-                    time.sleep(1)
-                    if conn: 
-                        try: conn.rollback()
-                        except: pass
-                        conn.close()
-                    continue
-            print(f"Erro transação venda (tentativa {attempt+1}): {e}")
-            if conn: 
-                try: conn.rollback()
-                except: pass
-            return False, f"Erro de banco de dados: {e}"
-            
-        except Exception as e:
-            print(f"Erro na venda: {e}")
-            if conn: 
-                try: conn.rollback()
-                except: pass
-            return False, f"Erro ao processar venda: {e}"
-            
-        finally:
-            if conn: 
-                try: conn.close()
-                except: pass
-                
-    return False, "Sistema ocupado, tente novamente."
+                failures.append({"product_id": product_id, "message": "Produto não encontrado"})
+                continue
+            name, price, current_qty = res
+            # O cliente paga o total que viu: preço alterado depois de entrar no carrinho recusa o pedido
+            changed = [shown for shown in shown_prices if abs(shown - price) >= 0.005]
+            if changed:
+                failures.append({"product_id": product_id, "current_price": price,
+                                 "message": f"Preço de {name} mudou de R$ {changed[0]:.2f} para R$ {price:.2f}"})
+                continue
+            # Baixa condicional: nunca deixa o estoque negativo
+            c.execute("UPDATE products SET quantity = quantity - ? WHERE id=? AND quantity >= ?",
+                      (quantity, product_id, quantity))
+            if c.rowcount == 0:
+                failures.append({"product_id": product_id,
+                                 "message": f"Estoque insuficiente para {name} (disponível: {current_qty})"})
+                continue
+            priced_lines.append((product_id, quantity, price, price * quantity))
+        
+        if failures:
+            # Exceção desfaz as baixas já feitas nas outras linhas
+            raise CheckoutError(failures)
+        
+        order_total = sum(line[3] for line in priced_lines)
+        c.execute("INSERT INTO orders (user_id, total_value, item_count) VALUES (?, ?, ?)",
+                  (user_id, order_total, len(priced_lines)))
+        order_id = c.lastrowid
+        c.executemany("INSERT INTO order_items (order_id, product_id, quantity, unit_price, line_total) VALUES (?, ?, ?, ?, ?)",
+                      [(order_id,) + line for line in priced_lines])
+        c.executemany("INSERT INTO sales (product_id, quantity, total_value, user_id, order_id) VALUES (?, ?, ?, ?, ?)",
+                      [(product_id, quantity, line_total, user_id, order_id)
+                       for product_id, quantity, _, line_total in priced_lines])
+        return order_id
+    
+    try:
+        # run_write usa BEGIN IMMEDIATE: trava de escrita já no início evita
+        # deadlock de upgrade leitura->escrita entre caixas simultâneos
+        run_write(place_order)
+        bump_version("products", "sales")
+        return True, "Venda realizada com sucesso", []
+    except CheckoutError as e:
+        return False, "Pedido não finalizado: verifique os itens", e.failures
+    except sqlite3.OperationalError as e:
+        print(f"Erro transação venda: {e}")
+        if _is_lock_error(e):
+            return False, "Sistema ocupado, tente novamente.", []
+        return False, f"Erro de banco de dados: {e}", []
+    except Exception as e:
+        print(f"Erro na venda: {e}")
+        return False, f"Erro ao processar venda: {e}", []
+
+def register_sale(product_id, quantity, user_id=None):
+    """Venda de um único produto: um pedido de uma linha. Retorna (sucesso, mensagem)."""
+    success, msg, failures = checkout([{"product_id": product_id, "quantity": quantity}], user_id)
+    if failures:
+        return False, failures[0]["message"]
+    return success, msg
+
+
+def reconcile_assets(directory="assets", dry_run=False, prune=False):
+    """
+    Reconcilia os arquivos legados assets/<id>_* com o store de imagens, que
+    passa a ser a única fonte das fotos de produto:
+      - imported:  produto sem imagem; o arquivo vira a imagem dele;
+      - in_db:     o produto já tem exatamente esta imagem;
+      - conflict:  o produto tem outra imagem (a do banco prevalece);
+      - orphan:    nenhum produto com este id.
+    Com prune, apaga os arquivos cujo conteúdo ficou guardado no banco
+    (imported e in_db). Com dry_run, só conta. Retorna as contagens.
+    """
+    import asset_index
+
+    report = {"imported": 0, "in_db": 0, "conflict": 0, "orphan": 0, "pruned": 0, "failed": 0}
+    for product_id, path in asset_index.scan_assets(directory):
+        product = get_product_by_id(product_id)
+        if product is None:
+            report["orphan"] += 1
+            continue
+        with open(path, "rb") as f:
+            data = f.read()
+        if product.has_image:
+            status = "in_db" if product.image_hash == images.content_hash(data) else "conflict"
+        elif dry_run:
+            status = "imported"
+        else:
+            record = _prepare_image(data)
+
+            def write(conn, data=data, record=record, product_id=product_id):
+                # Imagem e referência juntas; só preenche se ninguém deu imagem ao produto no meio tempo
+                image_hash = _write_image(conn, data, record)
+                updated = conn.execute(
+                    "UPDATE products SET image_hash = ?, image_version = image_version + 1 WHERE id = ? AND image_hash IS NULL",
+                    (image_hash, product_id)
+                ).rowcount
+                if not updated:
+                    conn.execute(DELETE_ORPHAN_IMAGES_QUERY)
+                return updated
+
+            try:
+                imported = run_write(write)
+            except Exception as e:
+                print(f"Erro ao importar {path}: {e}")
+                report["failed"] += 1
+                continue
+            if imported:
+                bump_version("products")
+            status = "imported" if imported else "conflict"
+        report[status] += 1
+        if prune and not dry_run and status in ("imported", "in_db"):
+            os.remove(path)
+            report["pruned"] += 1
+    if prune and not dry_run:
+        asset_index.get_asset_index(directory).invalidate()
+    return report
+
+
+if __name__ == "__main__":
+    # Comandos de manutenção: python database.py <comando>
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Manutenção do banco da loja")
+    parser.add_argument("command", choices=["migrate", "backfill-sales-daily", "reconcile-assets"])
+    parser.add_argument("--db", default=DB_NAME, help="arquivo do banco (padrão: store.db)")
+    parser.add_argument("--assets", default="assets", help="pasta de imagens legadas (reconcile-assets)")
+    parser.add_argument("--dry-run", action="store_true", help="reconcile-assets: só relata, não grava")
+    parser.add_argument("--prune", action="store_true",
+                        help="reconcile-assets: apaga os arquivos cujo conteúdo já está no banco")
+    args = parser.parse_args()
+    DB_NAME = args.db
+
+    init_db()
+    if args.command == "migrate":
+        print(f"Schema na versão {get_schema_version()}")
+    elif args.command == "backfill-sales-daily":
+        rows = rebuild_sales_daily()
+        print(f"sales_daily recalculado: {rows} linhas" if rows is not None else "Falha ao recalcular sales_daily")
+    elif args.command == "reconcile-assets":
+        report = reconcile_assets(args.assets, dry_run=args.dry_run, prune=args.prune)
+        print("Imagens em assets/: " + ", ".join(f"{key}={value}" for key, value in report.items()))
@@ -0,0 +1,311 @@
+"""
+Exportação do catálogo de produtos (PDF, CSV, XLSX, Parquet).
+
+Os arquivos são gerados sob demanda (no clique do botão de download) e
+guardados no cache de leitura do database, ligados ao domínio products:
+enquanto o catálogo não mudar, downloads seguintes reutilizam os mesmos bytes.
+XLSX e Parquet dependem de pacotes opcionais (openpyxl/xlsxwriter e
+pyarrow/fastparquet) e só aparecem quando estiverem instalados.
+"""
+import base64
+import csv
+import importlib.util
+import io
+import os
+import tempfile
+
+import pandas as pd
+from fpdf import FPDF
+
+import database as db
+
+# Fonte Unicode embutida no PDF (acentos, travessões, símbolos). Procurada nestas
+# pastas, nesta ordem; sem ela o PDF usa Helvetica e troca o que não for latin-1.
+PDF_FONT_DIRS = [
+    os.environ.get("STORE_PDF_FONT_DIR", ""),
+    os.path.join("assets", "fonts"),
+    "/usr/share/fonts/truetype/dejavu",
+    "/usr/share/fonts/dejavu",
+]
+PDF_FONT_FILES = {"": "DejaVuSans.ttf", "B": "DejaVuSans-Bold.ttf"}
+
+# (coluna, título, largura em mm, alinhamento, máximo de caracteres)
+PDF_COLUMNS = [
+    ("id", "ID", 14, "R", 8),
+    ("name", "Nome", 70, "L", 42),
+    ("brand", "Marca", 32, "L", 18),
+    ("type", "Tipo", 32, "L", 18),
+    ("quantity", "Qtd", 14, "R", 6),
+    ("price", "Preço", 24, "R", 14),
+    ("expiration_date", "Validade", 24, "C", 10),
+]
+PDF_ROW_HEIGHT = 6
+PDF_THUMB_ROW_HEIGHT = 14
+PDF_TITLE = "Relatório de Produtos"
+
+
+def _find_pdf_fonts():
+    for folder in PDF_FONT_DIRS:
+        if not folder:
+            continue
+        paths = {style: os.path.join(folder, name) for style, name in PDF_FONT_FILES.items()}
+        if all(os.path.isfile(path) for path in paths.values()):
+            return paths
+    return None
+
+
+def format_brl(values):
+    """Formata uma Series numérica como moeda brasileira (R$ 1.234,56), sem loop em Python."""
+    text = pd.to_numeric(values, errors="coerce").fillna(0).map("{:,.2f}".format)
+    return "R$ " + text.str.replace(",", "_").str.replace(".", ",").str.replace("_", ".")
+
+
+def format_date_br(values):
+    """AAAA-MM-DD vira DD/MM/AAAA; valores que não são datas ficam como estão."""
+    text = values.fillna("").astype(str)
+    parsed = pd.to_datetime(text, format="%Y-%m-%d", errors="coerce")
+    return parsed.dt.strftime("%d/%m/%Y").fillna(text)
+
+
+def _pdf_columns(products_df, unicode_font):
+    """Pré-formata cada coluna inteira de uma vez (Series de strings), sem iterrows."""
+    columns = []
+    for col, _, _, _, max_chars in PDF_COLUMNS:
+        if col == "price":
+            text = format_brl(products_df[col])
+        elif col == "expiration_date":
+            text = format_date_br(products_df[col])
+        else:
+            text = products_df[col].fillna("").astype(str)
+        text = text.str.slice(0, max_chars)
+        if not unicode_font:
+            # Fontes padrão do PDF só cobrem latin-1
+            text = text.str.encode("latin-1", "replace").str.decode("latin-1")
+        columns.append(text.tolist())
+    return columns
+
+
+def _fit_column(pdf, texts, max_width, ellipsis):
+    """
+    Larguras (mm) dos textos de uma coluna, cortando com reticências o que não
+    cabe. Usa uma tabela de largura por caractere: medir string a string no
+    fpdf custaria mais que desenhar a linha.
+    """
+    char_width = {ch: pdf.get_string_width(ch) for ch in set("".join(texts))}
+    ellipsis_width = pdf.get_string_width(ellipsis)
+    fitted, widths = [], []
+    for text in texts:
+        width = sum(char_width[ch] for ch in text)
+        if width > max_width:
+            while text and width + ellipsis_width > max_width:
+                width -= char_width[text[-1]]
+                text = text[:-1]
+            text += ellipsis
+            width += ellipsis_width
+        fitted.append(text)
+        widths.append(width)
+    return fitted, widths
+
+
+class CatalogPDF(FPDF):
+    """Tabela com título e cabeçalho de colunas repetidos em cada página."""
+
+    def __init__(self, font_paths, thumb_width=0):
+        super().__init__(orientation="P", unit="mm", format="A4")
+        self.thumb_width = thumb_width
+        if font_paths:
+            for style, path in font_paths.items():
+                self.add_font("DejaVu", style, path)
+            self.font_family_name = "DejaVu"
+        else:
+            self.font_family_name = "Helvetica"
+        # Quebra de página feita à mão em build_catalog_pdf
+        self.set_auto_page_break(auto=False, margin=12)
+        self.set_fill_color(255, 250, 205)  # mesma paleta do app
+        self.set_draw_color(128, 0, 32)
+
+    def header(self):
+        self.set_font(self.font_family_name, "B", 13)
+        self.set_text_color(128, 0, 32)
+        self.cell(0, 8, PDF_TITLE, align="C", new_x="LMARGIN", new_y="NEXT")
+        self.set_font(self.font_family_name, "B", 8)
+        if self.thumb_width:
+            self.cell(self.thumb_width, 6, "", border="B")
+        for _, title, width, align, _ in PDF_COLUMNS:
+            self.cell(width, 6, title, border="B", align=align)
+        self.ln()
+        self.set_font(self.font_family_name, "", 8)
+        self.set_text_color(54, 69, 79)
+
+    def footer(self):
+        self.set_y(-10)
+        self.set_font(self.font_family_name, "", 7)
+        self.cell(0, 5, f"Página {self.page_no()}/{{nb}}", align="R")
+
+
+def build_catalog_pdf(products_df, thumbnails=None):
+    """
+    Gera o PDF do catálogo. thumbnails: {image_hash: bytes} opcional; quando
+    informado, cada linha ganha uma coluna com a miniatura do produto.
+    Retorna os bytes do PDF.
+    """
+    font_paths = _find_pdf_fonts()
+    ellipsis = "…" if font_paths else "..."
+    thumb_width = PDF_THUMB_ROW_HEIGHT if thumbnails else 0
+    row_height = PDF_THUMB_ROW_HEIGHT if thumbnails else PDF_ROW_HEIGHT
+
+    pdf = CatalogPDF(font_paths, thumb_width)
+    pdf.add_page()
+
+    # Posição x de cada texto já resolvida por coluna (alinhamento + corte)
+    padding = 1
+    layout = []
+    x = pdf.l_margin + thumb_width
+    for texts, (_, _, width, align, _) in zip(_pdf_columns(products_df, font_paths is not None), PDF_COLUMNS):
+        fitted, widths = _fit_column(pdf, texts, width - 2 * padding, ellipsis)
+        if align == "R":
+            xs = [x + width - padding - w for w in widths]
+        elif align == "C":
+            xs = [x + (width - w) / 2 for w in widths]
+        else:
+            xs = [x + padding] * len(widths)
+        layout.append((fitted, xs))
+        x += width
+    table_width = x - pdf.l_margin
+    rows = list(zip(*(zip(xs, fitted) for fitted, xs in layout)))
+    hashes = products_df["image_hash"].tolist() if thumbnails else [None] * len(rows)
+
+    bottom = pdf.h - pdf.b_margin
+    # Linha de base do texto centralizada verticalmente na linha da tabela
+    baseline = row_height / 2 + pdf.font_size * 0.35
+    for index, (cells, image_hash) in enumerate(zip(rows, hashes)):
+        y = pdf.get_y()
+        if y + row_height > bottom:
+            pdf.add_page()
+            y = pdf.get_y()
+        if index % 2:
+            pdf.rect(pdf.l_margin, y, table_width, row_height, style="F")
+        if thumb_width and thumbnails.get(image_hash):
+            try:
+                pdf.image(thumbnails[image_hash], pdf.l_margin + 1, y + 1, thumb_width - 2, row_height - 2,
+                          keep_aspect_ratio=True)
+            except Exception as e:
+                print(f"Erro ao incluir miniatura no PDF: {e}")
+        for text_x, text in cells:
+            pdf.text(text_x, y + baseline, text)
+        pdf.set_y(y + row_height)
+
+    return bytes(pdf.output())
+
+
+def catalog_pdf(with_images=False):
+    """
+    PDF do catálogo atual, em cache até a próxima alteração em products.
+    Pensado para st.download_button(data=lambda: catalog_pdf()).
+    """
+    def build():
+        products = db.get_catalog()
+        thumbnails = None
+        if with_images:
+            thumbnails = db.get_images(products.loc[products["has_image"] == 1, "image_hash"], "thumb")
+        return build_catalog_pdf(products, thumbnails)
+
+    return db.cached_read(f"export:pdf:{int(with_images)}", ("products",), build)
+
+
+# -------------------------------------------------------------------
+# Planilhas (CSV / XLSX / Parquet)
+# -------------------------------------------------------------------
+
+# Colunas exportadas, com os nomes aceitos pela importação de CSV
+EXPORT_COLUMNS = {
+    "id": "id", "name": "nome", "brand": "marca", "style": "estilo", "type": "tipo",
+    "price": "preco", "quantity": "quantidade", "expiration_date": "data_validade",
+}
+# Produtos por consulta de imagens na exportação com imagens
+IMAGE_EXPORT_BATCH = 200
+
+
+def export_frame(products_df):
+    """Catálogo no layout de importação (sem as colunas internas de imagem)."""
+    return products_df[list(EXPORT_COLUMNS)].rename(columns=EXPORT_COLUMNS)
+
+
+def _csv_bytes(df):
+    return df.to_csv(index=False).encode("utf-8")
+
+
+def _xlsx_bytes(df):
+    buf = io.BytesIO()
+    df.to_excel(buf, index=False, sheet_name="Produtos")
+    return buf.getvalue()
+
+
+def _parquet_bytes(df):
+    buf = io.BytesIO()
+    df.to_parquet(buf, index=False)
+    return buf.getvalue()
+
+
+EXPORT_FORMATS = {
+    "csv": {"label": "CSV", "extension": "csv", "mime": "text/csv",
+            "build": _csv_bytes, "requires": ()},
+    "xlsx": {"label": "Excel (XLSX)", "extension": "xlsx",
+             "mime": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+             "build": _xlsx_bytes, "requires": ("openpyxl", "xlsxwriter")},
+    "parquet": {"label": "Parquet", "extension": "parquet", "mime": "application/vnd.apache.parquet",
+                "build": _parquet_bytes, "requires": ("pyarrow", "fastparquet")},
+}
+
+
+def available_formats():
+    """Formatos cujo pacote opcional (qualquer um de requires) está instalado."""
+    return [fmt for fmt, spec in EXPORT_FORMATS.items()
+            if not spec["requires"] or any(importlib.util.find_spec(m) for m in spec["requires"])]
+
+
+def catalog_export(fmt):
+    """Bytes do catálogo no formato pedido, em cache até a próxima alteração em products."""
+    if fmt not in available_formats():
+        raise ValueError(f"Formato de exportação indisponível: {fmt}")
+    build = EXPORT_FORMATS[fmt]["build"]
+    return db.cached_read(f"export:{fmt}", ("products",), lambda: build(export_frame(db.get_catalog())))
+
+
+def write_catalog_csv_with_images(file):
+    """
+    Escreve em `file` (texto) o CSV do catálogo com a coluna imagem (original
+    em Base64). As imagens são lidas em lotes e codificadas linha a linha: no
+    máximo IMAGE_EXPORT_BATCH imagens ficam em memória ao mesmo tempo.
+    """
+    products = db.get_catalog()
+    frame = export_frame(products)
+    hashes = products["image_hash"].where(products["has_image"] == 1).tolist()
+    writer = csv.writer(file)
+    writer.writerow(list(frame.columns) + ["imagem"])
+    for start in range(0, len(frame), IMAGE_EXPORT_BATCH):
+        batch_hashes = hashes[start:start + IMAGE_EXPORT_BATCH]
+        batch_images = db.get_images([h for h in batch_hashes if isinstance(h, str)], "original")
+        for row, image_hash in zip(frame.iloc[start:start + IMAGE_EXPORT_BATCH].itertuples(index=False), batch_hashes):
+            data = batch_images.get(image_hash)
+            writer.writerow(list(row) + [base64.b64encode(data).decode("ascii") if data else ""])
+
+
+def catalog_csv_with_images():
+    """
+    Bytes do CSV incluindo imagens, gerados a cada chamada (o download_button
+    chama só no clique).
+
+    Não é streaming: o st.download_button lê qualquer dado (bytes, arquivo ou
+    retorno do callable) para um único bytes em memória, então o pico é o CSV
+    inteiro uma vez. O arquivo temporário só evita ter também a str e os
+    buffers de crescimento de um BytesIO ao mesmo tempo. Para gravar sem
+    carregar tudo, use write_catalog_csv_with_images com um arquivo aberto.
+    """
+    with tempfile.TemporaryFile() as raw:
+        text = io.TextIOWrapper(raw, encoding="utf-8", newline="")
+        write_catalog_csv_with_images(text)
+        text.flush()
+        text.detach()
+        raw.seek(0)
+        return raw.read()
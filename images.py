@@ -0,0 +1,96 @@
+"""
+Pipeline de imagens de produtos (Pillow).
+
+Cada upload é normalizado (orientação EXIF aplicada, metadados removidos,
+tamanho limitado) e gera derivados: uma miniatura de tamanho fixo para as
+grades e um preview médio para as telas de detalhe. O conteúdo é endereçado
+pelo SHA-256 dos bytes enviados, o que deduplica uploads repetidos.
+"""
+import hashlib
+import io
+
+from PIL import Image, ImageOps, features
+
+ORIGINAL_MAX_SIZE = (1600, 1600)
+PREVIEW_SIZE = (800, 800)
+THUMB_SIZE = (320, 320)
+
+VARIANTS = ("thumb", "preview", "original")
+
+# WebP quando o Pillow tiver suporte; JPEG caso contrário
+if features.check("webp"):
+    OUTPUT_FORMAT, OUTPUT_MIME = "WEBP", "image/webp"
+else:
+    OUTPUT_FORMAT, OUTPUT_MIME = "JPEG", "image/jpeg"
+
+QUALITY = {"thumb": 75, "preview": 80, "original": 85}
+
+
+def content_hash(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def _open_normalized(data, draft_size=None):
+    img = Image.open(io.BytesIO(data))
+    if draft_size and img.format == "JPEG":
+        # JPEG grande: decodifica já reduzido (escala 1/2, 1/4, 1/8), bem mais rápido
+        img.draft("RGB", draft_size)
+    # Aplica a rotação indicada pela câmera antes de descartar o EXIF
+    img = ImageOps.exif_transpose(img)
+    has_alpha = img.mode in ("RGBA", "LA") or (img.mode == "P" and "transparency" in img.info)
+    img = img.convert("RGBA" if has_alpha else "RGB")
+    if has_alpha and OUTPUT_FORMAT == "JPEG":
+        background = Image.new("RGB", img.size, "white")
+        background.paste(img, mask=img.getchannel("A"))
+        img = background
+    return img
+
+
+def _encode(img, variant):
+    buf = io.BytesIO()
+    # Re-encode sem exif/icc: nenhum metadado do arquivo original é copiado
+    img.save(buf, OUTPUT_FORMAT, quality=QUALITY[variant])
+    return buf.getvalue()
+
+
+def process_upload(data):
+    """
+    Normaliza um upload e gera os derivados.
+    Levanta PIL.UnidentifiedImageError se os bytes não forem uma imagem.
+    """
+    img = _open_normalized(data)
+
+    original = img.copy()
+    original.thumbnail(ORIGINAL_MAX_SIZE, Image.LANCZOS)
+
+    preview = img.copy()
+    preview.thumbnail(PREVIEW_SIZE, Image.LANCZOS)
+
+    # Miniatura com tamanho fixo (imagem inteira, completada com fundo) para a grade ficar alinhada
+    fill = (255, 255, 255, 0) if img.mode == "RGBA" else "white"
+    thumb = ImageOps.pad(img, THUMB_SIZE, method=Image.LANCZOS, color=fill)
+
+    return {
+        "hash": content_hash(data),
+        "mime": OUTPUT_MIME,
+        "width": original.width,
+        "height": original.height,
+        "original": _encode(original, "original"),
+        "preview": _encode(preview, "preview"),
+        "thumb": _encode(thumb, "thumb"),
+    }
+
+
+def render_card(data, size=THUMB_SIZE):
+    """
+    Versão de exibição em card: imagem inteira centralizada num quadro de
+    `size` (mesmo enquadramento das miniaturas), sem metadados.
+    Bytes que já são uma miniatura nesse formato e tamanho voltam sem re-encode.
+    Levanta PIL.UnidentifiedImageError se os bytes não forem uma imagem.
+    """
+    with Image.open(io.BytesIO(data)) as probe:
+        if probe.format == OUTPUT_FORMAT and probe.size == tuple(size):
+            return data
+    img = _open_normalized(data, draft_size=size)
+    fill = (255, 255, 255, 0) if img.mode == "RGBA" else "white"
+    return _encode(ImageOps.pad(img, size, method=Image.LANCZOS, color=fill), "thumb")
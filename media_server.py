@@ -0,0 +1,186 @@
+"""
+Servidor de mídia: entrega as imagens do store por HTTP, fora do Streamlit.
+
+st.image com bytes reenvia a imagem para o media store do Streamlit a cada
+rerun, com uma URL nova a cada vez, e o navegador não consegue guardar nada.
+Aqui cada variante tem uma URL fixa derivada do hash do conteúdo
+
+    /media/<variante>/<hash>
+
+e como o conteúdo de um hash nunca muda, a resposta vai com ETag e
+Cache-Control immutable de um ano: uma segunda visita ao catálogo não baixa
+nenhum byte de imagem.
+
+Roda numa thread daemon do próprio processo do app (ThreadingHTTPServer da
+biblioteca padrão), iniciada por start_media_server(). Vem desligado: sem
+configuração, as imagens vão pelo st.image. Configuração:
+
+    STORE_MEDIA_URL        URL pública pela qual o navegador alcança o
+                           servidor (ex.: https://loja.exemplo.com.br, com o
+                           proxy encaminhando /media/ para a porta abaixo).
+                           Definida, liga o servidor
+    STORE_MEDIA_SERVER=1   liga sem STORE_MEDIA_URL: a URL passa a ser o host
+                           que o navegador usou para abrir o app + a porta, o
+                           que exige a porta acessível direto (sem proxy nem
+                           firewall no caminho) e STORE_MEDIA_HOST=0.0.0.0.
+                           STORE_MEDIA_SERVER=0 desliga mesmo com a URL
+    STORE_MEDIA_HOST       interface de escuta (padrão 127.0.0.1, só o proxy local)
+    STORE_MEDIA_PORT       porta (padrão 8502)
+"""
+import os
+import re
+import threading
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import database as db
+import images
+from counters import Counters
+
+MEDIA_PUBLIC_URL = os.environ.get("STORE_MEDIA_URL", "").rstrip("/")
+MEDIA_SERVER_ENABLED = os.environ.get("STORE_MEDIA_SERVER", "1" if MEDIA_PUBLIC_URL else "0") == "1"
+MEDIA_HOST = os.environ.get("STORE_MEDIA_HOST", "127.0.0.1")
+MEDIA_PORT = int(os.environ.get("STORE_MEDIA_PORT", "8502"))
+
+# Conteúdo endereçado por hash nunca muda: o navegador pode guardar para sempre
+CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+_MEDIA_PATH = re.compile(r"^/media/(%s)/([0-9a-f]{64})$" % "|".join(images.VARIANTS))
+
+_stats = Counters(requests=0, served=0, not_modified=0, not_found=0, errors=0, bytes=0)
+
+
+def get_media_stats():
+    return _stats.snapshot()
+
+
+def media_path(image_hash, variant="thumb"):
+    return f"/media/{variant}/{image_hash}"
+
+
+def _etag(image_hash, variant):
+    return f'"{image_hash}-{variant}"'
+
+
+class MediaHandler(BaseHTTPRequestHandler):
+    server_version = "StoreMedia/1.0"
+
+    def do_GET(self):
+        self._serve(send_body=True)
+
+    def do_HEAD(self):
+        self._serve(send_body=False)
+
+    def _serve(self, send_body):
+        _stats.add(requests=1)
+        match = _MEDIA_PATH.match(self.path.split("?", 1)[0])
+        if not match:
+            _stats.add(not_found=1)
+            self.send_error(HTTPStatus.NOT_FOUND)
+            return
+        variant, image_hash = match.groups()
+        etag = _etag(image_hash, variant)
+
+        # Revalidação: o hash está na URL, então a ETag basta (sem ir ao banco)
+        if etag in [tag.strip() for tag in self.headers.get("If-None-Match", "").split(",")]:
+            _stats.add(not_modified=1)
+            self.send_response(HTTPStatus.NOT_MODIFIED)
+            self.send_header("ETag", etag)
+            self.send_header("Cache-Control", CACHE_CONTROL)
+            self.end_headers()
+            return
+
+        try:
+            media = db.get_image_media(image_hash, variant)
+        except Exception as e:
+            print(f"Erro ao servir imagem {image_hash}: {e}")
+            _stats.add(errors=1)
+            self.send_error(HTTPStatus.INTERNAL_SERVER_ERROR)
+            return
+        if not media:
+            _stats.add(not_found=1)
+            self.send_error(HTTPStatus.NOT_FOUND)
+            return
+
+        mime, data = media
+        self.send_response(HTTPStatus.OK)
+        self.send_header("Content-Type", mime)
+        self.send_header("Content-Length", str(len(data)))
+        self.send_header("ETag", etag)
+        self.send_header("Cache-Control", CACHE_CONTROL)
+        self.end_headers()
+        # Conta antes de enviar: quem recebeu a resposta já vê as estatísticas atualizadas
+        _stats.add(served=1, bytes=len(data) if send_body else 0)
+        if send_body:
+            self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        # Sem log por requisição: o catálogo pede dezenas de imagens por página
+        pass
+
+
+class MediaServer:
+    """ThreadingHTTPServer rodando numa thread daemon."""
+
+    def __init__(self, host=MEDIA_HOST, port=MEDIA_PORT):
+        self.httpd = ThreadingHTTPServer((host, port), MediaHandler)
+        self.httpd.daemon_threads = True
+        self.port = self.httpd.server_address[1]
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name="media-server", daemon=True)
+        self._thread.start()
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        self._thread.join()
+
+
+_server = None
+_server_lock = threading.Lock()
+_start_failed = False
+
+
+def start_media_server(host=MEDIA_HOST, port=MEDIA_PORT):
+    """
+    Sobe o servidor uma vez por processo (reruns retornam na hora).
+    Retorna None se estiver desligado ou a porta não puder ser aberta.
+    """
+    global _server, _start_failed
+    if not MEDIA_SERVER_ENABLED:
+        return None
+    with _server_lock:
+        if _server is None and not _start_failed:
+            try:
+                _server = MediaServer(host, port)
+            except OSError as e:
+                # Porta ocupada etc.: o app segue mandando as imagens pelo st.image
+                print(f"Servidor de mídia indisponível em {host}:{port}: {e}")
+                _start_failed = True
+        return _server
+
+
+def get_media_server():
+    return _server
+
+
+def stop_media_server():
+    global _server, _start_failed
+    with _server_lock:
+        if _server is not None:
+            _server.close()
+        _server = None
+        _start_failed = False
+
+
+def media_url(image_hash, variant="thumb", base_url=None):
+    """
+    URL absoluta da imagem no servidor de mídia, ou None se ele não estiver no ar.
+    base_url: origem pública (ex.: https://loja.exemplo.com.br); o padrão é
+    STORE_MEDIA_URL.
+    """
+    if not image_hash or _server is None:
+        return None
+    base_url = base_url or MEDIA_PUBLIC_URL
+    if not base_url:
+        return None
+    return base_url.rstrip("/") + media_path(image_hash, variant)
@@ -0,0 +1,59 @@
+import os
+import time
+
+import asset_index
+from conftest import image_bytes
+import database as db
+
+
+def write_png(path, color):
+    data = image_bytes((40, 40), color, "PNG")
+    with open(path, "wb") as f:
+        f.write(data)
+    return data
+
+
+def test_index_maps_ids_and_refreshes_on_directory_change(tmp_path):
+    folder = str(tmp_path)
+    for name in ("12_b.png", "12_a.png", "7_foto.jpg", "logo.png", "1766141799_Captura.png"):
+        open(os.path.join(folder, name), "wb").close()
+    index = asset_index.AssetIndex(folder)
+
+    assert index.get(12) == os.path.join(folder, "12_a.png")
+    assert index.get(7) == os.path.join(folder, "7_foto.jpg")
+    assert index.get(99) is None
+    assert len(index) == 3
+    assert index.stats["rebuilds"] == 1
+
+    # Sem mudança na pasta: nenhuma releitura
+    index.get(12)
+    assert index.stats["rebuilds"] == 1
+
+    time.sleep(0.01)
+    open(os.path.join(folder, "99_novo.png"), "wb").close()
+    assert index.get(99) == os.path.join(folder, "99_novo.png")
+    assert index.stats["rebuilds"] == 2
+
+
+def test_reconcile_imports_legacy_files_into_image_store(temp_db, tmp_path):
+    folder = tmp_path / "assets"
+    folder.mkdir()
+    folder = str(folder)
+    db.add_product("Sem foto", "Natura", "Make", "Boca", 10.0, 1, "", None)
+    existing = write_png(str(tmp_path / "x.png"), "blue")
+    db.add_product("Com foto", "Natura", "Make", "Boca", 10.0, 1, "", existing)
+    legacy = write_png(os.path.join(folder, "1_batom.png"), "red")
+    write_png(os.path.join(folder, "2_mesma.png"), "blue")
+    write_png(os.path.join(folder, "1766141799_sem_produto.png"), "green")
+
+    assert db.reconcile_assets(folder, dry_run=True)["imported"] == 1
+    assert not db.get_product_by_id(1).has_image
+
+    report = db.reconcile_assets(folder, prune=True)
+
+    assert report == {"imported": 1, "in_db": 1, "conflict": 0, "orphan": 1, "pruned": 2, "failed": 0}
+    product = db.get_product_by_id(1)
+    assert product.has_image and db.get_image(product.image_hash) is not None
+    assert product.image_hash == db.images.content_hash(legacy)
+    # Só o arquivo sem produto continua na pasta
+    assert os.listdir(folder) == ["1766141799_sem_produto.png"]
@@ -0,0 +1,124 @@
+import threading
+
+import pytest
+
+import auth
+import database as db
+
+
+@pytest.fixture(autouse=True)
+def fast_auth(monkeypatch, request):
+    # Custo mínimo do bcrypt e limites zerados a cada teste
+    monkeypatch.setattr(auth, "BCRYPT_ROUNDS", 4)
+    monkeypatch.setattr(auth, "user_limiter", auth.RateLimiter(3, 300))
+    monkeypatch.setattr(auth, "ip_limiter", auth.RateLimiter(5, 60))
+    monkeypatch.setattr(auth, "failed_attempts", auth.FailedAttemptCache(60))
+    request.getfixturevalue("temp_db")
+    db.create_user("maria", "segredo", "cliente", "Maria")
+
+
+def stored_hash(username):
+    return db.execute_read_query("SELECT password FROM users WHERE username = ?", (username,), fetch_one=True)[0]
+
+
+def test_repeated_wrong_password_skips_bcrypt():
+    before = auth.get_auth_stats()
+
+    assert db.authenticate("maria", "errada") == (None, db.LOGIN_FAILED_MESSAGE)
+    assert db.authenticate("maria", "errada") == (None, db.LOGIN_FAILED_MESSAGE)
+
+    after = auth.get_auth_stats()
+    assert after["verifications"] == before["verifications"] + 1
+    assert after["cache_hits"] == before["cache_hits"] + 1
+    assert db.check_login("maria", "segredo").username == "maria"
+
+
+def test_username_is_locked_after_failures():
+    for attempt in range(3):
+        assert db.check_login("Maria", f"errada{attempt}") is None
+
+    user, error = db.authenticate("maria", "segredo")
+    assert user is None and error.startswith("Muitas tentativas")
+    # Outros usuários seguem entrando
+    assert db.check_login("admin", "admin123").username == "admin"
+
+
+def test_ip_limit_counts_only_failures():
+    # Muitos logins certos atrás do mesmo IP (NAT, proxy) não esgotam o limite
+    for _ in range(10):
+        assert db.check_login("maria", "segredo", client_ip="10.0.0.9")
+        assert db.check_login("admin", "admin123", client_ip="10.0.0.9")
+
+    for attempt in range(5):
+        db.create_user(f"cliente{attempt}", "segredo", "cliente", "Cliente")
+        assert db.check_login(f"cliente{attempt}", "errada", client_ip="10.0.0.9") is None
+
+    assert db.authenticate("admin", "admin123", "10.0.0.9")[1].startswith("Muitas tentativas")
+    assert db.check_login("admin", "admin123", client_ip="10.0.0.10")
+
+
+def test_login_rehashes_with_configured_cost(monkeypatch):
+    assert auth.cost_of(stored_hash("maria")) == 4
+    monkeypatch.setattr(auth, "BCRYPT_ROUNDS", 5)
+    rehashed = auth.get_auth_stats()["rehashed"]
+
+    assert db.check_login("maria", "segredo")
+
+    assert auth.cost_of(stored_hash("maria")) == 5
+    assert auth.get_auth_stats()["rehashed"] == rehashed + 1
+    assert db.check_login("maria", "segredo")
+
+
+def test_full_queue_rejects_instead_of_waiting(monkeypatch):
+    auth.shutdown_pool()
+    monkeypatch.setattr(auth, "AUTH_WORKERS", 1)
+    monkeypatch.setattr(auth, "AUTH_QUEUE_MAX", 0)
+    _, slots = auth._get_executor()
+    slots.acquire()
+    try:
+        user, error = db.authenticate("maria", "segredo")
+    finally:
+        slots.release()
+        auth.shutdown_pool()
+
+    assert user is None and error.startswith("Servidor ocupado")
+    # Ocupado não conta como senha errada
+    assert auth.user_limiter.retry_after("maria") == 0
+
+
+def test_rate_limiter_window_slides():
+    now = [0.0]
+    limiter = auth.RateLimiter(2, 10, clock=lambda: now[0])
+    limiter.add("k")
+    now[0] = 4.0
+    limiter.add("k")
+
+    assert limiter.retry_after("k") == 6
+    now[0] = 10.0
+    assert limiter.retry_after("k") == 0
+    limiter.reset("k")
+    assert limiter.retry_after("k") == 0
+
+
+def test_unknown_user_hashes_only_in_pool(monkeypatch):
+    monkeypatch.setattr(auth, "_dummy_hash", None)
+    threads = []
+    hashpw = auth.bcrypt.hashpw
+
+    def tracking(*args):
+        threads.append(threading.current_thread().name)
+        return hashpw(*args)
+    monkeypatch.setattr(auth.bcrypt, "hashpw", tracking)
+
+    assert db.check_login("ninguem", "x") is None
+
+    assert threads and all(name.startswith("bcrypt") for name in threads)
+
+
+def test_seeded_admin_is_rehashed_on_first_login():
+    # A migração 1 grava o admin com o custo padrão do bcrypt; o login ajusta
+    assert auth.cost_of(stored_hash("admin")) == 12
+
+    assert db.check_login("admin", "admin123")
+
+    assert auth.cost_of(stored_hash("admin")) == 4
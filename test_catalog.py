@@ -0,0 +1,70 @@
+import database as db
+
+
+def add_products(names):
+    for name in names:
+        db.add_product(name, "Natura", "Perfumaria", "Colônias", 10.0, 1, "", None)
+
+
+def test_pages_cover_catalog_in_id_order(temp_db):
+    add_products([f"Produto {i}" for i in range(1, 26)])
+
+    first, total = db.get_products_page(10, 0)
+    last, _ = db.get_products_page(10, 20)
+    beyond, _ = db.get_products_page(10, 30)
+
+    assert total == 25
+    assert [p.id for p in first] == list(range(1, 11))
+    assert [p.id for p in last] == list(range(21, 26))
+    assert beyond == []
+    assert isinstance(first[0], db.Product)
+
+
+def test_page_with_search_counts_only_matches(temp_db):
+    add_products(["Colônia Floral", "Sabonete Floral", "Batom"])
+
+    page, total = db.get_products_page(1, 1, search="floral")
+
+    assert total == 2
+    assert len(page) == 1
+    # Busca só com pontuação cai para a listagem completa
+    assert db.get_products_page(10, 0, search="!!")[1] == 3
+
+
+def test_search_ignores_accents_and_matches_prefixes(temp_db):
+    add_products(["Óleo Corporal Castanha", "Tônico Facial", "Colônia Óleo de Argan", "Shampoo"])
+
+    assert sorted(p.name for p in db.search_products("oleo")[0]) == ["Colônia Óleo de Argan", "Óleo Corporal Castanha"]
+    assert [p.name for p in db.search_products("TON")[0]] == ["Tônico Facial"]
+    # Todas as palavras precisam aparecer, em qualquer ordem
+    assert [p.name for p in db.search_products("argan col")[0]] == ["Colônia Óleo de Argan"]
+    assert db.search_products("inexistente") == ([], 0)
+
+
+def test_search_ranks_name_matches_first(temp_db):
+    db.add_product("Hidratante", "Natura", "Corpo e Banho", "Óleo corporal", 10.0, 1, "", None)
+    db.add_product("Óleo de Banho", "Natura", "Corpo e Banho", "Outro", 10.0, 1, "", None)
+
+    page, total = db.search_products("oleo")
+
+    assert total == 2
+    assert page[0].name == "Óleo de Banho"
+
+
+def test_search_index_follows_updates_and_deletes(temp_db):
+    add_products(["Perfume Antigo"])
+    db.update_product(1, "Perfume Novo", "Natura", "Perfumaria", "Colônias", 10.0, 1, "")
+
+    assert db.search_products("antigo")[1] == 0
+    assert db.search_products("novo")[1] == 1
+    db.delete_product(1)
+    assert db.search_products("novo")[1] == 0
+
+
+def test_search_input_is_sanitized(temp_db):
+    add_products(["Batom Matte"])
+
+    # Sintaxe FTS5 digitada pelo usuário não pode quebrar a consulta
+    assert db.search_products('bat"')[1] == 1
+    assert db.search_products('matte)(*')[1] == 1
+    assert db.build_fts_query('bat" OR *') == '"bat"* "OR"*'
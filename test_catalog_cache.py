@@ -0,0 +1,139 @@
+import datetime
+import sqlite3
+
+import database as db
+
+
+def cache_stats(name):
+    return db.get_cache_stats()["entries"].get(name, {"hits": 0, "misses": 0})
+
+
+def test_catalog_is_reused_until_a_write(temp_db):
+    db.add_product("Colônia Floral", "Natura", "Perfumaria", "Colônias", 80.0, 5, "2030-01-01", None)
+
+    first = db.get_catalog()
+    hits = cache_stats("catalog")["hits"]
+    # Reruns de qualquer sessão recebem o mesmo DataFrame, sem ir ao banco
+    assert db.get_catalog() is first
+    assert db.get_products() is first
+    assert cache_stats("catalog")["hits"] == hits + 2
+
+    for write in (
+        lambda: db.update_product(1, "Colônia Floral", "Natura", "Perfumaria", "Colônias", 75.0, 5, "2030-01-01"),
+        lambda: db.register_sale(1, 2, 1),
+        lambda: db.add_product("Batom", "Avon", "Maquiagem", "Batom", 20.0, 3, "", None),
+        lambda: db.delete_product(2),
+    ):
+        before = db.get_catalog()
+        write()
+        assert db.get_catalog() is not before
+
+    catalog = db.get_catalog()
+    assert catalog[["id", "price", "quantity"]].values.tolist() == [[1, 75.0, 3]]
+
+
+def test_failed_sale_keeps_catalog_cached(temp_db):
+    db.add_product("Sabonete", "Natura", "Corpo e Banho", "Sabonete", 5.0, 1, "", None)
+    cached = db.get_catalog()
+
+    ok, _ = db.register_sale(1, 2, 1)
+
+    assert not ok
+    assert db.get_catalog() is cached
+
+
+def test_writes_from_another_process_invalidate_only_their_domain(temp_db):
+    db.add_product("Perfume", "Natura", "Perfumaria", "Colônias", 100.0, 10, "", None)
+    catalog = db.get_catalog()
+    metrics = db.get_dashboard_metrics()
+    birthdays = db.get_birthdays_on(1, 1)
+
+    # Outra conexão fora do módulo, como faria um segundo servidor Streamlit
+    other = sqlite3.connect(db.DB_NAME)
+    other.execute("UPDATE products SET quantity = 4 WHERE id = 1")
+    other.commit()
+
+    fresh = db.get_catalog()
+    assert fresh is not catalog
+    assert fresh.loc[0, "quantity"] == 4
+    assert db.get_dashboard_metrics()["total_stock"] == 4
+    assert metrics["total_stock"] == 10
+    # users não mudou: a entrada continua em cache
+    assert db.get_birthdays_on(1, 1) is birthdays
+
+    other.execute("INSERT INTO users (username, password, role, name, birth_date) VALUES ('ana', 'x', 'cliente', 'Ana', '1990-01-01')")
+    other.commit()
+    other.close()
+
+    assert db.get_birthdays_on(1, 1)["name"].tolist() == ["Ana"]
+    assert db.get_catalog() is fresh
+
+
+def test_birthdays_read_error_returns_empty_frame_with_columns(temp_db, monkeypatch):
+    def broken(fn):
+        raise sqlite3.OperationalError("disk I/O error")
+    db.create_user("ana", "x", "cliente", "Ana", birth_date="1990-01-01")
+
+    with monkeypatch.context() as patch:
+        patch.setattr(db, "run_with_retry", broken)
+        today = db.get_birthdays_on(1, 1)
+        upcoming = db.get_upcoming_birthdays(7)
+
+    assert today.empty and list(today.columns) == ["name", "phone", "email", "birth_date"]
+    # Filtro usado pelo painel do admin
+    assert upcoming[upcoming["days_until"] > 0].empty
+    # O erro não ficou no cache
+    assert db.get_birthdays_on(1, 1)["name"].tolist() == ["Ana"]
+
+
+def add_client(username, birth_date, role="cliente"):
+    # Direto no banco: create_user gastaria um bcrypt por cliente
+    db.execute_write_query("INSERT INTO users (username, password, role, name, birth_date) VALUES (?, 'x', ?, ?, ?)",
+                           (username, role, username.capitalize(), birth_date))
+    db.bump_version("users")
+
+
+def test_birthdays_on_matches_month_and_day_through_index(temp_db):
+    add_client("ana", "1990-03-15")
+    add_client("bia", "2001-03-15")
+    add_client("caio", "1990-03-16")
+    add_client("davi", "1985-03-15", role="funcionario")
+
+    today = db.get_birthdays_on(3, 15)
+
+    assert today["name"].tolist() == ["Ana", "Bia"]
+    assert list(today.columns) == ["name", "phone", "email", "birth_date"]
+    plan = db.execute_read_query(
+        f"EXPLAIN QUERY PLAN SELECT name FROM users WHERE role = 'cliente' AND {db.BIRTHDAY_KEY_SQL} IN (?)", ("03-15",)
+    )
+    assert any("idx_users_birthday" in row[-1] for row in plan)
+
+
+def test_leap_day_birthday_is_celebrated_on_feb_28_in_common_years(temp_db):
+    add_client("leo", "2000-02-29")
+    add_client("lia", "1999-02-28")
+
+    assert db.get_birthdays_on(2, 28, year=2027)["name"].tolist() == ["Leo", "Lia"]
+    assert db.get_birthdays_on(2, 28, year=2028)["name"].tolist() == ["Lia"]
+    assert db.get_birthdays_on(2, 29, year=2028)["name"].tolist() == ["Leo"]
+
+
+def test_upcoming_birthdays_cross_the_year_boundary(temp_db):
+    add_client("nina", "1995-01-02")
+    add_client("otto", "1980-12-30")
+    add_client("paula", "1992-12-31")
+    add_client("rui", "1970-01-10")
+
+    upcoming = db.get_upcoming_birthdays(7, today=datetime.date(2026, 12, 30))
+
+    assert list(zip(upcoming["name"], upcoming["days_until"])) == [("Otto", 0), ("Paula", 1), ("Nina", 3)]
+
+
+def test_clients_without_birth_date_are_ignored(temp_db):
+    add_client("sem_data", None)
+    add_client("vazio", "")
+    add_client("ana", "1990-01-01")
+
+    assert db.get_birthdays_on(1, 1)["name"].tolist() == ["Ana"]
+    upcoming = db.get_upcoming_birthdays(366, today=datetime.date(2026, 1, 1))
+    assert upcoming["name"].tolist() == ["Ana"]
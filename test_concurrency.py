@@ -0,0 +1,108 @@
+import threading
+import time
+
+import pytest
+
+import database as db
+
+THREADS = 16
+SALES_PER_THREAD = 25
+INITIAL_STOCK = 100
+# Limite de latência p99 por venda sob contenção (antes: sleeps de 1s por retry)
+P99_LIMIT_SECONDS = 1.0
+
+
+def hammer(fn):
+    """Executa fn() SALES_PER_THREAD vezes em cada uma de THREADS threads ao mesmo tempo."""
+    barrier = threading.Barrier(THREADS)
+    results, latencies = [], []
+    lock = threading.Lock()
+
+    def worker():
+        barrier.wait()
+        for _ in range(SALES_PER_THREAD):
+            start = time.perf_counter()
+            result = fn()
+            elapsed = time.perf_counter() - start
+            with lock:
+                results.append(result)
+                latencies.append(elapsed)
+
+    threads = [threading.Thread(target=worker) for _ in range(THREADS)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    latencies.sort()
+    return results, latencies[int(len(latencies) * 0.99) - 1]
+
+
+@pytest.mark.parametrize("write_queue", [False, True], ids=["direct", "write_queue"])
+def test_concurrent_register_sale_never_oversells(temp_db, monkeypatch, write_queue):
+    monkeypatch.setattr(db, "WRITE_QUEUE_ENABLED", write_queue)
+    db.add_product("Perfume Concorrido", "Natura", "Perfumaria", "Colônias", 50.0, INITIAL_STOCK, "2030-01-01", None)
+
+    results, p99 = hammer(lambda: db.register_sale(1, 1, 1))
+
+    sold = [msg for ok, msg in results if ok]
+    refused = [msg for ok, msg in results if not ok]
+    assert len(sold) == INITIAL_STOCK
+    assert all(msg.startswith("Estoque insuficiente") for msg in refused)
+
+    stock = db.execute_read_query("SELECT quantity FROM products WHERE id = 1", fetch_one=True)[0]
+    units, revenue = db.execute_read_query("SELECT SUM(quantity), SUM(total_value) FROM sales", fetch_one=True)
+    assert stock == 0
+    assert units == INITIAL_STOCK
+    assert revenue == INITIAL_STOCK * 50.0
+    assert db.get_dashboard_metrics()["total_sold"] == INITIAL_STOCK
+    assert p99 < P99_LIMIT_SECONDS, f"p99 de {p99:.3f}s"
+    assert db.get_lock_stats()["gave_up"] == 0
+
+
+@pytest.mark.parametrize("write_queue", [False, True], ids=["direct", "write_queue"])
+def test_concurrent_multi_item_checkouts_are_atomic(temp_db, monkeypatch, write_queue):
+    # Na fila de escrita, pedidos recusados dividem a transação com pedidos
+    # aceitos: o SAVEPOINT de cada um precisa desfazer só as próprias baixas
+    monkeypatch.setattr(db, "WRITE_QUEUE_ENABLED", write_queue)
+    db.add_product("Kit A", "Natura", "Casa", "Outro", 10.0, INITIAL_STOCK, "", None)
+    db.add_product("Kit B", "Natura", "Casa", "Outro", 5.0, INITIAL_STOCK // 2, "", None)
+    cart = [{"product_id": 1, "quantity": 1}, {"product_id": 2, "quantity": 1}]
+
+    results, _ = hammer(lambda: db.checkout(cart, 1))
+
+    orders = sum(1 for ok, _, _ in results if ok)
+    # B acaba primeiro: nenhum pedido pode ter baixado A sem baixar B
+    assert orders == INITIAL_STOCK // 2
+    stock = dict(db.execute_read_query("SELECT id, quantity FROM products"))
+    assert stock == {1: INITIAL_STOCK - orders, 2: 0}
+    assert db.execute_read_query("SELECT COUNT(*) FROM orders", fetch_one=True)[0] == orders
+
+
+def test_write_queue_groups_concurrent_writes(temp_db, monkeypatch):
+    monkeypatch.setattr(db, "WRITE_QUEUE_ENABLED", True)
+    db.add_product("Sabonete", "Natura", "Corpo e Banho", "Sabonete", 5.0, THREADS * SALES_PER_THREAD, "", None)
+
+    results, _ = hammer(lambda: db.register_sale(1, 1, 1))
+
+    assert all(ok for ok, _ in results)
+    stats = db.get_write_queue_stats()
+    assert stats["ops"] == THREADS * SALES_PER_THREAD + 1
+    # Group commit: menos transações que operações
+    assert stats["batches"] < stats["ops"]
+
+
+def test_checkout_refuses_price_changed_after_cart(temp_db):
+    db.add_product("Kit A", "Natura", "Casa", "Outro", 10.0, 5, "", None)
+    cart = [{"product_id": 1, "name": "Kit A", "unit_price": 10.0, "quantity": 2}]
+    db.update_product(1, "Kit A", "Natura", "Casa", "Outro", 12.5, 5, "")
+
+    ok, _, failures = db.checkout(cart, 1)
+
+    assert not ok
+    assert failures == [{"product_id": 1, "current_price": 12.5,
+                         "message": "Preço de Kit A mudou de R$ 10.00 para R$ 12.50"}]
+    assert db.execute_read_query("SELECT quantity FROM products WHERE id = 1", fetch_one=True)[0] == 5
+    # Com o preço atualizado no carrinho, o pedido passa
+    cart[0]["unit_price"] = failures[0]["current_price"]
+    assert db.checkout(cart, 1)[0]
+    assert db.execute_read_query("SELECT total_value FROM orders", fetch_one=True)[0] == 25.0
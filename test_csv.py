@@ -1,5 +1,8 @@
 import pandas as pd
 import io
+import sqlite3
+
+import database as db
 
 # Simulate a CSV with semicolons and some potential quoting issues
 csv_content = """name;brand;style;type;price;quantity;expiration_date
@@ -8,19 +11,106 @@ Product 2;Brand B;Style Y;Type 2;20.0;10;2025-01-01
 "Product, with comma";Brand C;Style Z;Type 3;30.0;15;2025-06-01
 """
 
-try:
-    # Try reading with default (should fail or parse wrongly if it was purely commas expected, 
-    # but here it might just read 1 column)
-    # But we want to test our FIX: sep=None, engine='python'
+LARGE_ROWS = 200_000
+CHUNK_SIZE = 50_000
+
+
+def write_supplier_csv(path, rows, sep=";"):
+    """Gera um CSV de fornecedor no formato do export, com vírgula decimal e alguns erros."""
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(sep.join(["nome", "marca", "estilo", "tipo", "preco", "quantidade", "data_validade"]) + "\n")
+        for i in range(rows):
+            name = "" if i % 10_000 == 0 else f'"Óleo Corporal, lote {i}"'
+            f.write(sep.join([name, "Natura", "Corpo e Banho", "Óleo corporal", f"{i % 97},50", str(i % 40), "2030-01-01"]) + "\n")
+
+
+def test_sniffs_semicolon_separator():
+    dialect = db.sniff_csv_dialect(io.BytesIO(csv_content.encode("utf-8")))
+    df = pd.read_csv(io.StringIO(csv_content), sep=dialect.delimiter)
+    assert dialect.delimiter == ";"
+    assert len(df.columns) == 7
+    assert df.loc[2, "name"] == "Product, with comma"
+
+
+def test_streaming_import_of_large_supplier_file(temp_db, tmp_path):
+    path = tmp_path / "fornecedor.csv"
+    write_supplier_csv(path, LARGE_ROWS)
+
+    updates = []
+    with open(path, "rb") as f:
+        report = db.import_products_csv(f, chunksize=CHUNK_SIZE, progress=lambda frac, partial: updates.append(frac))
+
+    invalid = LARGE_ROWS // 10_000
+    assert report["imported"] == LARGE_ROWS - invalid
+    assert report["failed"] == invalid
+    assert report["errors"][0] == "Linha 2: Desconhecido - Nome do produto vazio"
+    # Um update de progresso por bloco, não por linha
+    assert len(updates) == LARGE_ROWS // CHUNK_SIZE
+    assert updates == sorted(updates) and updates[-1] == 1.0
+
+    count = db.execute_read_query("SELECT COUNT(*) FROM products", fetch_one=True)[0]
+    assert count == LARGE_ROWS - invalid
+    assert db.execute_read_query("SELECT price FROM products WHERE name = 'Óleo Corporal, lote 1'", fetch_one=True)[0] == 1.5
+
+
+def test_streaming_import_requires_name_column(temp_db):
+    try:
+        db.import_products_csv(io.BytesIO(csv_content.encode("utf-8")))
+    except ValueError as e:
+        assert "nome" in str(e)
+    else:
+        raise AssertionError("esperava ValueError sem a coluna 'nome'")
+
+
+def test_bulk_import_reports_bad_rows_and_upserts_by_id(temp_db):
+    db.add_product("Antigo", "Natura", "Perfumaria", "Colônias", 1.0, 1, "", None)
+    # Regra do banco que recusa uma linha específica: o lote é refeito linha a linha
+    db.execute_write_query("""CREATE TRIGGER proibido BEFORE INSERT ON products WHEN new.name = 'Proibido'
+                              BEGIN SELECT RAISE(ABORT, 'nome proibido'); END""")
+    df = pd.DataFrame({
+        "id": [1, None, None, None],
+        "nome": ["Atualizado", "", "Proibido", "Novo"],
+        "marca": ["Natura", "Natura", "Natura", "Marca Desconhecida"],
+        "preco": ["12,50", "1", "1", "-3"],
+        "quantidade": [4, 1, 1, 2],
+    })
+
+    report = db.import_products(df)
+
+    assert report["imported"] == 2
+    assert report["failed"] == 2
+    assert report["errors"] == ["Linha 3: Desconhecido - Nome do produto vazio",
+                                "Linha 4: Proibido - nome proibido"]
+    rows = db.execute_read_query("SELECT id, name, brand, price, quantity FROM products ORDER BY id")
+    assert rows == [(1, "Atualizado", "Natura", 12.5, 4), (2, "Novo", "Outra", 0.0, 2)]
+
+
+def test_bulk_import_rolls_back_on_database_failure(temp_db, monkeypatch):
+    db.add_product("Existente", "Natura", "Perfumaria", "Colônias", 1.0, 1, "", None)
+    monkeypatch.setattr(db, "IMPORT_BATCH_SIZE", 2)
+    real_batch = db._upsert_products_batch
+    calls = []
+
+    def failing_batch(c, batch, line_numbers, errors):
+        calls.append(len(batch))
+        if len(calls) == 2:
+            raise sqlite3.OperationalError("disk I/O error")
+        return real_batch(c, batch, line_numbers, errors)
+
+    monkeypatch.setattr(db, "_upsert_products_batch", failing_batch)
+    df = pd.DataFrame({"id": [1, None, None, None], "nome": ["Renomeado", "A", "B", "C"]})
+
+    report = db.import_products(df)
+
+    # O primeiro lote já tinha sido gravado, mas a transação inteira é desfeita
+    assert calls == [2, 2]
+    assert report["imported"] == 0
+    assert report["errors"][-1] == "Erro de banco de dados: disk I/O error"
+    assert db.execute_read_query("SELECT id, name FROM products") == [(1, "Existente")]
+
+
+if __name__ == "__main__":
     df = pd.read_csv(io.StringIO(csv_content), sep=None, engine='python')
     print("Successfully read CSV with auto-detection:")
     print(df.head())
     print(f"Columns: {df.columns.tolist()}")
-    
-    if len(df.columns) > 1:
-        print("PASS: Detected multiple columns.")
-    else:
-        print("FAIL: Detected only 1 column.")
-
-except Exception as e:
-    print(f"FAIL: Error reading CSV: {e}")
@@ -0,0 +1,101 @@
+import io
+
+import database as db
+from conftest import image_bytes
+import exports
+
+
+def test_pdf_is_cached_until_catalog_changes(temp_db):
+    db.add_product("Água de Colônia — Lavanda", "Natura", "Perfumaria", "Colônias", 1234.5, 3, "2030-01-31", None)
+
+    pdf = exports.catalog_pdf()
+    assert pdf.startswith(b"%PDF")
+    assert exports.catalog_pdf() is pdf
+
+    db.update_product(1, "Água de Colônia — Lavanda", "Natura", "Perfumaria", "Colônias", 99.9, 3, "2030-01-31")
+    assert exports.catalog_pdf() is not pdf
+
+
+def test_pdf_with_thumbnails_embeds_images(temp_db):
+    db.add_product("Com foto", "Avon", "Make", "Batom", 10.0, 1, "", image_bytes((64, 48), "red", "PNG"))
+    db.add_product("Sem foto", "Avon", "Make", "Batom", 10.0, 1, "", None)
+
+    plain = exports.catalog_pdf()
+    with_images = exports.catalog_pdf(with_images=True)
+    assert with_images is not plain
+    assert b"/Subtype /Image" in with_images
+    assert b"/Subtype /Image" not in plain
+
+
+def test_pdf_falls_back_to_core_font(temp_db, monkeypatch):
+    db.add_product("Kit “Presente” — Ç", "Natura", "Kits e Presentes", "Estojo", 50.0, 2, "", None)
+    monkeypatch.setattr(exports, "PDF_FONT_DIRS", [])
+
+    assert exports.build_catalog_pdf(db.get_catalog()).startswith(b"%PDF")
+
+
+def test_brazilian_formatting():
+    import pandas as pd
+
+    assert exports.format_brl(pd.Series([1234.5, None, 0.456])).tolist() == ["R$ 1.234,50", "R$ 0,00", "R$ 0,46"]
+    assert exports.format_date_br(pd.Series(["2030-01-31", "", None, "sem data"])).tolist() == \
+        ["31/01/2030", "", "", "sem data"]
+
+
+def test_csv_export_is_cached_and_reimportable(temp_db, tmp_path, monkeypatch):
+    db.add_product("Óleo, corporal", "Natura", "Corpo e Banho", "Óleo corporal", 39.9, 7, "2030-01-31", None)
+    db.add_product("Batom", "Avon", "Make", "Boca", 19.5, 2, "", None)
+
+    data = exports.catalog_export("csv")
+    assert exports.catalog_export("csv") is data
+
+    source = db.get_catalog()[list(exports.EXPORT_COLUMNS)]
+    # Reimporta num banco vazio
+    db.close_pool()
+    monkeypatch.setattr(db, "DB_NAME", str(tmp_path / "reimport.db"))
+    db.init_db()
+    report = db.import_products_csv(io.BytesIO(data))
+    assert report["imported"] == 2
+    assert db.get_catalog()[list(exports.EXPORT_COLUMNS)].fillna("").equals(source.fillna(""))
+
+
+def test_parquet_export_round_trips(temp_db):
+    import pandas as pd
+    import pytest
+
+    if "parquet" not in exports.available_formats():
+        pytest.skip("pyarrow/fastparquet não instalado")
+    db.add_product("Shampoo", "Natura", "Cabelo", "Shampoo", 25.0, 4, "2031-05-01", None)
+
+    frame = pd.read_parquet(io.BytesIO(exports.catalog_export("parquet")))
+    assert list(frame.columns) == list(exports.EXPORT_COLUMNS.values())
+    assert frame.loc[0, "nome"] == "Shampoo"
+
+
+def test_unavailable_format_is_rejected(monkeypatch):
+    monkeypatch.setitem(exports.EXPORT_FORMATS["xlsx"], "requires", ("pacote_que_nao_existe",))
+    assert "xlsx" not in exports.available_formats()
+    try:
+        exports.catalog_export("xlsx")
+    except ValueError as e:
+        assert "xlsx" in str(e)
+    else:
+        raise AssertionError("esperava ValueError para formato indisponível")
+
+
+def test_csv_with_images_streams_base64_originals(temp_db, monkeypatch):
+    import base64
+    import pandas as pd
+
+    monkeypatch.setattr(exports, "IMAGE_EXPORT_BATCH", 2)
+    for i in range(5):
+        db.add_product(f"Produto {i}", "Natura", "Make", "Boca", 10.0, 1, "", image_bytes((64, 48), (i * 40, 0, 0), "PNG") if i % 2 else None)
+
+    data = exports.catalog_csv_with_images()
+    frame = pd.read_csv(io.BytesIO(data), keep_default_na=False)
+
+    assert frame["nome"].tolist() == [f"Produto {i}" for i in range(5)]
+    for i, encoded in enumerate(frame["imagem"]):
+        image_hash = db.get_product_by_id(i + 1).image_hash
+        expected = db.get_image(image_hash, "original") if image_hash else None
+        assert (base64.b64decode(encoded) if encoded else None) == expected
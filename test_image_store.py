@@ -0,0 +1,41 @@
+import database as db
+from conftest import image_bytes
+
+
+def orphan_cleanup_after_prepare(monkeypatch):
+    """Simula uma limpeza de órfãs concorrente entre o processamento e a gravação."""
+    prepare = db._prepare_image
+
+    def racing(data):
+        record = prepare(data)
+        db.delete_orphan_images()
+        return record
+    monkeypatch.setattr(db, "_prepare_image", racing)
+
+
+def test_add_product_keeps_image_deleted_by_concurrent_cleanup(temp_db, monkeypatch):
+    data = image_bytes()
+    # Já no store sem referência (ex.: upload anterior abandonado): candidata a órfã
+    image_hash = db.store_image(data)
+    orphan_cleanup_after_prepare(monkeypatch)
+
+    assert db.add_product("Perfume", "Natura", "Perfumaria", "Colônias", 50.0, 3, "", data)
+
+    product = db.get_product_by_id(1)
+    assert product.image_hash == image_hash
+    assert db.get_image(image_hash, "thumb") is not None
+
+
+def test_update_product_swaps_image_and_drops_old_one(temp_db, monkeypatch):
+    old, new = image_bytes(color="teal"), image_bytes(color="orange")
+    db.add_product("Perfume", "Natura", "Perfumaria", "Colônias", 50.0, 3, "", old)
+    old_hash = db.get_product_by_id(1).image_hash
+    new_hash = db.store_image(new)
+    orphan_cleanup_after_prepare(monkeypatch)
+
+    assert db.update_product(1, "Perfume", "Natura", "Perfumaria", "Colônias", 55.0, 3, "", new)
+
+    product = db.get_product_by_id(1)
+    assert (product.image_hash, product.image_version, product.price) == (new_hash, 2, 55.0)
+    assert db.get_image(new_hash) is not None
+    assert db.get_image(old_hash) is None
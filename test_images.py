@@ -0,0 +1,80 @@
+import io
+
+import pytest
+from PIL import Image
+
+import images
+from conftest import image_bytes
+import utils
+
+
+@pytest.fixture(autouse=True)
+def restore_cache(monkeypatch):
+    # fresh_cache troca o cache do módulo; o monkeypatch devolve o original no fim
+    monkeypatch.setattr(utils, "_image_cache", utils._image_cache)
+
+
+def fresh_cache(max_bytes=utils.IMAGE_CACHE_MAX_BYTES):
+    utils._image_cache = utils.ByteLRUCache(max_bytes)
+
+
+def test_process_image_orients_and_fits_card():
+    fresh_cache()
+    # Foto em paisagem com EXIF "girar 90°": no card fica em retrato, com faixas laterais
+    data = image_bytes((1200, 600), orientation=6)
+
+    card = Image.open(io.BytesIO(utils.process_image(data, product_id=1)))
+
+    assert card.size == utils.CARD_IMAGE_SIZE
+    assert card.format == images.OUTPUT_FORMAT
+    assert card.convert("RGB").getpixel((5, 160)) == (255, 255, 255)
+    assert card.convert("RGB").getpixel((160, 5)) != (255, 255, 255)
+    assert not card.getexif()
+
+
+def test_process_image_decodes_once_per_key():
+    fresh_cache()
+    data = image_bytes()
+    loads = []
+
+    def loader():
+        loads.append(1)
+        return data
+
+    first = utils.process_image(loader, product_id=7, image_hash="abc")
+    second = utils.process_image(loader, product_id=7, image_hash="abc")
+
+    assert first is second
+    assert len(loads) == 1
+    stats = utils.get_image_cache_stats()
+    assert (stats["hits"], stats["misses"], stats["items"]) == (1, 1, 1)
+    # Tamanho diferente é outra entrada
+    assert Image.open(io.BytesIO(utils.process_image(loader, 7, "abc", (100, 100)))).size == (100, 100)
+    assert len(loads) == 2
+
+
+def test_process_image_cache_evicts_by_bytes():
+    fresh_cache()
+    card = utils.process_image(image_bytes(), product_id=1, image_hash="h1")
+    fresh_cache(max_bytes=len(card) * 2)
+
+    for product_id in range(1, 4):
+        utils.process_image(image_bytes(), product_id=product_id, image_hash=f"h{product_id}")
+
+    stats = utils.get_image_cache_stats()
+    assert stats["items"] == 2 and stats["evictions"] == 1
+    assert stats["bytes"] <= stats["max_bytes"]
+    assert utils._image_cache.get((1, "h1", utils.CARD_IMAGE_SIZE)) is None
+
+
+def test_process_image_from_file_and_invalid_input(tmp_path):
+    fresh_cache()
+    path = str(tmp_path / "5_foto.jpg")
+    with open(path, "wb") as f:
+        f.write(image_bytes())
+
+    assert utils.process_image(path, product_id=5) is not None
+    assert utils.process_image(b"nao e imagem", product_id=6) is None
+    assert utils.process_image(str(tmp_path / "sumiu.jpg")) is None
+    # Falhas não entram no cache
+    assert utils.get_image_cache_stats()["items"] == 1
@@ -0,0 +1,92 @@
+import os
+import subprocess
+import sys
+import urllib.error
+import urllib.request
+
+import pytest
+
+import database as db
+from conftest import image_bytes
+import images
+import media_server
+import utils
+
+
+@pytest.fixture
+def server(temp_db, monkeypatch):
+    monkeypatch.setattr(media_server, "MEDIA_SERVER_ENABLED", True)
+    media_server.stop_media_server()
+    # Porta 0: o sistema escolhe uma livre
+    started = media_server.start_media_server("127.0.0.1", 0)
+    yield f"http://127.0.0.1:{started.port}"
+    media_server.stop_media_server()
+
+
+def photo_hash():
+    return db.store_image(image_bytes())
+
+
+def get(url, **headers):
+    try:
+        with urllib.request.urlopen(urllib.request.Request(url, headers=headers)) as resp:
+            return resp.status, resp.headers, resp.read()
+    except urllib.error.HTTPError as e:
+        return e.code, e.headers, b""
+
+
+def test_serves_variant_with_immutable_cache_headers(server):
+    image_hash = photo_hash()
+    url = media_server.media_url(image_hash, "thumb", server)
+
+    status, headers, body = get(url)
+
+    assert status == 200
+    assert body == db.get_image(image_hash, "thumb")
+    assert headers["Content-Type"] == images.OUTPUT_MIME
+    assert headers["ETag"] == f'"{image_hash}-thumb"'
+    assert headers["Cache-Control"] == "public, max-age=31536000, immutable"
+
+
+def test_revalidation_returns_304_without_body(server):
+    image_hash = photo_hash()
+    url = media_server.media_url(image_hash, "preview", server)
+    _, headers, _ = get(url)
+    before = media_server.get_media_stats()
+
+    status, _, body = get(url, **{"If-None-Match": headers["ETag"]})
+
+    assert status == 304 and body == b""
+    after = media_server.get_media_stats()
+    assert after["not_modified"] == before["not_modified"] + 1
+    assert after["bytes"] == before["bytes"]
+
+
+def test_unknown_hash_and_bad_paths_are_404(server):
+    assert get(media_server.media_url("0" * 64, "thumb", server))[0] == 404
+    assert get(server + "/media/huge/" + "0" * 64)[0] == 404
+    assert get(server + "/media/thumb/../store.db")[0] == 404
+
+
+
+def media_settings(**env):
+    """Configuração lida por um processo novo, com só estas variáveis STORE_MEDIA_*."""
+    clean = {k: v for k, v in os.environ.items() if not k.startswith("STORE_MEDIA_")}
+    code = "import media_server as m; print(m.MEDIA_SERVER_ENABLED, m.MEDIA_HOST, repr(m.MEDIA_PUBLIC_URL))"
+    out = subprocess.run([sys.executable, "-c", code], env={**clean, **env}, capture_output=True, text=True, check=True)
+    return out.stdout.split()
+
+
+def test_server_is_opt_in_and_local_by_default():
+    assert media_settings() == ["False", "127.0.0.1", "''"]
+    assert media_settings(STORE_MEDIA_URL="https://loja.exemplo.com.br/") == ["True", "127.0.0.1", "'https://loja.exemplo.com.br'"]
+    assert media_settings(STORE_MEDIA_SERVER="1")[0] == "True"
+    assert media_settings(STORE_MEDIA_URL="https://loja.exemplo.com.br", STORE_MEDIA_SERVER="0")[0] == "False"
+
+
+def test_no_image_urls_while_disabled(temp_db, monkeypatch):
+    monkeypatch.setattr(media_server, "MEDIA_SERVER_ENABLED", False)
+    media_server.stop_media_server()
+
+    assert media_server.start_media_server("127.0.0.1", 0) is None
+    assert utils.get_image_url(photo_hash()) is None
@@ -0,0 +1,49 @@
+import sqlite3
+import threading
+
+import pytest
+
+import database as db
+
+
+def test_pool_reuses_connections(temp_db):
+    pool = db.ConnectionPool(temp_db, max_size=2)
+
+    first = pool.acquire()
+    pool.release(first)
+    second = pool.acquire()
+
+    assert second is first
+    assert pool.stats == {"created": 1, "reused": 1, "discarded": 0}
+    pool.release(second)
+    pool.close()
+
+
+def test_exhausted_pool_times_out_and_recovers(temp_db):
+    pool = db.ConnectionPool(temp_db, max_size=2)
+    held = [pool.acquire(), pool.acquire()]
+
+    with pytest.raises(sqlite3.OperationalError, match="esgotado"):
+        pool.acquire(timeout=0.05)
+
+    # Uma conexão devolvida por outra thread libera quem está esperando
+    threading.Timer(0.05, pool.release, args=(held.pop(),)).start()
+    conn = pool.acquire(timeout=2)
+    assert conn.execute("SELECT 1").fetchone() == (1,)
+    pool.release(conn)
+    pool.release(held.pop())
+    pool.close()
+
+
+def test_release_rolls_back_pending_transaction(temp_db):
+    pool = db.ConnectionPool(temp_db, max_size=1)
+    conn = pool.acquire()
+    conn.execute("BEGIN")
+    conn.execute("INSERT INTO products (name) VALUES ('Rascunho')")
+
+    pool.release(conn)
+
+    with pool.connection() as conn:
+        assert not conn.in_transaction
+        assert conn.execute("SELECT COUNT(*) FROM products").fetchone() == (0,)
+    pool.close()
@@ -0,0 +1,101 @@
+import subprocess
+import sys
+
+import pandas as pd
+
+import database as db
+
+# (dias atrás, produto, vendedor, quantidade, valor)
+SALES = [
+    (0, 1, 1, 2, 100.0),
+    (0, 1, 2, 1, 50.0),
+    (0, 2, 2, 3, 30.0),
+    (1, 2, 1, 1, 10.0),
+    (1, 1, None, 4, 200.0),
+    (5, 2, 2, 2, 20.0),
+    (5, 2, 2, 1, 10.0),
+    (40, 1, 1, 1, 50.0),
+]
+
+
+def raw(query):
+    return sorted(db.execute_read_query(query), key=repr)
+
+
+def frame_rows(df):
+    # pandas traz NaN onde o SQLite traz NULL (vendedor 0 não tem nome)
+    return sorted((tuple(None if pd.isna(v) else v for v in row) for row in df.itertuples(index=False, name=None)),
+                  key=repr)
+
+
+def rollup_rows():
+    # O trigger de DELETE zera a linha do grupo em vez de removê-la
+    return raw("SELECT day, product_id, seller_id, units, revenue, sale_count FROM sales_daily WHERE sale_count > 0")
+
+
+def seed_sales():
+    db.add_product("Colônia", "Natura", "Perfumaria", "Colônias", 50.0, 100, "", None)
+    db.add_product("Sabonete", "Natura", "Corpo", "Sabonetes", 10.0, 100, "", None)
+    db.create_user("joana", "segredo", "funcionario", "Joana")
+    conn = db.get_connection()
+    conn.executemany(
+        "INSERT INTO sales (product_id, quantity, total_value, sale_date, user_id) VALUES (?, ?, ?, datetime('now', ?), ?)",
+        [(product, qty, value, f"-{days} days", seller) for days, product, seller, qty, value in SALES]
+    )
+    # Única venda do seu grupo (dia 1, produto 2, vendedor 1): o grupo fica zerado
+    conn.execute("DELETE FROM sales WHERE product_id = 2 AND user_id = 1")
+    conn.commit()
+    conn.close()
+    db.bump_version("sales")
+
+
+def test_triggers_keep_rollup_equal_to_raw_sales(temp_db):
+    seed_sales()
+
+    assert rollup_rows() == raw('''
+        SELECT date(sale_date), COALESCE(product_id, 0), COALESCE(user_id, 0),
+               SUM(quantity), SUM(total_value), COUNT(*)
+        FROM sales GROUP BY 1, 2, 3''')
+
+
+def test_reports_match_group_by_over_raw_sales(temp_db):
+    seed_sales()
+
+    by_day = db.get_sales_by_day(30)
+    assert frame_rows(by_day) == raw('''
+        SELECT date(sale_date), SUM(quantity), SUM(total_value), COUNT(*) FROM sales
+        WHERE date(sale_date) >= date('now', '-29 days') GROUP BY 1''')
+
+    by_product = db.get_sales_by_product()
+    assert frame_rows(by_product) == raw('''
+        SELECT s.product_id, p.name, SUM(s.quantity), SUM(s.total_value)
+        FROM sales s JOIN products p ON p.id = s.product_id GROUP BY 1''')
+    assert by_product["revenue"].is_monotonic_decreasing
+
+    by_seller = db.get_sales_by_seller(days=7)
+    assert frame_rows(by_seller) == raw('''
+        SELECT COALESCE(s.user_id, 0), u.name, SUM(s.quantity), SUM(s.total_value), COUNT(*)
+        FROM sales s LEFT JOIN users u ON u.id = s.user_id
+        WHERE date(s.sale_date) >= date('now', '-6 days') GROUP BY 1''')
+
+
+def test_rebuild_restores_rollup(temp_db):
+    seed_sales()
+    expected = rollup_rows()
+    db.execute_write_query("DELETE FROM sales_daily")
+
+    assert db.rebuild_sales_daily() == len(expected)
+    assert rollup_rows() == expected
+
+
+def test_backfill_cli(temp_db):
+    seed_sales()
+    expected = rollup_rows()
+    db.execute_write_query("DELETE FROM sales_daily")
+    db.close_pool()
+
+    out = subprocess.run([sys.executable, "database.py", "backfill-sales-daily", "--db", temp_db],
+                         capture_output=True, text=True, check=True).stdout
+
+    assert f"sales_daily recalculado: {len(expected)} linhas" in out
+    assert rollup_rows() == expected
@@ -0,0 +1,89 @@
+import sqlite3
+
+import bcrypt
+
+import database as db
+from conftest import image_bytes
+
+# Schema do banco antes do controle de versão (user_version = 0)
+BASELINE_SCHEMA = '''
+CREATE TABLE users (
+    id INTEGER PRIMARY KEY AUTOINCREMENT, username TEXT UNIQUE NOT NULL, password TEXT NOT NULL,
+    role TEXT NOT NULL, name TEXT, birth_date TEXT, email TEXT, phone TEXT, cpf TEXT,
+    profile_image BLOB, preferred_type TEXT, preferred_brand TEXT, preferred_style TEXT
+);
+CREATE TABLE products (
+    id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT NOT NULL, brand TEXT, style TEXT, type TEXT,
+    price REAL, quantity INTEGER, expiration_date TEXT, image BLOB
+);
+CREATE TABLE sales (
+    id INTEGER PRIMARY KEY AUTOINCREMENT, product_id INTEGER, quantity INTEGER, total_value REAL,
+    sale_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP, user_id INTEGER
+);
+'''
+
+
+def create_baseline_db(path):
+    conn = sqlite3.connect(path)
+    conn.executescript(BASELINE_SCHEMA)
+    password = bcrypt.hashpw(b"admin123", bcrypt.gensalt(rounds=4)).decode()
+    conn.execute("INSERT INTO users (username, password, role, name) VALUES ('admin', ?, 'admin', 'Administrador')",
+                 (password,))
+    conn.execute("INSERT INTO products (name, brand, style, type, price, quantity, expiration_date, image) "
+                 "VALUES ('Óleo Trifásico', 'Natura', 'Corpo e Banho', 'Óleo corporal', 59.9, 3, '2030-01-01', ?)",
+                 (image_bytes((1000, 500), "orange", "PNG"),))
+    conn.execute("INSERT INTO products (name, brand, style, type, price, quantity) "
+                 "VALUES ('Batom', 'Avon', 'Make', 'Boca', 20.0, 1)")
+    conn.execute("INSERT INTO sales (product_id, quantity, total_value, sale_date, user_id) "
+                 "VALUES (1, 2, 119.8, '2026-03-10 10:00:00', 1)")
+    conn.commit()
+    conn.close()
+
+
+def test_baseline_database_is_upgraded_in_place(temp_db, tmp_path, monkeypatch, capsys):
+    legacy = str(tmp_path / "legado.db")
+    create_baseline_db(legacy)
+    db.close_pool()
+    monkeypatch.setattr(db, "DB_NAME", legacy)
+
+    db.init_db()
+
+    assert db.get_schema_version() == db.SCHEMA_VERSION
+    assert f"Schema migrado da versão 0 para {db.SCHEMA_VERSION}" in capsys.readouterr().out
+    # BLOB saiu de products para o store de imagens, com derivados
+    image_hash, image = db.execute_read_query("SELECT image_hash, image FROM products WHERE id = 1", fetch_one=True)
+    assert image is None and image_hash
+    assert db.get_image(image_hash, "thumb") is not None
+    assert not db.get_product_by_id(2).has_image
+    # Dados antigos entram nos índices e no rollup criados pelas migrações
+    assert [p.id for p in db.search_products("oleo")[0]] == [1]
+    assert db.execute_read_query("SELECT units, revenue FROM sales_daily", fetch_one=True) == (2, 119.8)
+    assert db.check_login("admin", "admin123").role == "admin"
+
+
+def test_init_db_runs_migrations_once_per_database(temp_db, monkeypatch):
+    def fail(*args):
+        raise AssertionError("migrações não deveriam rodar de novo")
+
+    # Rerun no mesmo processo: retorna sem ir ao banco
+    with monkeypatch.context() as m:
+        m.setattr(db, "run_with_retry", fail)
+        db.init_db()
+
+    # Processo novo sobre um banco já migrado: só confere o user_version
+    monkeypatch.setattr(db, "MIGRATIONS", [fail] * db.SCHEMA_VERSION)
+    monkeypatch.setattr(db, "_schema_ready_for", None)
+    db.init_db()
+    assert db._schema_ready_for == temp_db
+
+
+def test_init_db_is_quiet_unless_it_upgrades(temp_db, tmp_path, monkeypatch, capsys):
+    db.close_pool()
+    monkeypatch.setattr(db, "DB_NAME", str(tmp_path / "novo.db"))
+
+    # Banco novo e, num processo novo, banco já na versão atual
+    db.init_db()
+    db._schema_ready_for = None
+    db.init_db()
+
+    assert capsys.readouterr().out == ""
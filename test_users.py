@@ -0,0 +1,126 @@
+import io
+
+import pytest
+from PIL import Image
+
+import auth
+from conftest import image_bytes
+import database as db
+
+
+def test_login_returns_small_session_record(temp_db):
+
+    user = db.check_login("admin", "admin123")
+
+    assert user == db.SessionUser(1, "admin", "admin", "Administrador", None)
+    assert db.check_login("admin", "errada") is None
+
+
+def test_profile_image_is_stored_outside_users_row(temp_db):
+    db.create_user("maria", "segredo", "funcionario", "Maria")
+    user = db.check_login("maria", "segredo")
+
+    updated = db.update_user_image(user.id, image_bytes())
+
+    avatar_hash = updated.avatar_hash
+    assert (updated.id, updated.name) == (user.id, user.name) and avatar_hash
+    assert db.execute_read_query("SELECT profile_image FROM users WHERE id = ?", (user.id,), fetch_one=True)[0] is None
+    thumb = Image.open(io.BytesIO(db.get_image(avatar_hash, "thumb")))
+    assert max(thumb.size) <= 320
+    assert db.check_login("maria", "segredo").avatar_hash == avatar_hash
+
+    # Limpeza de imagens órfãs não pode apagar fotos de perfil
+    db.delete_orphan_images()
+    assert db.get_image(avatar_hash, "thumb") is not None
+
+    # Trocar a foto libera a anterior
+    replaced = db.update_user_image(user.id, image_bytes((600, 600)))
+    assert replaced.avatar_hash != avatar_hash
+    assert db.get_image(avatar_hash) is None
+
+
+def test_legacy_profile_blobs_are_migrated(temp_db):
+    legacy = image_bytes()
+    conn = db.get_connection()
+    conn.execute("UPDATE users SET profile_image = ? WHERE username = 'admin'", (legacy,))
+    conn.execute("PRAGMA user_version = 9")
+    conn.commit()
+    conn.close()
+
+    db._schema_ready_for = None
+    db.init_db()
+
+    assert db.get_schema_version() == db.SCHEMA_VERSION
+    user = db.check_login("admin", "admin123")
+    assert user.avatar_hash is not None
+    assert db.execute_read_query("SELECT COUNT(*) FROM users WHERE profile_image IS NOT NULL", fetch_one=True)[0] == 0
+
+
+def test_session_token_resumes_without_password(temp_db):
+    user = db.check_login("admin", "admin123")
+    token = db.create_session(user.id)
+    verifications = auth.get_auth_stats()["verifications"]
+
+    assert db.resume_session(token) == user
+    assert db.session_identity(user) == db.SessionIdentity(1, "admin", "Administrador")
+    assert auth.get_auth_stats()["verifications"] == verifications
+    # Só o hash do id fica no banco
+    stored = db.execute_read_query("SELECT id_hash FROM sessions", fetch_one=True)[0]
+    assert stored not in token
+
+    tampered = token.rsplit(".", 1)[0] + "." + "0" * 64
+    assert db.resume_session(tampered) is None
+    assert db.resume_session("lixo") is None
+
+    assert db.end_session(token)
+    assert db.resume_session(token) is None
+
+
+def test_expired_session_token_is_rejected(temp_db):
+    secret = db._session_secret()
+    token, session_id, expires_at = auth.new_session_token(secret, ttl=60, now=1000)
+
+    assert auth.parse_session_token(token, secret, now=1059) == (session_id, expires_at)
+    assert auth.parse_session_token(token, secret, now=1060) is None
+    assert auth.parse_session_token(token, b"outro segredo", now=1000) is None
+
+
+def test_session_user_cache_follows_avatar_changes(temp_db):
+    assert db.get_session_user(1) is db.get_session_user(1)
+
+    updated = db.update_user_image(1, image_bytes())
+
+    assert db.get_session_user(1).avatar_hash == updated.avatar_hash
+    assert db.get_session_user(999) is None
+
+
+def test_profile_image_survives_concurrent_orphan_cleanup(temp_db, monkeypatch):
+    data = image_bytes()
+    # Já no store sem referência: uma limpeza entre o processamento e a gravação a apagaria
+    image_hash = db.store_image(data)
+    prepare = db._prepare_image
+
+    def racing(data):
+        record = prepare(data)
+        db.delete_orphan_images()
+        return record
+    monkeypatch.setattr(db, "_prepare_image", racing)
+
+    updated = db.update_user_image(1, data)
+
+    assert updated.avatar_hash == image_hash
+    assert db.get_image(image_hash, "thumb") is not None
+
+
+def test_fetch_session_user_tells_missing_user_from_read_error(temp_db, monkeypatch):
+    assert db.fetch_session_user(999) is None
+
+    def locked(fn, *args):
+        raise db.sqlite3.OperationalError("database is locked")
+    db.clear_cache()
+    monkeypatch.setattr(db, "run_with_retry", locked)
+
+    # Só um usuário confirmado ausente encerra a sessão; erro de leitura não
+    with pytest.raises(db.sqlite3.OperationalError):
+        db.fetch_session_user(1)
+    assert db.get_session_user(1) is None
@@ -1,5 +1,5 @@
 import streamlit as st
-import base64
+import database as db
 import io
 from pathlib import Path
 
@@ -44,14 +44,160 @@ COLOR_TEXT_LARGE_1 = "#800020"
 COLOR_TEXT_LARGE_2 = "#36454F"
 
 import os
+import threading
+from collections import OrderedDict
+from urllib.parse import urlsplit
+
+import images
+import media_server
+
+# Imagens prontas para os cards do catálogo, compartilhadas por todas as
+# sessões do processo. O limite é pelo total de bytes guardados: ao passar
+# dele, saem as menos usadas recentemente.
+IMAGE_CACHE_MAX_BYTES = int(os.environ.get("STORE_IMAGE_CACHE_MB", "64")) * 1024 * 1024
+CARD_IMAGE_SIZE = images.THUMB_SIZE
+
+
+class ByteLRUCache:
+    """LRU de valores bytes limitado pela soma dos tamanhos (thread-safe)."""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+        self.size = 0
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+    def get(self, key):
+        with self._lock:
+            value = self._items.get(key)
+            if value is None:
+                self.stats["misses"] += 1
+                return None
+            self._items.move_to_end(key)
+            self.stats["hits"] += 1
+            return value
+
+    def put(self, key, value):
+        if len(value) > self.max_bytes:
+            return
+        with self._lock:
+            old = self._items.pop(key, None)
+            if old is not None:
+                self.size -= len(old)
+            self._items[key] = value
+            self.size += len(value)
+            while self.size > self.max_bytes:
+                _, evicted = self._items.popitem(last=False)
+                self.size -= len(evicted)
+                self.stats["evictions"] += 1
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self.size = 0
+
+    def __len__(self):
+        return len(self._items)
+
+
+_image_cache = ByteLRUCache(IMAGE_CACHE_MAX_BYTES)
+
+
+def process_image(image_source, product_id=None, image_hash=None, size=CARD_IMAGE_SIZE):
+    """
+    Prepara uma imagem para o card do catálogo: decodifica, aplica a rotação
+    EXIF, enquadra em `size` e re-encoda. O resultado fica no cache do processo
+    com a chave (produto, hash da imagem, tamanho).
+    image_source: bytes, caminho de arquivo ou função sem argumentos que
+    devolve os bytes (só chamada quando a imagem não está em cache).
+    Retorna bytes prontos para st.image, ou None se não houver imagem válida.
+    """
+    if image_hash is None:
+        if isinstance(image_source, (str, os.PathLike)):
+            # Arquivo: a chave muda se ele for substituído
+            try:
+                stat = os.stat(image_source)
+            except OSError:
+                return None
+            image_hash = f"{os.fspath(image_source)}:{stat.st_mtime_ns}:{stat.st_size}"
+        else:
+            if callable(image_source):
+                image_source = image_source()
+            if not image_source:
+                return None
+            image_hash = images.content_hash(image_source)
+
+    key = (product_id, image_hash, tuple(size))
+    cached = _image_cache.get(key)
+    if cached is not None:
+        return cached
+
+    try:
+        if isinstance(image_source, (str, os.PathLike)):
+            with open(image_source, "rb") as f:
+                data = f.read()
+        elif callable(image_source):
+            data = image_source()
+        else:
+            data = image_source
+        if not data:
+            return None
+        processed = images.render_card(data, size)
+    except Exception as e:
+        print(f"Erro ao processar imagem {image_hash}: {e}")
+        return None
+    _image_cache.put(key, processed)
+    return processed
 
-def get_product_image_source(product_row):
+
+def get_image_cache_stats():
+    return dict(_image_cache.stats, items=len(_image_cache), bytes=_image_cache.size,
+                max_bytes=_image_cache.max_bytes)
+
+def _media_base_url():
+    """
+    Origem pública do servidor de mídia para esta sessão, ou None se não der
+    para usar. Só há URL com o servidor ligado explicitamente (ver media_server).
+    """
+    server = media_server.get_media_server()
+    if server is None:
+        return None
+    if media_server.MEDIA_PUBLIC_URL:
+        return media_server.MEDIA_PUBLIC_URL
+    # Sem STORE_MEDIA_URL (STORE_MEDIA_SERVER=1): porta acessível direto no host do app
+    try:
+        url = urlsplit(st.context.url or "")
+    except Exception:
+        return None
+    # App em https sem STORE_MEDIA_URL: imagem http seria bloqueada (mixed content)
+    if url.scheme != "http" or not url.hostname:
+        return None
+    host = f"[{url.hostname}]" if ":" in url.hostname else url.hostname
+    return f"http://{host}:{server.port}"
+
+def get_image_url(image_hash, variant="thumb"):
+    """URL fixa (cacheável pelo navegador) de uma imagem do store, ou None sem servidor de mídia."""
+    base_url = _media_base_url()
+    return media_server.media_url(image_hash, variant, base_url) if base_url else None
+
+def get_product_image_source(product_row, variant="thumb"):
     """
     Returns the image source for st.image.
     Fetches directly from database blob to ensure persistence.
     Ignores local file system to avoid issues with ephemeral storage (Streamlit Cloud).
+    Grids use the fixed-size "thumb"; detail views should ask for "preview".
+    With the media server running this is a content-hash URL, so the browser
+    downloads each image once; otherwise the bytes go through st.image.
     """
-    img_data = product_row.get('image')
+    if not product_row.has_image:
+        return None
+
+    url = get_image_url(product_row.image_hash, variant)
+    if url:
+        return url
+
+    img_data = db.get_image(product_row.image_hash, variant)
     
     # Se houver dados e forem bytes não vazios
     if img_data is not None and isinstance(img_data, bytes) and len(img_data) > 0:
@@ -61,6 +207,11 @@ def get_product_image_source(product_row):
 
 
 
+@st.cache_data(max_entries=256, show_spinner=False)
+def get_avatar_thumb(image_hash):
+    """Miniatura da foto de perfil. O hash identifica o conteúdo, então o cache nunca fica velho."""
+    return db.get_image(image_hash, "thumb")
+
 def ensure_directories():
     """Garante que diretórios essenciais existam"""
     try:
@@ -271,53 +422,3 @@ def apply_custom_css():
         }
         </style>
     """, unsafe_allow_html=True)
-
-from fpdf import FPDF
-import pandas as pd
-
-def generate_pdf(products_df):
-    pdf = FPDF()
-    pdf.add_page()
-    # Usar fonte padrão que suporta caracteres básicos, mas para caracteres especiais complexos
-    # FPDF padrão tem limitações. Vamos tentar limpar o texto ou usar codificação 'latin-1' compatível
-    pdf.set_font("Arial", size=12)
-    
-    pdf.cell(200, 10, txt="Relatório de Produtos", ln=1, align='C')
-    pdf.ln(10)
-    
-    for index, row in products_df.iterrows():
-        # Função auxiliar para limpar/substituir caracteres problemáticos
-        def clean_text(text):
-            try:
-                # Tenta codificar e decodificar para garantir compatibilidade com latin-1
-                return str(text).encode('latin-1', 'replace').decode('latin-1')
-            except Exception:
-                return "?"
-
-        # Truncate text to avoid overflow if necessary, or just simple list
-        try:
-            text = f"ID: {row['id']} | Nome: {clean_text(str(row['name'])[:30])} | Marca: {clean_text(str(row['brand'])[:15])}"
-            text2 = f"   Qtd: {row['quantity']} | Preço: R$ {row['price']} | Val: {row['expiration_date']}"
-            pdf.cell(0, 8, txt=text, ln=1)
-            pdf.cell(0, 8, txt=text2, ln=1)
-            pdf.ln(2)
-        except Exception as e:
-            print(f"Erro ao gerar linha PDF: {e}")
-            pdf.cell(0, 8, txt="Erro ao processar linha", ln=1)
-        
-    try:
-        output = pdf.output(dest='S')
-        return output.encode('latin-1', 'replace') if isinstance(output, str) else bytes(output)
-    except Exception as e:
-        return b""
-
-def convert_df_to_csv(df):
-    # Criamos uma cópia para não afetar o DataFrame original da tela
-    df_export = df.copy()
-    
-    # Se a coluna image existir, converte os bytes para string Base64
-    if 'image' in df_export.columns:
-        df_export['image'] = df_export['image'].apply(
-            lambda x: base64.b64encode(x).decode('utf-8') if isinstance(x, bytes) else ""
-        )
-    return df.to_csv(index=False).encode('utf-8')
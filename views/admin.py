@@ -2,58 +2,59 @@ import streamlit as st
 import pandas as pd
 import database as db
 import utils
+import media_server
+import auth
 import views.components as components
 import datetime
 
 def show_admin_view(user):
-    st.title(f"Painel Administrativo - Bem-vindo, {user[4]}")
+    st.title(f"Painel Administrativo - Bem-vindo, {user.name}")
     
     tab1, tab2, tab3 = st.tabs(["Dashboard", "Gerenciar Produtos", "Gerenciar Usuários"])
     
     with tab1:
         # Aniversariantes do Dia
-        birthday_clients = db.get_birthday_clients()
-        if not birthday_clients.empty:
-            today = datetime.date.today()
-            birthdays_today = []
+        # Busca indexada pelo mês-dia; traz só nome/telefone/email
+        today = datetime.date.today()
+        birthdays_today = db.get_birthdays_on(today.month, today.day).to_dict('records')
+        if birthdays_today:
+            st.error(f"🎉 ATENÇÃO: HOJE É ANIVERSÁRIO DE {len(birthdays_today)} CLIENTE(S)!")
+            st.markdown("""
+            <div style="background-color: #ffeebb; padding: 15px; border-radius: 10px; border: 2px solid #ffa500; margin-bottom: 20px;">
+                <h3 style="color: #d35400; margin-top: 0;">🎂 Oportunidade de Venda!</h3>
+                <p style="font-size: 16px;">
+                    Lembre-se de enviar uma mensagem parabenizando e <b>sugerindo a compra de um presente especial</b> da loja!
+                    Ofereça um desconto ou mostre os lançamentos.
+                </p>
+            </div>
+            """, unsafe_allow_html=True)
             
-            for index, row in birthday_clients.iterrows():
-                try:
-                    bdate_str = str(row['birth_date'])
-                    # Assume formato YYYY-MM-DD
-                    bdate = datetime.datetime.strptime(bdate_str, "%Y-%m-%d").date()
-                    if bdate.month == today.month and bdate.day == today.day:
-                        birthdays_today.append(row)
-                except:
-                    pass
-            
-            if birthdays_today:
-                st.error(f"🎉 ATENÇÃO: HOJE É ANIVERSÁRIO DE {len(birthdays_today)} CLIENTE(S)!")
-                st.markdown("""
-                <div style="background-color: #ffeebb; padding: 15px; border-radius: 10px; border: 2px solid #ffa500; margin-bottom: 20px;">
-                    <h3 style="color: #d35400; margin-top: 0;">🎂 Oportunidade de Venda!</h3>
-                    <p style="font-size: 16px;">
-                        Lembre-se de enviar uma mensagem parabenizando e <b>sugerindo a compra de um presente especial</b> da loja!
-                        Ofereça um desconto ou mostre os lançamentos.
-                    </p>
-                </div>
-                """, unsafe_allow_html=True)
-                
-                for b_client in birthdays_today:
-                    st.markdown(f"🎈 **{b_client['name']}**")
-                    st.text(f"📞 Telefone: {b_client['phone'] or 'Não informado'}")
-                    st.text(f"📧 Email: {b_client['email'] or 'Não informado'}")
-                    st.divider()
+            for b_client in birthdays_today:
+                st.markdown(f"🎈 **{b_client['name']}**")
+                st.text(f"📞 Telefone: {b_client['phone'] or 'Não informado'}")
+                st.text(f"📧 Email: {b_client['email'] or 'Não informado'}")
+                st.divider()
+
+        upcoming = db.get_upcoming_birthdays(7)
+        upcoming = upcoming[upcoming['days_until'] > 0]
+        if not upcoming.empty:
+            with st.expander(f"📅 Próximos aniversários (7 dias): {len(upcoming)}"):
+                st.dataframe(
+                    upcoming[['name', 'phone', 'email', 'days_until']].rename(columns={
+                        'name': 'Nome', 'phone': 'Telefone', 'email': 'Email', 'days_until': 'Em (dias)'
+                    }),
+                    hide_index=True
+                )
 
         st.header("Visão Geral")
-        products = db.get_products()
-        sales = db.get_sales_report()
+        # Agregados calculados no banco (custo constante, sem carregar tabelas no pandas)
+        metrics = db.get_dashboard_metrics()
         
         col1, col2, col3 = st.columns(3)
         
-        total_stock = products['quantity'].sum() if not products.empty else 0
-        total_sold = sales['quantity'].sum() if not sales.empty else 0
-        total_revenue = sales['total_value'].sum() if not sales.empty else 0.0
+        total_stock = metrics['total_stock']
+        total_sold = metrics['total_sold']
+        total_revenue = metrics['total_revenue']
         
         col1.metric("Produtos em Estoque", int(total_stock))
         col2.metric("Produtos Vendidos", int(total_sold))
@@ -64,7 +65,7 @@ def show_admin_view(user):
         col4, col5 = st.columns(2)
         
         # Valor total em estoque (preço * quantidade para cada produto)
-        total_stock_value = (products['price'] * products['quantity']).sum() if not products.empty else 0.0
+        total_stock_value = metrics['total_stock_value']
         
         col4.metric("Valor Total em Estoque", f"R$ {total_stock_value:,.2f}".replace(",", "X").replace(".", ",").replace("X", "."))
         
@@ -79,16 +80,33 @@ def show_admin_view(user):
         """, unsafe_allow_html=True)
 
         st.subheader("Estoque vs Vendas")
-        if not products.empty or not sales.empty:
+        if metrics['product_count'] > 0 or metrics['sale_count'] > 0:
             chart_data = pd.DataFrame({
                 'Categoria': ['Estoque', 'Vendidos'],
                 'Quantidade': [total_stock, total_sold]
             })
             st.bar_chart(chart_data, x='Categoria', y='Quantidade', color="#800020")
             
+        # Relatórios a partir do rollup diário (poucas linhas, independente do histórico)
+        st.subheader("Receita por Dia (últimos 30 dias)")
+        sales_by_day = db.get_sales_by_day(30)
+        if not sales_by_day.empty:
+            st.line_chart(sales_by_day, x='day', y='revenue', color="#800020")
+            
+            col_top1, col_top2 = st.columns(2)
+            with col_top1:
+                st.caption("Mais vendidos (30 dias)")
+                st.dataframe(db.get_sales_by_product(days=30, limit=10), hide_index=True)
+            with col_top2:
+                st.caption("Vendas por usuário (30 dias)")
+                st.dataframe(db.get_sales_by_seller(days=30), hide_index=True)
+        else:
+            st.info("Nenhuma venda nos últimos 30 dias.")
+            
         st.subheader("Últimas Vendas")
-        if not sales.empty:
-            st.dataframe(sales.sort_values(by='sale_date', ascending=False).head(10))
+        recent_sales = db.get_recent_sales(10)
+        if not recent_sales.empty:
+            st.dataframe(recent_sales)
         else:
             st.info("Nenhuma venda registrada.")
 
@@ -96,58 +114,59 @@ def show_admin_view(user):
         st.subheader("Visualização Rápida de Produtos (Dashboard)")
         
         # Dashboard Product Grid (Simplified view, maybe allow sale)
-        if not products.empty:
+        if metrics['product_count'] > 0:
             # Area de Pesquisa no Dashboard
             search_term = st.text_input("🔍 Pesquisar Produto", placeholder="Nome, Marca, Estilo ou Tipo...", key="dash_search")
-            
-            if search_term:
-                products = products[
-                    products['name'].str.contains(search_term, case=False, na=False) |
-                    products['brand'].str.contains(search_term, case=False, na=False) |
-                    products['style'].str.contains(search_term, case=False, na=False) |
-                    products['type'].str.contains(search_term, case=False, na=False) |
-                    products['id'].astype(str).str.contains(search_term, case=False, na=False) |
-                    products['price'].astype(str).str.contains(search_term, case=False, na=False) |
-                    products['quantity'].astype(str).str.contains(search_term, case=False, na=False) |
-                    products['expiration_date'].astype(str).str.contains(search_term, case=False, na=False)
-                ]
 
-            cols_per_row = 4
-            rows = len(products)
-            
-            for i in range(0, rows, cols_per_row):
-                cols = st.columns(cols_per_row)
-                for j in range(cols_per_row):
-                    if i + j < rows:
-                        row = products.iloc[i + j]
-                        with cols[j]:
-                            with st.container(border=True):
-                                # Image
-                                img_src = utils.get_product_image_source(row)
-                                if img_src:
-                                    st.image(img_src, use_container_width=True)
-                                else:
-                                    st.markdown("*Sem Imagem*")
-                                    
-                                st.markdown(f"**{row['name']}**")
-                                st.caption(f"Estoque: {row['quantity']}")
-                                st.markdown(f"**R$ {row['price']:.2f}**")
-                                st.caption(f"Val: {row['expiration_date']}")
-                                
-                                # Quick Sale Action
-                                if row['quantity'] > 0:
-                                    with st.expander("Vender"):
-                                        q_sell = st.number_input("Qtd", 1, int(row['quantity']), key=f"dash_sell_{row['id']}")
-                                        if st.button("OK", key=f"dash_btn_{row['id']}"):
-                                            success, msg = db.register_sale(int(row['id']), q_sell, user[0])
-                                            if success:
-                                                st.toast(msg, icon="✅")
-                                                st.rerun()
-                                            else:
-                                                st.toast(msg, icon="❌")
+            def render_card(row):
+                # Image
+                img_src = utils.get_product_image_source(row)
+                if img_src:
+                    st.image(img_src, use_container_width=True)
+                else:
+                    st.markdown("*Sem Imagem*")
+                    
+                st.markdown(f"**{row.name}**")
+                st.caption(f"Estoque: {row.quantity}")
+                st.markdown(f"**R$ {row.price:.2f}**")
+                st.caption(f"Val: {row.expiration_date}")
+                
+                # Quick Sale Action
+                if row.quantity > 0:
+                    with st.expander("Vender"):
+                        q_sell = st.number_input("Qtd", 1, row.quantity, key=f"dash_sell_{row.id}")
+                        if st.button("OK", key=f"dash_btn_{row.id}"):
+                            success, msg = db.register_sale(row.id, q_sell, user.id)
+                            if success:
+                                st.toast(msg, icon="✅")
+                                st.rerun()
+                            else:
+                                st.toast(msg, icon="❌")
+
+            components.render_product_grid("dash_grid", render_card, search=search_term, cols_per_row=4)
         else:
             st.info("Nenhum produto cadastrado.")
 
+        st.divider()
+        with st.expander("⚙️ Diagnóstico do Banco de Dados"):
+            col_d1, col_d2 = st.columns(2)
+            with col_d1:
+                st.caption("Contenção de escrita (desde o início do processo)")
+                st.json(db.get_lock_stats())
+                st.caption("Cache de leitura (acertos/faltas e versões por domínio)")
+                st.json(db.get_cache_stats())
+                st.caption("Cache de imagens do catálogo")
+                st.json(utils.get_image_cache_stats())
+                st.caption("Servidor de mídia (200 servidas / 304 revalidadas)")
+                st.json(media_server.get_media_stats())
+            with col_d2:
+                st.caption("Pool de conexões")
+                st.json(db.get_pool_stats())
+                st.caption("Fila de escrita (STORE_DB_WRITE_QUEUE)")
+                st.json(db.get_write_queue_stats())
+                st.caption("Login (verificações bcrypt, acertos do cache de falhas, bloqueios)")
+                st.json(auth.get_auth_stats())
+
     with tab2:
         components.render_product_management()
 
@@ -198,9 +217,7 @@ def show_admin_view(user):
                     st.error("Preencha todos os campos obrigatórios")
                     
         st.subheader("Usuários Existentes")
-        conn = db.get_connection()
         # Update query to show new fields if needed, but dataframe might get too wide. 
         # Keeping it simple or maybe showing email/phone.
-        users_df = pd.read_sql("SELECT id, username, role, name, email, phone FROM users", conn)
-        conn.close()
+        users_df = db.execute_read_query("SELECT id, username, role, name, email, phone FROM users", use_pandas=True)
         st.dataframe(users_df)
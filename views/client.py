@@ -1,76 +1,47 @@
 import streamlit as st
 import database as db
-import os
-from pathlib import Path
+import views.components as components
+import utils
+import asset_index
 def show_client_view(user):
-    st.title(f"Catálogo de Produtos - Olá, {user[4]}")
+    st.title(f"Catálogo de Produtos - Olá, {user.name}")
     
-    products = db.get_products()
+    # Filters
+    st.sidebar.header("Filtros")
+    search = st.sidebar.text_input("Buscar")
     
-    if not products.empty:
-        # Filters
-        st.sidebar.header("Filtros")
-        search = st.sidebar.text_input("Buscar")
-        
-        filtered_df = products
-        if search:
-            filtered_df = products[
-                products['name'].str.contains(search, case=False, na=False) |
-                products['brand'].str.contains(search, case=False, na=False) |
-                products['style'].str.contains(search, case=False, na=False) |
-                products['type'].str.contains(search, case=False, na=False) |
-                products['id'].astype(str).str.contains(search, case=False, na=False) |
-                products['price'].astype(str).str.contains(search, case=False, na=False) |
-                products['quantity'].astype(str).str.contains(search, case=False, na=False) |
-                products['expiration_date'].astype(str).str.contains(search, case=False, na=False)
-            ]
-        
-        # Grid Layout
-        # Streamlit doesn't have a native grid, so we loop with columns
-        
-        rows = len(filtered_df)
-        cols_per_row = 3
-        
-        # Reset index for easier looping
-        filtered_df = filtered_df.reset_index(drop=True)
+    def render_card(row):
+        # O store de imagens do banco é a fonte oficial; arquivo legado em
+        # assets/<id>_* só para produtos ainda sem imagem (consulta no índice)
+        media_url = utils.get_image_url(row.image_hash) if row.has_image else None
+        if media_url:
+            # Miniatura já tem o tamanho do card: o navegador busca uma vez e guarda
+            st.image(media_url, use_container_width=True)
+        else:
+            if row.has_image:
+                # Lido do banco só quando o card ainda não está no cache de imagens
+                image_source = lambda: db.get_image(row.image_hash, "thumb")
+            else:
+                image_source = asset_index.find_product_asset(row.id)
+
+            if image_source:
+                processed_img = utils.process_image(image_source, product_id=row.id, image_hash=row.image_hash)
+                if processed_img:
+                    st.image(processed_img, use_container_width=True)
+                else:
+                    st.markdown("*Erro ao carregar imagem*")
+            else:
+                st.markdown("*Sem Imagem*")
+            
+        st.subheader(row.name)
+        st.caption(f"{row.brand} | {row.style} | {row.type}")
+        st.markdown(f"#### R$ {row.price:.2f}")
         
-        # List files in assets to find matches by ID
-        assets_path = Path("assets")
-        assets_files = os.listdir(assets_path) if assets_path.exists() else []
+        if row.quantity > 0:
+            st.success(f"Disponível ({row.quantity})")
+        else:
+            st.error("Esgotado")
 
-        for i in range(0, rows, cols_per_row):
-            cols = st.columns(cols_per_row)
-            for j in range(cols_per_row):
-                if i + j < rows:
-                    row = filtered_df.iloc[i + j]
-                    with cols[j]:
-                        with st.container(border=True):
-                            # Try to find image in assets first (by ID prefix)
-                            image_source = None
-                            for f in assets_files:
-                                if f.startswith(f"{row['id']}_"):
-                                    image_source = str(assets_path / f)
-                                    break
-                            
-                            if not image_source and row['image']:
-                                image_source = row['image']
-                            
-                            if image_source:
-                                processed_img = utils.process_image(image_source)
-                                if processed_img:
-                                    st.image(processed_img, use_container_width=True)
-                                else:
-                                    st.markdown("*Erro ao carregar imagem*")
-                            else:
-                                st.markdown("*Sem Imagem*")
-                                
-                            st.subheader(row['name'])
-                            st.caption(f"{row['brand']} | {row['style']} | {row['type']}")
-                            st.markdown(f"#### R$ {row['price']:.2f}")
-                            
-                            if row['quantity'] > 0:
-                                st.success(f"Disponível ({row['quantity']})")
-                            else:
-                                st.error("Esgotado")
-    else:
-        st.info("Nenhum produto disponível no momento.")
+    # Grid Layout (paginated: only the current page is fetched and rendered)
+    empty_message = "Nenhum produto encontrado." if search else "Nenhum produto disponível no momento."
+    components.render_product_grid("client_grid", render_card, search=search, cols_per_row=3, empty_message=empty_message)
@@ -1,8 +1,54 @@
 import streamlit as st
-import pandas as pd
 import database as db
 import utils
+import exports
 import datetime
+import math
+
+PAGE_SIZE_OPTIONS = [12, 24, 48, 96]
+
+def render_product_grid(key, render_card, search="", cols_per_row=3, empty_message="Nenhum produto encontrado."):
+    """
+    Grade de produtos paginada no banco: só a página atual é buscada e desenhada.
+    render_card(product) desenha o conteúdo de um card (já dentro do container);
+    product é um db.Product.
+    Retorna o total de produtos que atendem à busca.
+    """
+    page_key = f"{key}_page"
+    col_size, col_page, col_info = st.columns([1, 1, 2])
+    page_size = col_size.selectbox("Itens por página", PAGE_SIZE_OPTIONS, index=1, key=f"{key}_page_size")
+
+    # Volta para a primeira página quando a busca ou o tamanho da página mudam
+    state_key = f"{key}_page_filters"
+    if st.session_state.get(state_key) != (search, page_size):
+        st.session_state[state_key] = (search, page_size)
+        st.session_state[page_key] = 1
+
+    page = st.session_state.get(page_key, 1)
+    page_items, total = db.get_products_page(page_size, (page - 1) * page_size, search)
+    n_pages = max(1, math.ceil(total / page_size))
+    if page > n_pages:
+        # Catálogo encolheu (ex.: exclusão): mostra a última página existente
+        page = n_pages
+        st.session_state[page_key] = page
+        page_items, total = db.get_products_page(page_size, (page - 1) * page_size, search)
+
+    col_page.number_input(f"Página (de {n_pages})", min_value=1, max_value=n_pages, step=1, key=page_key)
+
+    if total == 0:
+        st.info(empty_message)
+        return total
+
+    first = (page - 1) * page_size + 1
+    col_info.caption(f"Mostrando {first}–{first + len(page_items) - 1} de {total} produtos")
+
+    for i in range(0, len(page_items), cols_per_row):
+        cols = st.columns(cols_per_row)
+        for col, product in zip(cols, page_items[i:i + cols_per_row]):
+            with col:
+                with st.container(border=True):
+                    render_card(product)
+    return total
 
 def render_product_management():
     st.header("Gerenciamento de Produtos")
@@ -68,15 +114,19 @@ def render_product_management():
         with col_ie1:
             st.write("### Exportar")
             if not products_df_ex.empty:
-                pdf_bytes = utils.generate_pdf(products_df_ex)
-                st.download_button("Baixar PDF", data=pdf_bytes, file_name="produtos.pdf", mime="application/pdf", key="pdf_dl")
+                # O PDF só é gerado no clique (e fica em cache até o catálogo mudar)
+                pdf_images = st.checkbox("Incluir miniaturas no PDF", key="pdf_images")
+                st.download_button("Baixar PDF", data=lambda: exports.catalog_pdf(with_images=pdf_images),
+                                   file_name="produtos.pdf", mime="application/pdf", key="pdf_dl")
                 
-                csv_data = utils.convert_df_to_csv(products_df_ex.drop(columns=['image']).rename(columns={
-                    'name': 'nome', 'brand': 'marca', 'style': 'estilo', 
-                    'type': 'tipo', 'price': 'preco', 'quantity': 'quantidade', 
-                    'expiration_date': 'data_validade'
-                }))
-                st.download_button("Exportar CSV", data=csv_data, file_name="produtos.csv", mime="text/csv", key="csv_dl")
+                # Planilhas também só no clique; XLSX/Parquet aparecem se o pacote estiver instalado
+                export_fmt = st.selectbox("Formato da planilha", exports.available_formats(),
+                                          format_func=lambda f: exports.EXPORT_FORMATS[f]["label"], key="export_fmt")
+                export_spec = exports.EXPORT_FORMATS[export_fmt]
+                st.download_button(f"Exportar {export_spec['label']}", data=lambda: exports.catalog_export(export_fmt),
+                                   file_name=f"produtos.{export_spec['extension']}", mime=export_spec["mime"], key="csv_dl")
+                st.download_button("Exportar CSV com imagens", data=exports.catalog_csv_with_images,
+                                   file_name="produtos_com_imagens.csv", mime="text/csv", key="csv_img_dl")
             else:
                 st.info("Sem dados para exportar.")
 
@@ -86,81 +136,26 @@ def render_product_management():
             if uploaded_csv:
                 if st.button("Processar Importação", key="btn_import"):
                     try:
-                        # Tenta detectar o separador automaticamente
-                        imported_df = pd.read_csv(uploaded_csv, sep=None, engine='python')
-                        
-                        # Validar se as colunas mínimas existem
+                        # Detecta o separador pelo início do arquivo e importa em blocos
+                        # (uma transação por bloco, memória limitada ao tamanho do bloco)
                         # Colunas esperadas: nome, marca, estilo, tipo, preco, quantidade, data_validade
                         # Vamos ser flexíveis, mas 'nome' é essencial
-                        if 'nome' not in imported_df.columns:
-                            st.error("❌ O arquivo CSV deve conter pelo menos a coluna 'nome'.")
-                        else:
-                            success_count = 0
-                            fail_count = 0
-                            error_log = []
-                            
-                            progress_bar = st.progress(0)
-                            total_rows = len(imported_df)
-                            
-                            for index, row in imported_df.iterrows():
-                                try:
-                                    p_name = str(row.get('nome', '')).strip()
-                                    if not p_name:
-                                        raise ValueError("Nome do produto vazio")
-                                    
-                                    p_brand = str(row.get('marca', 'Outra'))
-                                    # Opcional: validar se a marca está na lista permitida, senão usar 'Outra'
-                                    if p_brand not in utils.MARCAS: p_brand = 'Outra'
-                                        
-                                    p_style = str(row.get('estilo', 'Outro'))
-                                    if p_style not in utils.ESTILOS: p_style = 'Outro'
-                                        
-                                    p_type = str(row.get('tipo', 'Outro'))
-                                    if p_type not in utils.TIPOS: p_type = 'Outro'
-                                    
-                                    try:
-                                        p_price = float(row.get('preco', 0))
-                                        if p_price < 0: raise ValueError
-                                    except:
-                                        p_price = 0.0
-                                        
-                                    try:
-                                        p_qty = int(row.get('quantidade', 0))
-                                        if p_qty < 0: raise ValueError
-                                    except:
-                                        p_qty = 0
-                                        
-                                    p_exp = str(row.get('data_validade', ''))
-                                    
-                                    # Tentar obter o ID se existir
-                                    p_id = row.get('id', None)
-                                    if pd.notna(p_id):
-                                        try:
-                                            p_id = int(p_id)
-                                        except:
-                                            p_id = None
-                                    else:
-                                        p_id = None
-                                    
-                                    db.add_product(
-                                        p_name,
-                                        p_brand,
-                                        p_style,
-                                        p_type,
-                                        p_price,
-                                        p_qty,
-                                        p_exp,
-                                        None, # Imagem via CSV não suportada facilmente
-                                        id=p_id
-                                    )
-                                    success_count += 1
-                                    
-                                except Exception as e_row:
-                                    fail_count += 1
-                                    error_log.append(f"Linha {index + 2}: {p_name if 'p_name' in locals() else 'Desconhecido'} - {e_row}")
-                                
-                                # Update progress
-                                progress_bar.progress((index + 1) / total_rows)
+                        progress_bar = st.progress(0.0, text="Importando...")
+                        
+                        def on_chunk(fraction, partial):
+                            progress_bar.progress(fraction, text=f"Importando... {partial['imported']} produtos gravados")
+                        
+                        try:
+                            report = db.import_products_csv(uploaded_csv, progress=on_chunk)
+                        except ValueError as e:
+                            st.error(f"❌ {e}")
+                            report = None
+                        
+                        if report is not None:
+                            progress_bar.progress(1.0, text="Importação concluída")
+                            success_count = report['imported']
+                            fail_count = report['failed']
+                            error_log = report['errors']
                             
                             st.divider()
                             if success_count > 0:
@@ -181,75 +176,55 @@ def render_product_management():
     
     # List/Edit/Delete
     st.subheader("Lista de Produtos")
-    products_df = db.get_products()
     
     # Filters
     filter_text = st.text_input("Buscar Produto", key="search_prod")
-    if not products_df.empty:
-        if filter_text:
-            products_df = products_df[
-                products_df['name'].str.contains(filter_text, case=False, na=False) | 
-                products_df['brand'].str.contains(filter_text, case=False, na=False) |
-                products_df['style'].str.contains(filter_text, case=False, na=False) |
-                products_df['type'].str.contains(filter_text, case=False, na=False) |
-                products_df['id'].astype(str).str.contains(filter_text, case=False, na=False) |
-                products_df['price'].astype(str).str.contains(filter_text, case=False, na=False) |
-                products_df['quantity'].astype(str).str.contains(filter_text, case=False, na=False) |
-                products_df['expiration_date'].astype(str).str.contains(filter_text, case=False, na=False)
-            ]
-        
-        # Grid Layout with Images and Actions
-        cols_per_row = 3
-        rows = len(products_df)
+
+    def render_card(row):
+        # Image
+        img_src = utils.get_product_image_source(row)
+        if img_src:
+            st.image(img_src, use_container_width=True)
+        else:
+            st.markdown("*Sem Imagem*")
+            
+        st.markdown(f"**{row.name}**")
+        st.caption(f"{row.brand} | {row.style}")
+        st.markdown(f"**Preço:** R$ {row.price:.2f}")
+        st.markdown(f"**Validade:** {row.expiration_date}")
+        st.markdown(f"**Estoque:** {row.quantity}")
         
-        for i in range(0, rows, cols_per_row):
-            cols = st.columns(cols_per_row)
-            for j in range(cols_per_row):
-                if i + j < rows:
-                    row = products_df.iloc[i + j]
-                    with cols[j]:
-                        with st.container(border=True):
-                            # Image
-                            img_src = utils.get_product_image_source(row)
-                            if img_src:
-                                st.image(img_src, use_container_width=True)
-                            else:
-                                st.markdown("*Sem Imagem*")
-                                
-                            st.markdown(f"**{row['name']}**")
-                            st.caption(f"{row['brand']} | {row['style']}")
-                            st.markdown(f"**Preço:** R$ {row['price']:.2f}")
-                            st.markdown(f"**Validade:** {row['expiration_date']}")
-                            st.markdown(f"**Estoque:** {row['quantity']}")
-                            
-                            # Actions Expander
-                            with st.expander("Gerenciar"):
-                                # Sale
-                                st.markdown("##### Vender")
-                                if row['quantity'] > 0:
-                                    sell_qty = st.number_input("Qtd", min_value=1, max_value=int(row['quantity']), key=f"sell_qty_{row['id']}")
-                                    if st.button("Vender", key=f"btn_sell_{row['id']}"):
-                                        user_id = st.session_state['user'][0] if 'user' in st.session_state and st.session_state['user'] else None
-                                        success, msg = db.register_sale(int(row['id']), sell_qty, user_id)
-                                        if success:
-                                            st.toast(msg, icon="✅")
-                                            st.rerun()
-                                        else:
-                                            st.toast(msg, icon="❌")
-                                else:
-                                    st.warning("Esgotado")
-                                
-                                st.divider()
-                                
-                                # Edit Trigger (Store ID in session to open modal/form elsewhere or inline)
-                                # Inline editing in a grid is complex. Let's use a dialog or stick to the form below.
-                                # For simplicity and robustness, we can use a button to load the 'Edit Form' at the top or a dialog.
-                                # Streamlit 1.23+ has st.experimental_dialog (now st.dialog). Assuming recent version.
-                                # If not, we fall back to session state loading.
-                                
-                                if st.button("Editar / Excluir", key=f"btn_edit_{row['id']}"):
-                                    st.session_state['edit_prod_id'] = int(row['id'])
-                                    st.rerun()
+        # Actions Expander
+        with st.expander("Gerenciar"):
+            # Sale
+            st.markdown("##### Vender")
+            if row.quantity > 0:
+                sell_qty = st.number_input("Qtd", min_value=1, max_value=row.quantity, key=f"sell_qty_{row.id}")
+                if st.button("Vender", key=f"btn_sell_{row.id}"):
+                    user_id = st.session_state['user'].id if 'user' in st.session_state and st.session_state['user'] else None
+                    success, msg = db.register_sale(row.id, sell_qty, user_id)
+                    if success:
+                        st.toast(msg, icon="✅")
+                        st.rerun()
+                    else:
+                        st.toast(msg, icon="❌")
+            else:
+                st.warning("Esgotado")
+            
+            st.divider()
+            
+            # Edit Trigger (Store ID in session to open modal/form elsewhere or inline)
+            # Inline editing in a grid is complex. Let's use a dialog or stick to the form below.
+            # For simplicity and robustness, we can use a button to load the 'Edit Form' at the top or a dialog.
+            # Streamlit 1.23+ has st.experimental_dialog (now st.dialog). Assuming recent version.
+            # If not, we fall back to session state loading.
+            
+            if st.button("Editar / Excluir", key=f"btn_edit_{row.id}"):
+                st.session_state['edit_prod_id'] = row.id
+                st.rerun()
+
+    # Grid Layout with Images and Actions (one page at a time)
+    render_product_grid("prod_grid", render_card, search=filter_text, cols_per_row=3)
 
     # Edit Modal/Section
     if 'edit_prod_id' in st.session_state:
@@ -257,39 +232,39 @@ def render_product_management():
         action_prod = db.get_product_by_id(prod_id)
         if action_prod:
             with st.form(f"edit_prod_form_{prod_id}"):
-                st.subheader(f"Editando: {action_prod[1]}")
-                e_name = st.text_input("Nome", value=action_prod[1])
+                st.subheader(f"Editando: {action_prod.name}")
+                e_name = st.text_input("Nome", value=action_prod.name)
                 
-                try: b_idx = utils.MARCAS.index(action_prod[2])
+                try: b_idx = utils.MARCAS.index(action_prod.brand)
                 except: b_idx = 0
                 e_brand = st.selectbox("Marca", utils.MARCAS, index=b_idx)
                 
-                try: s_idx = utils.ESTILOS.index(action_prod[3])
+                try: s_idx = utils.ESTILOS.index(action_prod.style)
                 except: s_idx = 0
                 e_style = st.selectbox("Estilo", utils.ESTILOS, index=s_idx)
                 
-                try: t_idx = utils.TIPOS.index(action_prod[4])
+                try: t_idx = utils.TIPOS.index(action_prod.type)
                 except: t_idx = 0
                 e_type = st.selectbox("Tipo", utils.TIPOS, index=t_idx)
                 
-                try: e_price_val = float(action_prod[5])
+                try: e_price_val = float(action_prod.price)
                 except: e_price_val = 0.0
                 if e_price_val < 0.01: e_price_val = 0.01
                 e_price = st.number_input("Preço", value=e_price_val, min_value=0.01)
                 
-                try: e_qty_val = int(action_prod[6])
+                try: e_qty_val = int(action_prod.quantity)
                 except: e_qty_val = 0
                 e_qty = st.number_input("Qtd", value=e_qty_val, min_value=0, step=1)
                 
                 # Safe date parsing
                 default_date = datetime.date.today()
-                if action_prod[7]:
+                if action_prod.expiration_date:
                     try:
-                        default_date = datetime.datetime.strptime(str(action_prod[7]), "%Y-%m-%d").date()
+                        default_date = datetime.datetime.strptime(str(action_prod.expiration_date), "%Y-%m-%d").date()
                     except:
                         try:
                              # Try fallback format if different
-                             default_date = datetime.datetime.strptime(str(action_prod[7]), "%d/%m/%Y").date()
+                             default_date = datetime.datetime.strptime(str(action_prod.expiration_date), "%d/%m/%Y").date()
                         except:
                             pass
                 e_exp_date = st.date_input("Vencimento", value=default_date)
@@ -301,7 +276,8 @@ def render_product_management():
                 with col_save:
                     if st.form_submit_button("Salvar"):
                         try:
-                            img_bytes = action_prod[8]
+                            # None mantém a imagem atual (update_product só grava imagem nova)
+                            img_bytes = None
                             if e_image:
                                 img_bytes = e_image.read()
                             
@@ -5,84 +5,117 @@ import utils
 import datetime
 
 def show_employee_view(user):
-    st.title(f"Painel do Funcionário - {user[4]}")
+    st.title(f"Painel do Funcionário - {user.name}")
     
     # Aniversariantes do Dia
-    birthday_clients = db.get_birthday_clients()
-    if not birthday_clients.empty:
-        today = datetime.date.today()
-        birthdays_today = []
+    # Busca indexada pelo mês-dia; traz só nome/telefone/email
+    today = datetime.date.today()
+    birthdays_today = db.get_birthdays_on(today.month, today.day).to_dict('records')
+    if birthdays_today:
+        st.error(f"🎉 ATENÇÃO: HOJE É ANIVERSÁRIO DE {len(birthdays_today)} CLIENTE(S)!")
+        st.markdown("""
+        <div style="background-color: #ffeebb; padding: 15px; border-radius: 10px; border: 2px solid #ffa500; margin-bottom: 20px;">
+            <h3 style="color: #d35400; margin-top: 0;">🎂 Oportunidade de Venda!</h3>
+            <p style="font-size: 16px;">
+                Lembre-se de enviar uma mensagem parabenizando e <b>sugerindo a compra de um presente especial</b> da loja!
+            </p>
+        </div>
+        """, unsafe_allow_html=True)
         
-        for index, row in birthday_clients.iterrows():
-            try:
-                bdate_str = str(row['birth_date'])
-                bdate = datetime.datetime.strptime(bdate_str, "%Y-%m-%d").date()
-                if bdate.month == today.month and bdate.day == today.day:
-                    birthdays_today.append(row)
-            except:
-                pass
-        
-        if birthdays_today:
-            st.error(f"🎉 ATENÇÃO: HOJE É ANIVERSÁRIO DE {len(birthdays_today)} CLIENTE(S)!")
-            st.markdown("""
-            <div style="background-color: #ffeebb; padding: 15px; border-radius: 10px; border: 2px solid #ffa500; margin-bottom: 20px;">
-                <h3 style="color: #d35400; margin-top: 0;">🎂 Oportunidade de Venda!</h3>
-                <p style="font-size: 16px;">
-                    Lembre-se de enviar uma mensagem parabenizando e <b>sugerindo a compra de um presente especial</b> da loja!
-                </p>
-            </div>
-            """, unsafe_allow_html=True)
-            
-            with st.expander(f"Ver Aniversariantes ({len(birthdays_today)})"):
-                for b_client in birthdays_today:
-                    st.markdown(f"🎈 **{b_client['name']}**")
-                    st.text(f"📞 {b_client['phone'] or 'S/ Tel'} | 📧 {b_client['email'] or 'S/ Email'}")
-                    st.divider()
+        with st.expander(f"Ver Aniversariantes ({len(birthdays_today)})"):
+            for b_client in birthdays_today:
+                st.markdown(f"🎈 **{b_client['name']}**")
+                st.text(f"📞 {b_client['phone'] or 'S/ Tel'} | 📧 {b_client['email'] or 'S/ Email'}")
+                st.divider()
 
     tab1, tab2 = st.tabs(["Vendas (PDV)", "Gerenciar Estoque"])
     
     with tab1:
         st.header("Ponto de Venda")
         
-        products = db.get_products()
-        if not products.empty:
-            product_options = {f"{row['id']} - {row['name']} (Estoque: {row['quantity']})": row['id'] for index, row in products.iterrows() if row['quantity'] > 0}
+        # Carrinho da sessão: várias linhas finalizadas num único pedido
+        if 'cart' not in st.session_state:
+            st.session_state['cart'] = []
+        cart = st.session_state['cart']
+        in_cart = {}
+        for item in cart:
+            in_cart[item['product_id']] = in_cart.get(item['product_id'], 0) + item['quantity']
+        
+        # Só id, nome, preço e estoque dos produtos disponíveis (em cache até o catálogo mudar)
+        product_options = db.get_product_options()
+        if product_options:
+            option = st.selectbox("Selecione o Produto", product_options,
+                                  format_func=lambda p: f"{p.id} - {p.name} (Estoque: {p.quantity})")
+            prod = db.get_product_by_id(option.id)
             
-            if product_options:
-                selected_option = st.selectbox("Selecione o Produto", list(product_options.keys()))
-                selected_id = product_options[selected_option]
-                
-                prod = db.get_product_by_id(selected_id)
-                
+            if prod:
                 col1, col2 = st.columns([1, 2])
                 with col1:
-                    if prod[8]: # image
-                        st.image(prod[8], caption=prod[1], use_container_width=True)
+                    if prod.has_image:
+                        st.image(utils.get_product_image_source(prod, "preview"), caption=prod.name, use_container_width=True)
                     else:
                         st.info("Sem imagem disponível")
                 
                 with col2:
-                    st.write(f"**Produto:** {prod[1]}")
-                    st.write(f"**Preço Unitário:** R$ {prod[5]:.2f}")
-                    
-                    max_qty = int(prod[6])
-                    qty_sell = st.number_input("Quantidade", min_value=1, max_value=max_qty, step=1)
-                    
-                    total = qty_sell * prod[5]
-                    st.write(f"### Total a Pagar: R$ {total:.2f}")
+                    st.write(f"**Produto:** {prod.name}")
+                    st.write(f"**Preço Unitário:** R$ {prod.price:.2f}")
                     
-                    if st.button("Confirmar Venda", type="primary"):
-                        success, msg = db.register_sale(selected_id, qty_sell, user[0])
-                        if success:
-                            st.balloons()
-                            st.success(msg)
+                    # Desconta o que já está no carrinho
+                    max_qty = prod.quantity - in_cart.get(prod.id, 0)
+                    if max_qty > 0:
+                        qty_sell = st.number_input("Quantidade", min_value=1, max_value=max_qty, step=1)
+                        st.write(f"Subtotal: R$ {qty_sell * prod.price:.2f}")
+                        
+                        if st.button("Adicionar ao Carrinho"):
+                            cart.append({'product_id': prod.id, 'name': prod.name, 'unit_price': prod.price, 'quantity': int(qty_sell)})
                             st.rerun()
-                        else:
-                            st.error(msg)
-            else:
-                st.warning("Nenhum produto com estoque disponível.")
+                    else:
+                        st.warning("Todo o estoque deste produto já está no carrinho.")
+        else:
+            st.warning("Nenhum produto com estoque disponível.")
+        
+        st.divider()
+        st.subheader("🛒 Carrinho")
+        if cart:
+            for idx, item in enumerate(cart):
+                col_i1, col_i2, col_i3 = st.columns([3, 1, 1])
+                col_i1.write(f"{item['name']} — {item['quantity']} x R$ {item['unit_price']:.2f}")
+                col_i2.write(f"R$ {item['quantity'] * item['unit_price']:.2f}")
+                if col_i3.button("Remover", key=f"cart_rm_{idx}"):
+                    cart.pop(idx)
+                    st.rerun()
+            
+            total = sum(item['quantity'] * item['unit_price'] for item in cart)
+            st.write(f"### Total a Pagar: R$ {total:.2f}")
+            
+            col_c1, col_c2 = st.columns(2)
+            with col_c1:
+                if st.button("Confirmar Venda", type="primary"):
+                    success, msg, failures = db.checkout(cart, user.id)
+                    if success:
+                        st.session_state['cart'] = []
+                        st.balloons()
+                        st.success(msg)
+                        st.rerun()
+                    else:
+                        st.error(msg)
+                        names = {item['product_id']: item['name'] for item in cart}
+                        for failure in failures:
+                            st.error(f"❌ {names.get(failure['product_id'], failure['product_id'])}: {failure['message']}")
+                        # Preço mudou: o carrinho passa a mostrar o preço atual e o novo total
+                        repriced = {f['product_id']: f['current_price'] for f in failures if 'current_price' in f}
+                        if repriced:
+                            for item in cart:
+                                item['unit_price'] = repriced.get(item['product_id'], item['unit_price'])
+                            new_total = sum(item['quantity'] * item['unit_price'] for item in cart)
+                            st.warning(f"Carrinho atualizado com os preços atuais. Novo total: R$ {new_total:.2f} "
+                                       f"(diferença de R$ {new_total - total:+.2f}). Confirme a venda novamente.")
+            with col_c2:
+                if st.button("Esvaziar Carrinho"):
+                    st.session_state['cart'] = []
+                    st.rerun()
         else:
-            st.warning("Sem produtos cadastrados.")
+            st.info("Carrinho vazio.")
 
     with tab2:
         components.render_product_management()